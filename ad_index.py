@@ -0,0 +1,165 @@
+"""
+Persistent index of ads seen across runs
+
+Every ad the collectors see is recorded under a stable key: the Meta
+library ID, the Google creative ID, or, for ads without one, the perceptual
+hash of its capture. Each row keeps first/last seen times, the query and
+region it was last seen for, and the path of its stored image. The index
+does not pin that image: the store evicts it like any other capture, and
+the row (ID, hash, times) stays to answer "seen before". The
+collectors look ads up here before scrolling to or capturing them, so a
+"new since last run" sweep only pays for ads it has never captured.
+"""
+import time
+import numpy as np
+from settings import cache_path, ProcessWide, ThreadConnections
+from phash import HASH_WORDS, hash_from_hex, hash_to_hex
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ads (
+    ad_key TEXT PRIMARY KEY,
+    platform TEXT NOT NULL,
+    query TEXT NOT NULL,
+    region TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    times_seen INTEGER NOT NULL DEFAULT 1,
+    image_path TEXT,
+    phash TEXT
+);
+CREATE INDEX IF NOT EXISTS ads_platform_phash ON ads (platform, phash);
+"""
+
+
+class AdIndex:
+    """SQLite index of ads keyed on library/creative ID, falling back to perceptual hash"""
+
+    def __init__(self, path=None):
+        self.path = path or cache_path("ad_index.sqlite3")
+        self._db = ThreadConnections(self.path)
+        with self._db() as db:
+            db.executescript(SCHEMA)
+
+    def known(self, ad_keys):
+        """The subset of `ad_keys` that already have a captured image"""
+        ad_keys = [key for key in ad_keys if key]
+        found = set()
+        db = self._db()
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(ad_keys), 500):
+            chunk = ad_keys[start:start + 500]
+            found.update(row[0] for row in db.execute(
+                f"SELECT ad_key FROM ads WHERE image_path IS NOT NULL AND ad_key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ))
+        return found
+
+    def touch(self, ad_keys, query, region):
+        """Mark already indexed ads as seen again, without capturing them"""
+        now = time.time()
+        with self._db() as db:
+            db.executemany(
+                "UPDATE ads SET last_seen = ?, times_seen = times_seen + 1, query = ?, region = ? WHERE ad_key = ?",
+                [(now, query, region, key) for key in ad_keys if key],
+            )
+
+    def record(self, platform, ad_id, path, query, region, value=None):
+        """
+        Index a captured ad; ads without an ID are keyed on their image's perceptual hash
+
+        Args:
+            value: The capture's perceptual hash, as computed by the run's
+                NearDuplicateFilter (None for media that was not hashed)
+
+        Returns:
+            The key the ad was recorded under
+        """
+        phash = hash_to_hex(value) if value is not None else None
+        ad_key = ad_id or (f"{platform}:phash:{phash}" if phash else None)
+        if not ad_key:
+            return None
+
+        now = time.time()
+        with self._db() as db:
+            db.execute(
+                "INSERT INTO ads (ad_key, platform, query, region, first_seen, last_seen, image_path, phash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(ad_key) DO UPDATE SET last_seen = excluded.last_seen, times_seen = times_seen + 1, "
+                "query = excluded.query, region = excluded.region, "
+                "image_path = COALESCE(excluded.image_path, image_path), phash = COALESCE(excluded.phash, phash)",
+                (ad_key, platform, query, region, now, now, path, phash),
+            )
+        return ad_key
+
+    def known_hashes(self, platform):
+        """
+        Perceptual hashes of every indexed capture on a platform
+
+        Returns:
+            (hashes, ad_ids): the hashes as rows of a uint64 array, and each
+            one's ad ID (None for ads that were keyed on their hash). Hashes
+            from an older hash size are left out.
+        """
+        rows = self._db().execute(
+            "SELECT ad_key, phash FROM ads WHERE platform = ? AND phash IS NOT NULL", (platform,)
+        ).fetchall()
+        hashes, ad_ids = [], []
+        for ad_key, phash in rows:
+            value = hash_from_hex(phash)
+            if value is None:
+                continue
+            hashes.append(value)
+            ad_ids.append(None if ad_key.startswith(f"{platform}:phash:") else ad_key)
+        if not hashes:
+            return np.empty((0, HASH_WORDS), dtype=np.uint64), []
+        return np.stack(hashes), ad_ids
+
+    def stats(self):
+        row = self._db().execute("SELECT COUNT(*), COUNT(image_path), MAX(last_seen) FROM ads").fetchone()
+        return {"ads": row[0], "with_image": row[1], "last_seen": row[2]}
+
+
+class IndexedRun:
+    """
+    One collection run's view of the index
+
+    Filters snapshots before capture (touching ads that are already indexed,
+    and skipping them in new-only mode) and records what gets captured.
+    """
+
+    def __init__(self, platform, query, region, new_only=False, index=None):
+        self.index = index or get_ad_index()
+        self.platform = platform
+        self.query = query
+        self.region = region
+        self.new_only = new_only
+        self.skipped = 0
+        self._touched = set()
+
+    def select(self, snapshots):
+        """Snapshots worth capturing; known ads are skipped in new-only mode"""
+        known = self.index.known([snapshot.ad_id for snapshot in snapshots])
+        if known - self._touched:
+            self.index.touch(known - self._touched, self.query, self.region)
+            self._touched |= known
+        if not self.new_only:
+            return list(snapshots)
+        fresh = [snapshot for snapshot in snapshots if snapshot.ad_id not in known]
+        self.skipped += len(snapshots) - len(fresh)
+        return fresh
+
+    def seed(self, dedupe):
+        """In new-only mode, make ads without IDs that were captured before count as duplicates"""
+        if self.new_only and dedupe.enabled:
+            dedupe.seed(*self.index.known_hashes(self.platform))
+
+    def record(self, snapshot, path):
+        try:
+            self.index.record(self.platform, snapshot.ad_id if snapshot else None, path, self.query, self.region,
+                              snapshot.phash if snapshot else None)
+        except Exception as e:
+            print(f"Could not update the ad index: {e}")
+
+
+get_ad_index = ProcessWide(AdIndex)
@@ -0,0 +1,132 @@
+"""
+Finding the ad containers on a results page
+
+Each platform has a list of candidate CSS selectors for its ad containers,
+newest markup first. Instead of waiting on them one after another (a full
+timeout per selector that no longer matches), all candidates are polled
+together in one in-page wait and the first match wins. The winning
+selector is remembered per platform and region in a small SQLite cache and
+tried first next time, with hit/miss counts so markup changes show up as a
+falling hit rate. Adding a fallback selector therefore costs no extra wait.
+"""
+import time
+import sqlite3
+from settings import cache_path, ProcessWide, ThreadConnections
+from readiness import wait_for_any_selector
+
+
+# Candidates in order of preference when nothing is cached yet
+AD_SELECTORS = {
+    "google": [
+        "priority-creative-grid creative-preview",
+    ],
+    "meta": [
+        'div[role="article"]',
+        "div._7jyg",  # Older library cards
+        "div._8nsi",
+    ],
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS winners (
+    platform TEXT NOT NULL,
+    region TEXT NOT NULL,
+    selector TEXT NOT NULL,
+    wins INTEGER NOT NULL DEFAULT 0,
+    last_win REAL NOT NULL,
+    PRIMARY KEY (platform, region, selector)
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class SelectorCache:
+    """Remembers which selector last found ads for each platform and region"""
+
+    def __init__(self, path=None):
+        self.path = path or cache_path("selector_cache.sqlite3")
+        self._db = ThreadConnections(self.path)
+        with self._db() as db:
+            db.executescript(SCHEMA)
+
+    def order(self, platform, region, candidates):
+        """`candidates` with the most recent winner for this platform/region moved to the front"""
+        row = self._db().execute(
+            "SELECT selector FROM winners WHERE platform = ? AND region = ? ORDER BY last_win DESC LIMIT 1",
+            (platform, region.upper()),
+        ).fetchone()
+        if row and row[0] in candidates:
+            return [row[0]] + [selector for selector in candidates if selector != row[0]]
+        return list(candidates)
+
+    def record(self, platform, region, selector, preferred):
+        """
+        Record a race result; a hit means the selector tried first was the one
+        that matched, a miss that another one won, a failure that none did
+        """
+        outcome = "failures" if selector is None else ("hits" if selector == preferred else "misses")
+        with self._db() as db:
+            db.execute(
+                "INSERT INTO counters (name, value) VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                (outcome,),
+            )
+            if selector is not None:
+                db.execute(
+                    "INSERT INTO winners (platform, region, selector, wins, last_win) VALUES (?, ?, ?, 1, ?) "
+                    "ON CONFLICT(platform, region, selector) DO UPDATE SET wins = wins + 1, "
+                    "last_win = excluded.last_win",
+                    (platform, region.upper(), selector, time.time()),
+                )
+
+    def stats(self):
+        db = self._db()
+        counts = dict(db.execute("SELECT name, value FROM counters").fetchall())
+        hits, misses, failures = counts.get("hits", 0), counts.get("misses", 0), counts.get("failures", 0)
+        total = hits + misses + failures
+        winners = db.execute(
+            "SELECT platform, selector, SUM(wins) FROM winners GROUP BY platform, selector ORDER BY 3 DESC"
+        ).fetchall()
+        return {
+            "hits": hits,
+            "misses": misses,
+            "failures": failures,
+            "hit_rate": hits / total if total else 0.0,
+            "winners": [{"platform": p, "selector": s, "wins": w} for p, s, w in winners],
+        }
+
+
+def locate_ads(driver, platform, region, timeout=10, candidates=None, cache=None):
+    """
+    Wait for the first candidate ad selector to match on the current page
+
+    Args:
+        driver: WebDriver showing the results page
+        platform: "google" or "meta"
+        region: Region / country code the search was for
+        timeout: Seconds to wait for any candidate in total
+        candidates: Selectors to race (defaults to AD_SELECTORS[platform])
+
+    Returns:
+        The winning selector, or None if no candidate matched in time
+    """
+    cache = cache or get_selector_cache()
+    candidates = list(candidates or AD_SELECTORS[platform])
+    try:
+        ordered = cache.order(platform, region, candidates)
+    except sqlite3.Error as e:
+        print(f"Could not read the selector cache: {e}")
+        ordered, cache = candidates, None
+    selector = wait_for_any_selector(driver, ordered, timeout)
+    if cache is not None:
+        try:
+            cache.record(platform, region, selector, ordered[0])
+        except sqlite3.Error as e:
+            print(f"Could not update the selector cache: {e}")
+    return selector
+
+
+get_selector_cache = ProcessWide(SelectorCache)
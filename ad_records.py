@@ -0,0 +1,159 @@
+"""
+Structured ad records written to a columnar file next to the screenshots
+
+Each captured ad becomes an AdRecord built from the same DOM snapshot used
+for capture, so nothing is re-scraped or OCR'd. Records are buffered and
+written in batches as Parquet row groups (or Arrow IPC record batches).
+Every run writes its own part file under the records directory, so the
+directory as a whole reads as one dataset and concurrent runs never share a
+file. Without pyarrow, the parts are CSV files instead.
+"""
+import os
+import csv
+import time
+import json
+import itertools
+import importlib.util
+from dataclasses import dataclass, field, fields, astuple
+from settings import CACHE_DIR
+from storage import ContentStore
+
+
+# pyarrow is optional and slow to import, so it is only loaded once records are written
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+RECORDS_DIR = os.environ.get("ADSPY_RECORDS_DIR", os.path.join(CACHE_DIR, "records"))
+RECORDS_FORMAT = os.environ.get("ADSPY_RECORDS_FORMAT", "parquet")  # parquet, arrow or csv
+RECORDS_BATCH_SIZE = 500
+
+_part_numbers = itertools.count()
+
+
+@dataclass(slots=True)
+class AdRecord:
+    """One captured ad; `image_hash` links it to the screenshot in the content store"""
+    platform: str
+    ad_id: str
+    advertiser: str
+    body: str
+    started_running: str
+    platforms: list = field(default_factory=list)
+    query: str = ""
+    region: str = ""
+    image_path: str = ""
+    image_hash: str = ""
+    captured_at: float = 0.0
+
+    @classmethod
+    def from_snapshot(cls, snapshot, path, platform, query, region):
+        return cls(
+            platform=platform,
+            ad_id=snapshot.ad_id or "",
+            advertiser=snapshot.advertiser,
+            body=snapshot.body,
+            started_running=snapshot.started_running,
+            platforms=list(snapshot.platforms),
+            query=query,
+            region=region,
+            image_path=path or "",
+            image_hash=ContentStore.hash_of(path) if path else "",
+            captured_at=time.time(),
+        )
+
+
+FIELD_NAMES = [f.name for f in fields(AdRecord)]
+
+
+def _arrow_schema(pa):
+    return pa.schema([
+        ("platform", pa.string()),
+        ("ad_id", pa.string()),
+        ("advertiser", pa.string()),
+        ("body", pa.string()),
+        ("started_running", pa.string()),
+        ("platforms", pa.list_(pa.string())),
+        ("query", pa.string()),
+        ("region", pa.string()),
+        ("image_path", pa.string()),
+        ("image_hash", pa.string()),
+        ("captured_at", pa.timestamp("ms")),
+    ])
+
+
+class RecordWriter:
+    """
+    Buffers AdRecords and writes them in batches to one part file per run
+
+    Use as a context manager, or call close() to flush the last batch.
+    """
+
+    def __init__(self, platform, directory=RECORDS_DIR, fmt=RECORDS_FORMAT, batch_size=RECORDS_BATCH_SIZE):
+        self.fmt = fmt if HAS_PYARROW else "csv"
+        self.batch_size = batch_size
+        self.count = 0
+        self._buffer = []
+        self._writer = None
+        ext = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}[self.fmt]
+        self.path = os.path.join(directory, platform, f"part-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_part_numbers)}{ext}")
+
+    def add(self, record):
+        self._buffer.append(record)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        if self.fmt == "csv":
+            self._write_csv(batch)
+        else:
+            self._write_arrow(batch)
+        self.count += len(batch)
+
+    def _write_arrow(self, batch):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = _arrow_schema(pa)
+        columns = {name: [getattr(record, name) for record in batch] for name in FIELD_NAMES}
+        columns["captured_at"] = [int(value * 1000) for value in columns["captured_at"]]
+        table = pa.Table.from_pydict(columns, schema=schema)
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if self.fmt == "parquet":
+                self._writer = pq.ParquetWriter(self.path, schema, compression="zstd")
+            else:
+                self._writer = pa.ipc.new_file(self.path, schema)
+        self._writer.write_table(table)
+
+    def _write_csv(self, batch):
+        # The part file is this writer's alone: created with its header on the first batch, appended to after
+        first = self.count == 0
+        if first:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w" if first else "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if first:
+                writer.writerow(FIELD_NAMES)
+            for record in batch:
+                row = list(astuple(record))
+                row[FIELD_NAMES.index("platforms")] = json.dumps(record.platforms)
+                writer.writerow(row)
+
+    def close(self):
+        """Flush buffered records; returns the output path, or None if nothing was written"""
+        try:
+            self.flush()
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        return self.path if self.count else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
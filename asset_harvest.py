@@ -0,0 +1,142 @@
+"""
+Harvest original creative files from network responses
+
+Most creatives reach the browser as plain image or video files. In asset
+mode the collectors do not screenshot the ad containers. They read the URL of
+each container's main image or video in one script call and match it against
+responses seen in the DevTools performance log. The original bytes are then
+pulled with `Network.getResponseBody` and saved to the content store. This
+gives full resolution with no scrolling or rendering per ad. Ads without a
+matching response (e.g. creatives inside cross-origin iframes) are left for
+the screenshot path.
+"""
+import io
+import base64
+from PIL import Image
+from storage import get_store
+
+
+# Response buffer Chrome keeps for getResponseBody
+HARVEST_BUFFER_BYTES = 200 * 1024 * 1024
+# Ignore avatars, icons and spacers
+MIN_ASSET_PIXELS = 120 * 120
+
+MIME_EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "image/avif": ".avif",
+    "image/svg+xml": ".svg",
+    "video/mp4": ".mp4",
+    "video/webm": ".webm",
+}
+
+# Main creative URL per container: a video, else the largest rendered image or background
+ASSET_URLS_JS = """
+var minPixels = arguments[1];
+return arguments[0].map(function (el) {
+  var best = null, bestArea = 0;
+  el.querySelectorAll('video').forEach(function (v) {
+    var src = v.currentSrc || v.src || (v.querySelector('source') || {}).src;
+    if (src && src.indexOf('blob:') !== 0) { best = src; bestArea = Infinity; }
+  });
+  if (best) return best;
+  el.querySelectorAll('img').forEach(function (img) {
+    var area = (img.naturalWidth || img.width) * (img.naturalHeight || img.height);
+    var src = img.currentSrc || img.src;
+    if (src && area >= minPixels && area > bestArea) { best = src; bestArea = area; }
+  });
+  if (best) return best;
+  el.querySelectorAll('[style*="background-image"]').forEach(function (node) {
+    var rect = node.getBoundingClientRect();
+    var match = node.style.backgroundImage.match(/url\\(["']?([^"')]+)["']?\\)/);
+    if (match && rect.width * rect.height >= minPixels && rect.width * rect.height > bestArea) {
+      best = new URL(match[1], location.href).href; bestArea = rect.width * rect.height;
+    }
+  });
+  return best;
+});
+"""
+
+
+class AssetHarvester:
+    """
+    Remembers finished image/video responses and saves the ones that belong
+    to ad containers
+
+    Register `observe` as a NetworkMonitor listener before the page loads.
+    """
+
+    def __init__(self, driver, store=None):
+        self.driver = driver
+        self.store = store or get_store()
+        self.responses = {}   # url -> (request_id, mime type)
+        self.finished = set()
+        self._pending = {}    # request_id -> (url, mime type)
+        self.harvested = 0
+
+    def observe(self, method, params):
+        if method == "Network.responseReceived":
+            response = params.get("response", {})
+            mime = (response.get("mimeType") or "").split(";")[0].lower()
+            if mime in MIME_EXTENSIONS and response.get("status", 200) in (200, 203, 304):
+                self._pending[params["requestId"]] = (response.get("url"), mime)
+        elif method == "Network.loadingFinished" and params.get("requestId") in self._pending:
+            request_id = params["requestId"]
+            url, mime = self._pending.pop(request_id)
+            self.responses[url] = (request_id, mime)
+            self.finished.add(request_id)
+
+    def asset_urls(self, elements):
+        """Main creative URL of each element (None where there is none), in one round trip"""
+        return self.driver.execute_script(ASSET_URLS_JS, list(elements), MIN_ASSET_PIXELS) or []
+
+    def fetch(self, url):
+        """Original bytes and mime type of a recorded response, or (None, None)"""
+        request_id, mime = self.responses.get(url, (None, None))
+        if request_id is None:
+            return None, None
+        try:
+            body = self.driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+        except Exception as e:
+            # Evicted from Chrome's buffer, or a streamed/ranged media response
+            print(f"Response body unavailable for {url[:80]}: {e}")
+            return None, None
+        data = body.get("body", "")
+        data = base64.b64decode(data) if body.get("base64Encoded") else data.encode("utf-8")
+        return data, mime
+
+    def harvest(self, elements, dedupe=None, ad_ids=None):
+        """
+        Save the original creative of each element from the responses seen so far
+
+        `ad_ids` optionally gives each element's ad ID for `dedupe`.
+
+        Yields:
+            (index, path, hash) for every element whose asset was saved, with
+            the image's perceptual hash from `dedupe` (None for other media),
+            and (index, None, None) for near-duplicates skipped via `dedupe`;
+            elements without a usable response are never yielded
+        """
+        if not elements:
+            return
+        urls = self.asset_urls(elements)
+        for i, url in enumerate(urls):
+            if not url:
+                continue
+            data, mime = self.fetch(url)
+            if not data:
+                continue
+            value = None
+            if dedupe is not None and mime.startswith("image/") and mime != "image/svg+xml":
+                try:
+                    [(is_new, value)] = dedupe.check([Image.open(io.BytesIO(data))], [ad_ids[i] if ad_ids else None])
+                    if not is_new:
+                        yield i, None, None
+                        continue
+                except Exception:
+                    pass
+            self.harvested += 1
+            yield i, self.store.put_bytes(data, MIME_EXTENSIONS[mime]), value
@@ -0,0 +1,163 @@
+"""
+Batch capture: one large browser capture cropped into many ad screenshots
+
+Instead of one screenshot round trip per ad, the bounding rects of every
+element are fetched in a single script call, the elements are grouped into
+vertical bands, each band is captured once through the DevTools protocol
+(`captureBeyondViewport`, so content below the fold is rendered too) and the
+ads are cropped from it in memory. Crops are yielded as soon as their band
+is cut, so the caller can hand them to an image_pipeline EncodePipeline and
+encode them while the next band is being captured.
+"""
+import time
+import base64
+from image_pipeline import decode_image
+from tracing import count
+
+
+# Chrome refuses or tiles captures above its texture limit; stay well under it
+MAX_CAPTURE_HEIGHT = 8000
+
+# Document-relative rects for every element in one round trip
+RECTS_JS = """
+var sx = window.scrollX, sy = window.scrollY;
+return arguments[0].map(function (el) {
+  try {
+    var r = el.getBoundingClientRect();
+    return [r.left + sx, r.top + sy, r.width, r.height];
+  } catch (e) {
+    return null;
+  }
+});
+"""
+
+# Load lazy images eagerly and wait for them to decode before the capture
+PRIME_MEDIA_JS = """
+var done = arguments[arguments.length - 1];
+var waits = [];
+arguments[0].forEach(function (el) {
+  el.querySelectorAll('img').forEach(function (img) {
+    if (img.loading === 'lazy') img.loading = 'eager';
+    if (img.decode) waits.push(img.decode().catch(function () {}));
+  });
+});
+var timer = setTimeout(function () { done(false); }, arguments[1]);
+Promise.all(waits).then(function () { clearTimeout(timer); done(true); });
+"""
+
+
+def fetch_rects(driver, elements):
+    """Bounding rects (left, top, width, height) of all elements in document coordinates"""
+    return driver.execute_script(RECTS_JS, list(elements))
+
+
+def group_into_bands(rects, max_height=MAX_CAPTURE_HEIGHT):
+    """
+    Group element indexes into vertical bands that each fit in one capture
+
+    Elements without a usable rect, or taller than a whole band, are left out
+    so the caller can fall back to per-element screenshots for them.
+    """
+    usable = [
+        (i, rect) for i, rect in enumerate(rects)
+        if rect and rect[2] >= 1 and rect[3] >= 1 and rect[3] <= max_height
+    ]
+    usable.sort(key=lambda item: item[1][1])
+
+    bands = []
+    current, band_top = [], None
+    for i, (left, top, width, height) in usable:
+        if current and top + height - band_top > max_height:
+            bands.append(current)
+            current, band_top = [], None
+        if band_top is None:
+            band_top = top
+        current.append(i)
+    if current:
+        bands.append(current)
+    return bands
+
+
+def capture_region(driver, left, top, width, height):
+    """Capture a document region (CSS pixels), including parts outside the viewport"""
+    start = time.perf_counter()
+    result = driver.execute_cdp_cmd("Page.captureScreenshot", {
+        "format": "png",
+        "captureBeyondViewport": True,
+        "clip": {"x": left, "y": top, "width": width, "height": height, "scale": 1},
+    })
+    count("screenshots")
+    count("screenshot_seconds", time.perf_counter() - start)
+    return base64.b64decode(result["data"])
+
+
+def iter_crops(driver, elements, dedupe=None, prime_timeout=5, ad_ids=None):
+    """
+    Crop many elements out of one capture per band instead of one screenshot each
+
+    Args:
+        driver: WebDriver the elements belong to
+        elements: WebElements to capture
+        dedupe: Optional NearDuplicateFilter; near-duplicate crops are dropped
+            before anything is encoded
+        prime_timeout: Seconds to wait for lazy images inside the elements
+        ad_ids: Optional ad ID per element, so `dedupe` never merges two
+            different ads that merely look alike
+
+    Yields:
+        (index, image, hash) with the PIL crop of each element, band by band,
+        and its perceptual hash from `dedupe` (None without one), and
+        (index, None, None) for near-duplicates that were skipped; elements
+        that could not be batch captured are never yielded
+    """
+    if not elements:
+        return
+
+    try:
+        driver.execute_async_script(PRIME_MEDIA_JS, list(elements), int(prime_timeout * 1000))
+    except Exception as e:
+        print(f"Could not prime lazy images before batch capture: {e}")
+
+    rects = fetch_rects(driver, elements)
+    for band in group_into_bands(rects):
+        band_left = min(rects[i][0] for i in band)
+        band_top = min(rects[i][1] for i in band)
+        band_right = max(rects[i][0] + rects[i][2] for i in band)
+        band_bottom = max(rects[i][1] + rects[i][3] for i in band)
+
+        try:
+            image = decode_image(capture_region(driver, band_left, band_top, band_right - band_left,
+                                                band_bottom - band_top))
+        except Exception as e:
+            print(f"Batch capture of {len(band)} ads failed: {e}")
+            continue
+
+        start = time.perf_counter()
+        crops = {}
+        for i in band:
+            left, top, width, height = rects[i]
+            box = (
+                max(0, round(left - band_left)),
+                max(0, round(top - band_top)),
+                min(image.width, round(left - band_left + width)),
+                min(image.height, round(top - band_top + height)),
+            )
+            if box[0] < box[2] and box[1] < box[3]:
+                crops[i] = image.crop(box)
+        count("crops", len(crops))
+        count("crop_seconds", time.perf_counter() - start)
+
+        # Hash the whole band at once and drop creatives we already have
+        hashes = {}
+        if dedupe is not None and crops:
+            keys = [ad_ids[i] for i in crops] if ad_ids else None
+            for i, (is_new, value) in zip(list(crops), dedupe.check(list(crops.values()), keys)):
+                if not is_new:
+                    del crops[i]
+                    yield i, None, None
+                else:
+                    hashes[i] = value
+
+        for i, crop in crops.items():
+            yield i, crop, hashes.get(i)
+
@@ -0,0 +1,407 @@
+"""
+Parallel batch collection across many (platform, query, region) jobs
+
+Jobs run on a pool of worker processes, each with its own warm browser.
+With `tabs_per_browser` above 1, each worker takes a group of jobs and runs
+them as tabs of its browser (see tab_scheduler.py) instead of one by one.
+Screenshots land in the shared content-addressed store, so concurrent
+workers never overwrite each other. Results come back per job with a
+status, the stored image paths and timing. Each returned path carries one
+store reference owned by the caller, who releases it when done (the
+Streamlit session when its gallery is replaced, the CLI once it has
+written its output); references to captures that are not returned are
+given back in the worker.
+"""
+import os
+import re
+import math
+import time
+import shutil
+import signal
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from phash import DEFAULT_THRESHOLD, NearDuplicateFilter, dedupe_paths
+
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_JOB_TIMEOUT = 300
+DEFAULT_RETRIES = 1
+DEFAULT_TABS_PER_BROWSER = int(os.environ.get("ADSPY_TABS_PER_BROWSER", "1"))
+# Time left between a run's own budget and the alarm, so runs return partial results before being killed
+BUDGET_MARGIN = 10
+
+
+class BatchJob:
+    """One collection job: what to search for, where, and how many ads"""
+
+    def __init__(self, platform, query, region, screenshot_count=5):
+        self.platform = platform
+        self.query = query.strip()
+        self.region = region
+        self.screenshot_count = screenshot_count
+
+    @property
+    def job_id(self):
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", self.query).strip("-").lower() or "query"
+        prefix = "google" if self.platform == "Google Ads" else "meta"
+        return f"{prefix}_{self.region}_{slug}"
+
+    def __repr__(self):
+        return f"BatchJob({self.platform!r}, {self.query!r}, {self.region!r}, {self.screenshot_count})"
+
+
+class JobResult:
+    """Outcome of a BatchJob: status is "ok", "empty", "failed" or "timeout" """
+
+    def __init__(self, job, status, image_paths=None, error=None, attempts=1, seconds=0.0, duplicates=0,
+                 cached=False):
+        self.job = job
+        self.status = status
+        self.image_paths = image_paths or []
+        self.error = error
+        self.attempts = attempts
+        self.seconds = seconds
+        # Near-duplicates of ads already returned by an earlier job in the batch
+        self.duplicates = duplicates
+        # Served from the result cache instead of a fresh collection
+        self.cached = cached
+
+    def as_row(self):
+        """Flat dict for tables and CSV export"""
+        return {
+            "platform": self.job.platform,
+            "query": self.job.query,
+            "region": self.job.region,
+            "status": self.status,
+            "ads": len(self.image_paths),
+            "duplicates": self.duplicates,
+            "cached": self.cached,
+            "attempts": self.attempts,
+            "seconds": round(self.seconds, 1),
+            "error": self.error or "",
+        }
+
+
+class JobTimeout(BaseException):
+    """Raised inside a worker when a job overruns; BaseException so collector
+    `except Exception` blocks do not swallow it"""
+
+
+def _on_alarm(signum, frame):
+    raise JobTimeout()
+
+
+def _init_worker():
+    # One browser per worker process is enough, jobs run one at a time there
+    os.environ["ADSPY_DRIVER_POOL_SIZE"] = "1"
+    signal.signal(signal.SIGALRM, _on_alarm)
+
+
+def _export(job, images, output_dir):
+    """Link a job's stored screenshots into `output_dir/<job_id>/` under readable names"""
+    job_dir = os.path.join(output_dir, job.job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    for n, path in enumerate(images):
+        target = os.path.join(job_dir, f"ad_{n + 1:03d}{os.path.splitext(path)[1]}")
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            # Hard links cost no extra disk when the store is on the same filesystem
+            os.link(path, target)
+        except OSError:
+            shutil.copyfile(path, target)
+
+
+def _release(paths):
+    """Give back this worker's store references to captures it does not return"""
+    from storage import get_store
+
+    try:
+        get_store().release_all(paths)
+    except Exception as e:
+        print(f"Could not release {len(paths)} store references: {e}")
+
+
+def _cached_result(job, force_refresh, new_only, capture_mode):
+    """Worker-side: the job's outcome from the result cache, or None"""
+    from result_cache import get_result_cache
+
+    # New-only results depend on the ad index, so the result cache is bypassed both ways
+    if force_refresh or new_only:
+        return None
+    start = time.perf_counter()
+    cache_variant = "assets" if capture_mode == "assets" else ""
+    images = get_result_cache().get(job.platform, job.query, job.region, job.screenshot_count, cache_variant)
+    if not images:
+        return None
+    return "ok", images, None, time.perf_counter() - start, True, False
+
+
+def _job_outcome(job, paths, new_only, seconds, partial=False):
+    """
+    Worker-side: status tuple for a finished collection
+
+    Exporting and caching happen in the parent, once ads earlier jobs
+    already returned are dropped; the last field says whether the
+    result may be cached at all.
+    """
+    # Error reports come back as .txt files; anything else is an image
+    errors = [p for p in paths if p.endswith(".txt")]
+    images = [p for p in paths if not p.endswith(".txt")]
+    error = None
+    if errors:
+        with open(errors[0]) as f:
+            error = f.read()
+        _release(errors)
+
+    # Runs cut short by their time budget are not served as the full answer later
+    cacheable = bool(images and not error and not new_only and not partial)
+    if images:
+        status = "ok"
+    else:
+        status = "failed" if error else "empty"
+    return status, images, error, seconds, False, cacheable
+
+
+def _run_job(job, job_timeout, dedupe_threshold=DEFAULT_THRESHOLD, force_refresh=False, new_only=False,
+             capture_mode="batch"):
+    """Worker-side: run one job and return its status tuple"""
+    from streamlit_scraper import build_search_url, stream_ads
+
+    cached = _cached_result(job, force_refresh, new_only, capture_mode)
+    if cached:
+        return cached
+
+    start = time.perf_counter()
+    events = None
+    signal.alarm(max(1, int(job_timeout)))
+    try:
+        paths, partial = [], False
+        url = build_search_url(job.platform, job.query, job.region)
+        events = stream_ads(url, platform=job.platform, screenshot_count=job.screenshot_count,
+                            capture_mode=capture_mode, dedupe_threshold=dedupe_threshold, new_only=new_only,
+                            budget=max(job_timeout / 2, job_timeout - BUDGET_MARGIN))
+        for event in events:
+            if event.path:
+                paths.append(event.path)
+            if event.kind == "done":
+                partial = (event.summary or {}).get("status") == "partial"
+    except JobTimeout:
+        _release(paths)
+        return "timeout", [], f"Timed out after {job_timeout}s", time.perf_counter() - start, False, False
+    except Exception as e:
+        _release(paths)
+        return "failed", [], str(e), time.perf_counter() - start, False, False
+    finally:
+        signal.alarm(0)
+        # Hand the browser back now, not whenever the generator is collected
+        if events is not None:
+            events.close()
+    return _job_outcome(job, paths, new_only, time.perf_counter() - start, partial)
+
+
+def _run_tab_group(jobs, job_timeout, dedupe_threshold=DEFAULT_THRESHOLD, force_refresh=False, new_only=False,
+                   capture_mode="batch", max_tabs=DEFAULT_TABS_PER_BROWSER):
+    """
+    Worker-side: run a group of jobs as tabs of one browser
+
+    The whole group gets `job_timeout` per round of `max_tabs` jobs; jobs
+    still open when it runs out time out, finished ones keep their results.
+
+    Returns:
+        One status tuple per job, as _run_job returns, in the same order
+    """
+    from streamlit_scraper import setup_driver
+    from driver_pool import get_driver_pool
+    from tab_scheduler import TabScheduler
+    from browser_watchdog import get_watchdog
+
+    outcomes = [_cached_result(job, force_refresh, new_only, capture_mode) for job in jobs]
+    todo = [i for i, outcome in enumerate(outcomes) if outcome is None]
+    if not todo:
+        return outcomes
+    positions = {id(jobs[i]): i for i in todo}
+    paths = {i: [] for i in todo}
+    start = time.perf_counter()
+    pool = get_driver_pool(setup_driver)
+    pooled = None
+    events = None
+    failed = False
+    error = None
+
+    signal.alarm(max(1, int(job_timeout * math.ceil(len(todo) / max(1, max_tabs)))))
+    try:
+        pooled = pool.checkout()
+        get_watchdog().watch(pooled.driver)
+        scheduler = TabScheduler(pooled.driver, max_tabs=max_tabs)
+        events = scheduler.run([jobs[i] for i in todo], capture_mode, dedupe_threshold, new_only,
+                               budget=max(job_timeout / 2, job_timeout - BUDGET_MARGIN))
+        for job, event in events:
+            i = positions[id(job)]
+            if event.path:
+                paths[i].append(event.path)
+            if event.kind == "done":
+                summary = event.summary or {}
+                seconds = summary.get("seconds", time.perf_counter() - start)
+                outcomes[i] = _job_outcome(job, paths[i], new_only, seconds, summary.get("status") == "partial")
+    except JobTimeout:
+        failed = True
+        error = ("timeout", f"Timed out after {job_timeout}s per {max_tabs} tabs")
+    except Exception as e:
+        failed = True
+        error = ("failed", str(e))
+    finally:
+        signal.alarm(0)
+        if events is not None:
+            events.close()
+        if pooled is not None:
+            get_watchdog().unwatch(pooled.driver)
+            pool.checkin(pooled, discard=failed)
+
+    for i in todo:
+        if outcomes[i] is None:
+            # Ads a cut-off tab already yielded are not returned, so nobody else would release them
+            _release(paths[i])
+            status, message = error or ("failed", "Tab run ended early")
+            outcomes[i] = status, [], message, time.perf_counter() - start, False, False
+    return outcomes
+
+
+def _store_result(result, output_dir, capture_mode, cacheable):
+    """Parent-side: export a finished job's ads and cache them if the worker says they may be"""
+    from result_cache import get_result_cache
+
+    job = result.job
+    if output_dir and result.image_paths:
+        _export(job, result.image_paths, output_dir)
+    # A result trimmed by cross-job dedupe is not the job's full answer on its own
+    if cacheable and result.image_paths and not result.duplicates:
+        cache_variant = "assets" if capture_mode == "assets" else ""
+        get_result_cache().put(job.platform, job.query, job.region, job.screenshot_count, result.image_paths,
+                               cache_variant)
+
+
+def run_batch(jobs, max_workers=DEFAULT_WORKERS, job_timeout=DEFAULT_JOB_TIMEOUT, retries=DEFAULT_RETRIES,
+              output_dir=None, on_result=None, dedupe_threshold=DEFAULT_THRESHOLD, force_refresh=False,
+              new_only=False, capture_mode="batch", tabs_per_browser=DEFAULT_TABS_PER_BROWSER):
+    """
+    Run many collection jobs in parallel on a process pool of browsers
+
+    Args:
+        jobs: Iterable of BatchJob
+        max_workers: Concurrency cap (number of browser processes)
+        job_timeout: Seconds a single attempt may run before it is abandoned; the
+            collection itself gets a slightly smaller time budget, so it
+            returns the ads it has before that happens
+        retries: Extra attempts for jobs that fail or time out
+        output_dir: Optional folder to export per-job screenshot folders to,
+            holding only the ads left after cross-job deduplication
+        on_result: Optional callback(JobResult, done_count, total) for progress;
+            the result already has ads returned by earlier finished jobs removed
+        dedupe_threshold: Perceptual-hash distance under which an ad counts as
+            a near-duplicate, both within a job and across the whole batch;
+            -1 disables deduplication
+        force_refresh: Re-collect every job even if the result cache has it
+        new_only: Only capture ads the ad index has not seen in earlier runs
+        capture_mode: "batch", "element" or "assets", see collect_ads
+        tabs_per_browser: Jobs each browser runs at once as tabs; above 1,
+            jobs are handed to workers in groups and retried one by one
+
+    Returns:
+        List of JobResult, in the same order as `jobs`
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    workers = max(1, min(max_workers, len(jobs)))
+    results = [None] * len(jobs)
+    attempts = [0] * len(jobs)
+    cross_job = _CrossJobDedupe(dedupe_threshold)
+
+    # Spawn, not fork: a forked worker would inherit the parent's pooled browsers
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as executor:
+        def submit(index):
+            attempts[index] += 1
+            return executor.submit(_run_job, jobs[index], job_timeout, dedupe_threshold, force_refresh, new_only,
+                                   capture_mode)
+
+        def submit_group(indexes):
+            for index in indexes:
+                attempts[index] += 1
+            return executor.submit(_run_tab_group, [jobs[i] for i in indexes], job_timeout, dedupe_threshold,
+                                   force_refresh, new_only, capture_mode, tabs_per_browser)
+
+        # pending maps each future to the job indexes it runs; single jobs return one outcome
+        if tabs_per_browser > 1:
+            # Enough jobs per group to keep the tabs busy, small enough to spread over all workers
+            group_size = max(1, min(tabs_per_browser * 4, math.ceil(len(jobs) / workers)))
+            groups = [list(range(i, min(i + group_size, len(jobs)))) for i in range(0, len(jobs), group_size)]
+            pending = {submit_group(indexes): indexes for indexes in groups}
+        else:
+            pending = {submit(i): [i] for i in range(len(jobs))}
+        done_count = 0
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                indexes = pending.pop(future)
+                try:
+                    outcomes = future.result()
+                except Exception as e:
+                    # The worker process itself died (e.g. killed by the OOM killer)
+                    outcomes = [("failed", [], f"Worker crashed: {e}", 0.0, False, False)] * len(indexes)
+                if isinstance(outcomes, tuple):
+                    outcomes = [outcomes]
+
+                for index, (status, paths, error, seconds, cached, cacheable) in zip(indexes, outcomes):
+                    if status in ("failed", "timeout") and attempts[index] <= retries:
+                        print(f"Retrying {jobs[index].job_id} after {status}: {error}")
+                        try:
+                            pending[submit(index)] = [index]
+                            continue
+                        except BrokenProcessPool as e:
+                            error = f"{error}; retry impossible: {e}"
+
+                    results[index] = JobResult(jobs[index], status, paths, error, attempts[index], seconds,
+                                               cached=cached)
+                    # Drop ads earlier jobs already returned before anything is written for this one
+                    cross_job.apply(results[index])
+                    _store_result(results[index], output_dir, capture_mode, cacheable)
+                    done_count += 1
+                    if on_result:
+                        on_result(results[index], done_count, len(jobs))
+
+    if cross_job.dropped:
+        print(f"Dropped {cross_job.dropped} near-duplicate ads across batch jobs")
+    return results
+
+
+class _CrossJobDedupe:
+    """
+    Drops ads an earlier finished job already returned, e.g. the same creative
+    running in several regions; applied to each result as it comes in, so
+    progress callbacks report the counts the batch ends up with
+    """
+
+    def __init__(self, threshold):
+        self.dedupe = NearDuplicateFilter(threshold)
+        self.seen = set()
+        self.dropped = 0
+
+    def apply(self, result):
+        if not self.dedupe.enabled:
+            return
+        # Identical creatives share one store path, so hash each path only once
+        fresh = [path for path in dict.fromkeys(result.image_paths) if path not in self.seen]
+        self.seen.update(fresh)
+        kept, _ = dedupe_paths(fresh, dedupe=self.dedupe)
+        dropped = Counter(result.image_paths)
+        dropped.subtract(kept)
+        dropped = list(dropped.elements())
+        # The caller only ever sees the kept paths, so nobody else would release these
+        _release(dropped)
+        result.duplicates += len(dropped)
+        self.dropped += len(dropped)
+        result.image_paths = kept
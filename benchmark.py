@@ -0,0 +1,426 @@
+"""
+Offline benchmark against local fixture pages
+
+    python benchmark.py --ads 60 --count 20 --latency 150 --image-size 300x250 --repeat 3 -o bench.json
+    python benchmark.py --compare bench-before.json
+
+A built-in HTTP server serves two fixtures: a Google Ads Transparency
+Center grid (`priority-creative-grid creative-preview`) and a Meta Ads
+Library feed whose `div[role="article"]` (or `_7jyg` / `_8nsi`) cards load
+a page at a time as the window is scrolled. Feed pages and images are
+delayed by the lazy-load latency, and every image is distinct so
+near-duplicate filtering does not shortcut the run. The collectors run
+against the fixtures through stream_ads (collect_ads without the list, so
+each ad can be timed as it lands) and the results are written as JSON:
+ads/sec, p50/p95 seconds per ad, peak RSS of this process and of the
+browser processes, and WebDriver round trips per run.
+
+Runs use a throwaway cache dir unless --cache-dir is given, so the store,
+ad index and result cache of real collections are left alone.
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform as host_platform
+import tempfile
+import threading
+import subprocess
+from functools import lru_cache
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from webdriver_metrics import descendant_pids, rss_bytes
+
+
+PLATFORMS = {"google": "Google Ads", "meta": "Meta Ads"}
+META_VARIANTS = {
+    "article": 'role="article" class="card"',
+    "7jyg": 'class="_7jyg card"',
+    "8nsi": 'class="_8nsi card"',
+}
+
+PAGE_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>%(title)s</title>
+<style>
+body { margin: 0; font-family: sans-serif; background: #f0f2f5; }
+.card { display: block; margin: 12px; padding: 12px; background: #fff; border-radius: 8px; width: %(card_width)dpx; }
+.card img { display: block; width: %(width)dpx; height: %(height)dpx; }
+.feed { display: flex; flex-wrap: wrap; }
+</style></head>
+<body>
+<h1>%(title)s</h1>
+%(open_tag)s%(cards)s%(close_tag)s
+<script>
+(function () {
+  var total = %(ads)d, pageSize = %(page_size)d;
+  var feed = document.querySelector('.feed');
+  var loading = false;
+  function more() {
+    var loaded = feed.children.length;
+    if (loading || loaded >= total) return;
+    loading = true;
+    fetch('/fragment/%(platform)s?start=' + loaded + '&n=' + Math.min(pageSize, total - loaded))
+      .then(function (r) { return r.text(); })
+      .then(function (html) { feed.insertAdjacentHTML('beforeend', html); loading = false; });
+  }
+  window.addEventListener('scroll', function () {
+    if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 1200) more();
+  });
+})();
+</script>
+</body></html>
+"""
+
+GOOGLE_CARD = """<creative-preview class="card">
+<a href="/advertiser/AR0000000%(i)d/creative/CR%(i)010d"><img loading="lazy" src="/img/%(i)d.jpg?w=%(width)d&h=%(height)d"></a>
+<div class="advertiser-name">Benchmark Advertiser %(i)d</div>
+<div>Search</div>
+</creative-preview>
+"""
+
+META_CARD = """<div %(marker)s>
+<div>Active</div>
+<div>Library ID: %(library_id)d</div>
+<div>Started running on 1 Jan 2026</div>
+<span aria-label="Facebook"></span><span aria-label="Instagram"></span>
+<div>Benchmark Advertiser %(i)d</div>
+<div>Sponsored</div>
+<div>Body copy for benchmark ad %(i)d. Shop the new collection today.</div>
+<img loading="lazy" src="/img/%(i)d.jpg?w=%(width)d&h=%(height)d">
+</div>
+"""
+
+
+@lru_cache(maxsize=1024)
+def fixture_image(seed, width, height):
+    """A distinct blocky JPEG per seed, so perceptual hashes differ between ads"""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, (max(1, height // 16), max(1, width // 16), 3), dtype=np.uint8)
+    image = Image.fromarray(blocks).resize((width, height), Image.NEAREST)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+class FixtureServer:
+    """Serves the Google and Meta fixture pages on a local port"""
+
+    def __init__(self, ads=50, page_size=10, latency_ms=100, image_size=(300, 250), meta_variant="article"):
+        self.ads = ads
+        self.page_size = page_size
+        self.latency = latency_ms / 1000
+        self.width, self.height = image_size
+        self.meta_variant = meta_variant
+        self.requests = 0
+        self._server = None
+
+    def start(self):
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fixture.requests += 1
+                fixture.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="adspy-bench-http", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def url(self, platform):
+        """Search URL in the shape build_search_url makes, so search_terms() reads it back"""
+        if platform == "google":
+            return f"{self.base_url}/google?region=US&domain=bench.example"
+        return f"{self.base_url}/meta?country=US&q=bench&active_status=active"
+
+    def cards(self, platform, start, n):
+        template = GOOGLE_CARD if platform == "google" else META_CARD
+        return "".join(template % {
+            "i": i,
+            "library_id": 100000000 + i,
+            "marker": META_VARIANTS[self.meta_variant],
+            "width": self.width,
+            "height": self.height,
+        } for i in range(start, min(start + n, self.ads)))
+
+    def page(self, platform):
+        if platform == "google":
+            open_tag, close_tag = '<priority-creative-grid class="feed">', "</priority-creative-grid>"
+        else:
+            open_tag, close_tag = '<div class="feed">', "</div>"
+        return PAGE_HTML % {
+            "title": "Ads Transparency Center" if platform == "google" else "Ad Library",
+            "platform": platform,
+            "open_tag": open_tag,
+            "close_tag": close_tag,
+            "cards": self.cards(platform, 0, self.page_size),
+            "ads": self.ads,
+            "page_size": self.page_size,
+            "width": self.width,
+            "height": self.height,
+            "card_width": self.width + 24,
+        }
+
+    def handle(self, request):
+        url = urlparse(request.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = url.path.strip("/").split("/")
+        if parts[0] in PLATFORMS:
+            self._send(request, self.page(parts[0]).encode("utf-8"), "text/html; charset=utf-8")
+        elif parts[0] == "fragment" and len(parts) == 2 and parts[1] in PLATFORMS:
+            time.sleep(self.latency)
+            html = self.cards(parts[1], int(params.get("start", 0)), int(params.get("n", self.page_size)))
+            self._send(request, html.encode("utf-8"), "text/html; charset=utf-8")
+        elif parts[0] == "img" and len(parts) == 2:
+            time.sleep(self.latency)
+            seed = int(parts[1].split(".")[0])
+            data = fixture_image(seed, int(params.get("w", self.width)), int(params.get("h", self.height)))
+            self._send(request, data, "image/jpeg")
+        else:
+            request.send_error(404)
+
+    @staticmethod
+    def _send(request, body, content_type):
+        request.send_response(200)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(body)))
+        request.send_header("Cache-Control", "no-store")
+        request.end_headers()
+        request.wfile.write(body)
+
+
+class RssSampler:
+    """Peak RSS of this process and of its child processes (chromedriver, Chrome); Linux only"""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.supported = os.path.isdir("/proc/self")
+        self.peak_self = 0
+        self.peak_children = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        self.peak_self = max(self.peak_self, rss_bytes(os.getpid()))
+        self.peak_children = max(self.peak_children, sum(rss_bytes(pid) for pid in descendant_pids(os.getpid())))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        if self.supported:
+            self.sample()
+            self._thread = threading.Thread(target=self._run, name="adspy-bench-rss", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self.sample()
+        return self
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile (q in 0-100); None for no values"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def _mb(value):
+    return round(value / 1024 ** 2, 1) if value else None
+
+
+def run_once(stream_ads, url, platform, count, capture_mode, dedupe_threshold):
+    """One collection against a fixture; latency per ad is the gap since the previous ad (or the start)"""
+    sampler = RssSampler().start()
+    start = last = time.perf_counter()
+    latencies, summary, fallbacks = [], None, 0
+    for event in stream_ads(url, platform=PLATFORMS[platform], screenshot_count=count,
+                            capture_mode=capture_mode, dedupe_threshold=dedupe_threshold):
+        now = time.perf_counter()
+        if event.kind == "ad":
+            latencies.append(now - last)
+            last = now
+        elif event.kind == "fallback":
+            fallbacks += 1
+        elif event.kind == "done":
+            summary = event.summary or {}
+    seconds = time.perf_counter() - start
+    sampler.stop()
+    return {
+        "ads": len(latencies),
+        "fallbacks": fallbacks,
+        "seconds": round(seconds, 3),
+        "ads_per_sec": round(len(latencies) / seconds, 3) if seconds else None,
+        "p50_ad_seconds": round(percentile(latencies, 50), 3) if latencies else None,
+        "p95_ad_seconds": round(percentile(latencies, 95), 3) if latencies else None,
+        "round_trips": summary.get("round_trips"),
+        "screenshots": summary.get("screenshots"),
+        # Only new content counts, so warm runs over the same fixtures write little
+        "bytes_written": summary.get("bytes_written"),
+        "peak_rss_mb": _mb(sampler.peak_self),
+        "browser_peak_rss_mb": _mb(sampler.peak_children),
+        "phases": summary.get("phases", {}),
+    }
+
+
+def summarize(runs):
+    """Medians over the warm runs (the first run also boots the browser, unless it is the only one)"""
+    warm = runs[1:] or runs
+
+    def median(key):
+        values = [run[key] for run in warm if run[key] is not None]
+        return round(percentile(values, 50), 3) if values else None
+
+    return {key: median(key) for key in ("ads_per_sec", "p50_ad_seconds", "p95_ad_seconds", "round_trips",
+                                         "peak_rss_mb", "browser_peak_rss_mb", "seconds")}
+
+
+def git_version():
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here, capture_output=True,
+                                text=True, timeout=10).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=here,
+                                    capture_output=True, text=True, timeout=10).stdout.strip())
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return f"{commit}-dirty" if commit and dirty else commit or None
+
+
+# Metric -> True when higher is better
+COMPARED_METRICS = {"ads_per_sec": True, "p95_ad_seconds": False, "round_trips": False, "browser_peak_rss_mb": False}
+
+
+def compare(baseline, results, tolerance):
+    """Print metric changes against a baseline results file; returns the number of regressions"""
+    regressions = 0
+    for name, scenario in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        print(f"{name} vs {baseline.get('version') or 'baseline'}:")
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = before["summary"].get(metric), scenario["summary"].get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change < -tolerance if higher_is_better else change > tolerance
+            regressions += worse
+            print(f"  {metric:20} {old:>10} -> {new:<10} {change:+.0%}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the collectors against local fixture pages")
+    parser.add_argument("--platforms", default="google,meta", help="Comma separated: google, meta")
+    parser.add_argument("--ads", type=int, default=60, help="Ads available in each fixture feed")
+    parser.add_argument("--count", type=int, default=20, help="Ads to collect per run")
+    parser.add_argument("--page-size", type=int, default=10, help="Ads per lazily loaded feed page")
+    parser.add_argument("--latency", type=float, default=100, help="Lazy-load latency for feed pages and images (ms)")
+    parser.add_argument("--image-size", default="300x250", help="Creative size, WIDTHxHEIGHT")
+    parser.add_argument("--meta-variant", choices=sorted(META_VARIANTS), default="article",
+                        help="Which Meta card markup the feed uses")
+    parser.add_argument("--capture-mode", choices=["batch", "element", "assets"], default="batch")
+    parser.add_argument("--capture-format", choices=["png", "webp", "jpeg"],
+                        help="Stored image format (default: ADSPY_CAPTURE_FORMAT or webp)")
+    parser.add_argument("--capture-quality", type=int, help="Quality for webp/jpeg captures")
+    parser.add_argument("--dedupe-threshold", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per platform; the first one is a cold start")
+    parser.add_argument("--cache-dir", help="Cache dir for the runs (default: a temporary one)")
+    parser.add_argument("-o", "--output", default="benchmark-results.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="Results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative regression for --compare")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    width, height = (int(value) for value in args.image_size.lower().split("x"))
+    platforms = [p.strip() for p in args.platforms.split(",") if p.strip() in PLATFORMS]
+
+    # The cache dir is read at import time, so set it before importing the collectors
+    cache_dir = args.cache_dir or tempfile.mkdtemp(prefix="adspy-bench-")
+    os.environ["ADSPY_CACHE_DIR"] = cache_dir
+    os.environ.setdefault("ADSPY_DRIVER_POOL_SIZE", "1")
+    if args.capture_format:
+        os.environ["ADSPY_CAPTURE_FORMAT"] = args.capture_format
+    if args.capture_quality:
+        os.environ["ADSPY_CAPTURE_QUALITY"] = str(args.capture_quality)
+    from streamlit_scraper import stream_ads
+    from phash import DEFAULT_THRESHOLD
+    from driver_pool import close_all_pools
+    from image_pipeline import CAPTURE_FORMAT, CAPTURE_QUALITY
+
+    config = {
+        "ads": args.ads, "count": args.count, "page_size": args.page_size, "latency_ms": args.latency,
+        "image_size": [width, height], "meta_variant": args.meta_variant, "capture_mode": args.capture_mode,
+        "capture_format": CAPTURE_FORMAT, "capture_quality": CAPTURE_QUALITY, "repeat": args.repeat,
+    }
+    results = {
+        "version": git_version(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "host": host_platform.platform(),
+        "config": config,
+        "scenarios": {},
+    }
+    dedupe_threshold = DEFAULT_THRESHOLD if args.dedupe_threshold is None else args.dedupe_threshold
+    server = FixtureServer(args.ads, args.page_size, args.latency, (width, height), args.meta_variant).start()
+    try:
+        for platform in platforms:
+            runs = []
+            for i in range(args.repeat):
+                run = run_once(stream_ads, server.url(platform), platform, args.count, args.capture_mode,
+                               dedupe_threshold)
+                runs.append(run)
+                print(f"{platform} run {i + 1}/{args.repeat}: {run['ads']} ads in {run['seconds']} s, "
+                      f"{run['ads_per_sec']} ads/s, p95 {run['p95_ad_seconds']} s/ad, "
+                      f"{run['round_trips']} WebDriver calls")
+            results["scenarios"][platform] = {"url": server.url(platform), "summary": summarize(runs), "runs": runs}
+    finally:
+        server.stop()
+        close_all_pools()
+        if not args.cache_dir:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if compare(baseline, results, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Watchdog for hung, crashed and oversized browsers
+
+A WebDriver call blocks until ChromeDriver answers, and a renderer that
+stops responding can keep it waiting far past any timeout the page was
+given, with the driver checked out and Chrome's memory still growing.
+Collectors register their driver for the length of a run; a daemon thread
+checks every few seconds that no WebDriver command has been waiting longer
+than HANG_TIMEOUT, that a run past its deadline is not stuck in a command,
+and that the browser's resident memory is under KILL_MEMORY_MB. A browser
+failing a check is killed (chromedriver and every Chrome process under
+it): the blocked call fails, the collector ends the run with what it has,
+and the pool discards the driver and launches a fresh one on the next
+checkout.
+
+A crashed tab shows up as a WebDriver error instead; is_renderer_crash()
+recognises those so the collectors can report them and skip the fallback
+screenshot, and the pool replaces that driver the same way.
+"""
+import os
+import time
+import signal
+import threading
+from settings import ProcessWide
+from tracing import count
+from webdriver_metrics import browser_rss, command_age, descendant_pids, driver_pid
+
+
+# Longer than the page-load and script timeouts, so only genuinely stuck calls trip it
+HANG_TIMEOUT = float(os.environ.get("ADSPY_HANG_TIMEOUT", "90"))
+KILL_MEMORY_MB = float(os.environ.get("ADSPY_BROWSER_KILL_MB", "3072"))
+# How long a run that is out of time may stay blocked in one command
+DEADLINE_GRACE = 15
+CHECK_INTERVAL = 2
+
+CRASH_MARKERS = ("tab crashed", "page crash", "target crashed", "not connected to devtools", "chrome not reachable")
+
+
+def is_renderer_crash(error):
+    """Whether a WebDriver error means the tab or browser behind the driver is gone"""
+    message = str(getattr(error, "msg", None) or error).lower()
+    return any(marker in message for marker in CRASH_MARKERS)
+
+
+def kill_browser(driver):
+    """SIGKILL chromedriver and every Chrome process under it; returns False if they are not ours to kill"""
+    pid = driver_pid(driver)
+    if not pid:
+        return False
+    # Children first: once chromedriver is gone they are reparented and can no longer be found
+    for target in descendant_pids(pid) + [pid]:
+        try:
+            os.kill(target, getattr(signal, "SIGKILL", signal.SIGTERM))
+        except OSError:
+            pass
+    return True
+
+
+class BrowserWatchdog:
+    """Kills the browsers of runs that have hung, overrun their deadline or outgrown the memory cap"""
+
+    def __init__(self, hang_timeout=HANG_TIMEOUT, max_memory_mb=KILL_MEMORY_MB, interval=CHECK_INTERVAL):
+        self.hang_timeout = hang_timeout
+        self.max_memory_mb = max_memory_mb
+        self.interval = interval
+        self.kills = {"hung": 0, "deadline": 0, "memory": 0}
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, driver, deadline=None):
+        """Start watching `driver`, and the run's Deadline if given, until unwatch()"""
+        with self._lock:
+            self._watched[id(driver)] = (driver, deadline)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="adspy-watchdog", daemon=True)
+                self._thread.start()
+
+    def unwatch(self, driver):
+        with self._lock:
+            self._watched.pop(id(driver), None)
+
+    def check(self):
+        """Check every watched browser once, killing the ones that fail; returns the kill reasons"""
+        with self._lock:
+            watched = list(self._watched.items())
+        reasons = []
+        for key, entry in watched:
+            driver, deadline = entry
+            verdict = self._verdict(driver, deadline)
+            if verdict is None:
+                continue
+            reason, detail = verdict
+            with self._lock:
+                # The run may have ended (and the browser gone back to the pool, or to a new
+                # run) while the verdict was computed; only kill what is still the same watch
+                if self._watched.get(key) is not entry:
+                    continue
+                del self._watched[key]
+            if not kill_browser(driver):
+                print(f"Watchdog: browser {detail}, but its processes are not ours to kill")
+                continue
+            print(f"Watchdog: killed browser, {detail}")
+            count("browser_kills")
+            with self._lock:
+                self.kills[reason] += 1
+            reasons.append(reason)
+        return reasons
+
+    def stats(self):
+        with self._lock:
+            return dict(self.kills, watched=len(self._watched))
+
+    def _verdict(self, driver, deadline):
+        age = command_age(driver)
+        if age > self.hang_timeout:
+            return "hung", f"a WebDriver command has been waiting {age:.0f}s"
+        if deadline is not None and deadline.budget is not None and deadline.remaining() <= 0 \
+                and age > DEADLINE_GRACE:
+            return "deadline", f"run is out of time and stuck in a command for {age:.0f}s"
+        if self.max_memory_mb:
+            rss_mb = browser_rss(driver) / 1024 ** 2
+            if rss_mb > self.max_memory_mb:
+                return "memory", f"using {rss_mb:.0f} MB (cap {self.max_memory_mb:.0f} MB)"
+        return None
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Watchdog check failed: {e}")
+
+
+get_watchdog = ProcessWide(BrowserWatchdog)
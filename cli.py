@@ -0,0 +1,158 @@
+"""
+Command line collection for cron jobs and batch pipelines
+
+    python cli.py nike.com adidas.com --platform google --regions US,UK --count 10 -o out/
+
+Only the standard library is imported until the arguments have been parsed;
+the collectors (selenium, PIL, numpy) are imported by the worker processes
+that need them, and Streamlit is never imported. `--profile-imports` prints
+where startup time goes.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import builtins
+
+_STARTED = time.perf_counter()
+
+PLATFORMS = {"google": "Google Ads", "meta": "Meta Ads"}
+
+
+class ImportProfiler:
+    """Times every first-time import made after install(), cumulative including children"""
+
+    def __init__(self):
+        self.timings = []  # (module, seconds, nesting depth)
+        self._original = builtins.__import__
+        self._depth = 0
+
+    def install(self):
+        builtins.__import__ = self._import
+        return self
+
+    def uninstall(self):
+        builtins.__import__ = self._original
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+        start = time.perf_counter()
+        self._depth += 1
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            self._depth -= 1
+            self.timings.append((name, time.perf_counter() - start, self._depth))
+
+    def report(self, limit=15):
+        top_level = sorted((t for t in self.timings if t[2] == 0), key=lambda t: t[1], reverse=True)
+        lines = [f"Imports after startup: {len(self.timings)} modules, "
+                 f"{sum(t[1] for t in top_level) * 1000:.0f} ms (this process only; workers import the collectors)"]
+        lines += [f"  {seconds * 1000:8.1f} ms  {name}" for name, seconds, _ in top_level[:limit]]
+        lines.append(f"  streamlit imported: {'yes' if 'streamlit' in sys.modules else 'no'}")
+        return "\n".join(lines)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="adspy",
+        description="Collect ad screenshots from Google Ads Transparency Center or Meta Ads Library",
+    )
+    parser.add_argument("queries", nargs="*", help="Domains (Google) or keywords (Meta)")
+    parser.add_argument("--queries-file", help="File with one query per line ('-' for stdin)")
+    parser.add_argument("--platform", choices=sorted(PLATFORMS), default="google")
+    parser.add_argument("--regions", default="US", help="Comma separated region codes, e.g. US,UK,DE")
+    parser.add_argument("--count", type=int, default=5, help="Ads to collect per query and region")
+    parser.add_argument("-o", "--output-dir", default="adspy_output")
+    parser.add_argument("--format", choices=["files", "zip", "manifest"], default="files",
+                        help="files: one folder per job; zip: a single ads.zip; manifest: results.json only")
+    parser.add_argument("--capture-mode", choices=["batch", "element", "assets"], default="batch")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel browsers")
+    parser.add_argument("--tabs", type=int, default=None, help="Jobs each browser runs at once as tabs")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds per job attempt")
+    parser.add_argument("--retries", type=int, default=None)
+    parser.add_argument("--dedupe-threshold", type=int, default=None,
+                        help="Perceptual-hash distance for near-duplicates (-1 disables)")
+    parser.add_argument("--new-only", action="store_true", help="Only capture ads not seen in earlier runs")
+    parser.add_argument("--force-refresh", action="store_true", help="Ignore cached results")
+    parser.add_argument("--profile-imports", action="store_true", help="Report import and startup timings")
+    return parser
+
+
+def read_queries(args):
+    queries = list(args.queries)
+    if args.queries_file:
+        with (sys.stdin if args.queries_file == "-" else open(args.queries_file)) as f:
+            queries += [line.strip() for line in f]
+    return [q for q in queries if q and not q.startswith("#")]
+
+
+def run(args, queries):
+    # Heavy imports happen here, after argument parsing
+    from batch_jobs import BatchJob, run_batch
+
+    platform = PLATFORMS[args.platform]
+    regions = [r.strip().upper() for r in args.regions.split(",") if r.strip()]
+    jobs = [BatchJob(platform, query, region, args.count) for query in queries for region in regions]
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    options = {
+        "output_dir": args.output_dir if args.format == "files" else None,
+        "force_refresh": args.force_refresh,
+        "new_only": args.new_only,
+        "capture_mode": args.capture_mode,
+    }
+    for name, value in (("max_workers", args.workers), ("tabs_per_browser", args.tabs), ("job_timeout", args.timeout),
+                        ("retries", args.retries), ("dedupe_threshold", args.dedupe_threshold)):
+        if value is not None:
+            options[name] = value
+
+    def on_result(result, done, total):
+        print(f"[{done}/{total}] {result.job.job_id}: {result.status}, {len(result.image_paths)} ads"
+              + (" (cached)" if result.cached else "") + (f" - {result.error}" if result.error else ""))
+
+    results = run_batch(jobs, on_result=on_result, **options)
+
+    manifest = [dict(result.as_row(), job_id=result.job.job_id, image_paths=result.image_paths) for result in results]
+    with open(os.path.join(args.output_dir, "results.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    images = [path for result in results for path in result.image_paths]
+    if args.format == "zip" and images:
+        from zip_export import build_archive
+        shutil.copyfile(build_archive(images), os.path.join(args.output_dir, "ads.zip"))
+
+    # Everything is exported (or listed) now; the result cache keeps its own references
+    from storage import get_store
+    get_store().release_all(images)
+
+    ok = sum(1 for result in results if result.status == "ok")
+    print(f"{ok}/{len(results)} jobs succeeded, {len(images)} ads, output in {args.output_dir}")
+    return 0 if ok or not results else 1
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    profiler = ImportProfiler().install() if "--profile-imports" in argv else None
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    queries = read_queries(args)
+    parsed_ms = (time.perf_counter() - _STARTED) * 1000
+    if not queries:
+        parser.error("no queries given")
+
+    try:
+        return run(args, queries)
+    finally:
+        if profiler:
+            profiler.uninstall()
+            print(f"Arguments parsed {parsed_ms:.1f} ms after the CLI module loaded", file=sys.stderr)
+            print(profiler.report(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""
+Time budgets for collection runs
+
+A run can be given an overall budget in seconds, split over its phases:
+booting a browser, navigating, locating the ads and capturing them. Each
+phase gets its share (PHASE_SHARES) of whatever time is left when it
+starts, so time an early phase did not use rolls over to the later ones
+and capture, the last phase, gets everything that remains. The collectors
+check the deadline between pages and return the ads they have when it
+runs out, rather than being killed from outside with nothing.
+"""
+import os
+import time
+
+
+# Seconds per run when the caller gives no budget; 0 means unlimited
+DEFAULT_BUDGET = float(os.environ.get("ADSPY_RUN_BUDGET", "0"))
+PHASE_SHARES = {"boot": 0.15, "navigate": 0.25, "locate": 0.15, "capture": 0.45}
+# Time kept back at the end for encoding, records and the run summary
+CAPTURE_RESERVE = 2.0
+
+
+class Deadline:
+    """Wall-clock budget for one run, handed out phase by phase"""
+
+    def __init__(self, budget=None, shares=PHASE_SHARES):
+        budget = DEFAULT_BUDGET if budget is None else budget
+        self.budget = budget if budget and budget > 0 else None
+        self.shares = dict(shares)
+        self.ran_out = False
+        # Set when some other limit (e.g. the page's network budget) ended the run early
+        self.stopped_by = None
+        self._start = time.monotonic()
+
+    def remaining(self):
+        """Seconds left (infinite without a budget)"""
+        if self.budget is None:
+            return float("inf")
+        return max(0.0, self.budget - (time.monotonic() - self._start))
+
+    def for_phase(self, phase, cap):
+        """
+        Seconds `phase` may take: its share of the time left among it and the
+        phases after it, never more than `cap` (the phase's usual timeout)
+        """
+        if self.budget is None:
+            return cap
+        names = list(self.shares)
+        share = sum(self.shares[name] for name in names[names.index(phase):])
+        return min(cap, self.remaining() * self.shares[phase] / share)
+
+    def expired(self, reserve=CAPTURE_RESERVE):
+        """True once no more than `reserve` seconds are left; remembered in `ran_out`"""
+        if self.remaining() <= reserve:
+            self.ran_out = True
+        return self.ran_out
+
+    def stop(self, reason):
+        """Record that `reason` cut the run short, so it reports as partial like a timed out one"""
+        self.stopped_by = reason
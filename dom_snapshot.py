@@ -0,0 +1,91 @@
+"""
+Bulk DOM metadata extraction for ad containers
+
+Reading `.text`, `.location`, `.size` or attributes from a WebElement costs
+one WebDriver round trip each. `snapshot_ads` gathers text, rects,
+ad IDs, visibility and the structured record fields (advertiser, body text,
+run dates, platforms) for every element matching a selector in a single
+`execute_script` call and returns the element handles alongside, so capture
+loops can work entirely from the snapshot.
+"""
+
+
+SNAPSHOT_JS = """
+var sx = window.scrollX, sy = window.scrollY;
+var nodes = Array.prototype.slice.call(document.querySelectorAll(arguments[0]));
+var items = nodes.map(function (el) {
+  var r = el.getBoundingClientRect();
+  var style = window.getComputedStyle(el);
+  var text = (el.innerText || '').trim();
+  var adId = null;
+  var lib = text.match(/Library ID:?\\s*(\\d+)/i);
+  if (lib) {
+    adId = 'meta:' + lib[1];
+  } else {
+    var link = el.querySelector('a[href*="/creative/CR"]');
+    var href = link ? link.getAttribute('href') : (el.getAttribute('href') || '');
+    var creative = href.match(/creative\\/(CR\\d+)/);
+    if (creative) adId = 'google:' + creative[1];
+  }
+  // Structured fields for the ad record, read in the same pass
+  var lines = text.split('\\n').map(function (l) { return l.trim(); }).filter(Boolean);
+  var started = text.match(/Started running on ([^\\n\\u00b7]+)/i);
+  var advertiserEl = el.querySelector('.advertiser-name, [class*="advertiser"], a[href*="/advertiser/"], a[href*="facebook.com/"] span');
+  var sponsored = lines.indexOf('Sponsored');
+  var platforms = [];
+  el.querySelectorAll('[aria-label]').forEach(function (node) {
+    var label = node.getAttribute('aria-label');
+    if (/^(Facebook|Instagram|Messenger|Audience Network|Threads|WhatsApp|YouTube|Search|Display|Maps|Play|Shopping)$/i.test(label) &&
+        platforms.indexOf(label) < 0) platforms.push(label);
+  });
+  return {
+    text: text.slice(0, 100),
+    advertiser: advertiserEl ? (advertiserEl.innerText || '').trim().slice(0, 200) :
+      (sponsored > 0 ? lines[sponsored - 1] : ''),
+    body: (sponsored >= 0 ? lines.slice(sponsored + 1) : lines).join('\\n').slice(0, 2000),
+    startedRunning: started ? started[1].trim() : '',
+    platforms: platforms,
+    className: el.className && el.className.baseVal !== undefined ? el.className.baseVal : (el.className || ''),
+    rect: [Math.round(r.left + sx), Math.round(r.top + sy), Math.round(r.width), Math.round(r.height)],
+    adId: adId,
+    visible: r.width > 0 && r.height > 0 && style.visibility !== 'hidden' && style.display !== 'none'
+  };
+});
+return {elements: nodes, items: items};
+"""
+
+
+class AdSnapshot:
+    """Metadata for one ad container, captured without touching the WebElement"""
+
+    __slots__ = ("element", "text", "class_name", "rect", "ad_id", "visible", "advertiser", "body",
+                 "started_running", "platforms", "phash")
+
+    def __init__(self, element, item):
+        self.element = element
+        self.text = item["text"]
+        self.class_name = item["className"]
+        self.rect = item["rect"]
+        self.ad_id = item["adId"]
+        self.visible = item["visible"]
+        self.advertiser = item.get("advertiser", "")
+        self.body = item.get("body", "")
+        self.started_running = item.get("startedRunning", "")
+        self.platforms = item.get("platforms") or []
+        # Perceptual hash of the capture, set by the collector once it has been taken
+        self.phash = None
+
+
+def snapshot_ads(driver, selector):
+    """
+    Snapshot every element matching `selector` in one round trip
+
+    Args:
+        driver: WebDriver to query
+        selector: CSS selector for the ad containers
+
+    Returns:
+        List of AdSnapshot in document order
+    """
+    result = driver.execute_script(SNAPSHOT_JS, selector) or {}
+    return [AdSnapshot(el, item) for el, item in zip(result.get("elements", []), result.get("items", []))]
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import shutil
+import threading
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from settings import cache_path
+
+
+MANIFEST_PATH = os.environ.get("ADSPY_DRIVER_MANIFEST") or cache_path("driver_manifest.json")
+
+# Browser binaries Chrome/ChromeDriver may pick up when no explicit binary is set
+BROWSER_CANDIDATES = ["chromium", "chromium-browser", "google-chrome", "google-chrome-stable"]
+FALLBACK_BINARY = "/usr/bin/chromium-browser"
+
+# Reentrant: a manifest that fails to launch is dropped while probing already holds it
+_lock = threading.RLock()
+
+
+def _fingerprint(path):
+    """Size and mtime of a file, enough to notice upgrades and reinstalls"""
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, int(stat.st_mtime)]
+
+
+def _default_browser():
+    for name in BROWSER_CANDIDATES:
+        path = shutil.which(name)
+        if path:
+            return os.path.realpath(path)
+    return None
+
+
+def _probe_chromium():
+    from webdriver_manager.chrome import ChromeDriverManager
+    from webdriver_manager.core.os_manager import ChromeType
+    return ChromeDriverManager(chrome_type=ChromeType.CHROMIUM).install(), None
+
+
+def _probe_chrome():
+    from webdriver_manager.chrome import ChromeDriverManager
+    return ChromeDriverManager().install(), None
+
+
+def _probe_system_chromium():
+    # Let Selenium Manager find a driver for the distro Chromium (Streamlit Cloud)
+    return None, FALLBACK_BINARY
+
+
+# Tried in order until one launches; the winner is written to the manifest
+PROBE_TIERS = [
+    ("chromium", _probe_chromium),
+    ("chrome", _probe_chrome),
+    ("system-chromium", _probe_system_chromium),
+]
+
+
+def load_manifest():
+    """Cached driver/binary combination, or None when missing or stale"""
+    try:
+        with open(MANIFEST_PATH) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    driver_path = manifest.get("driver_path")
+    if not driver_path or _fingerprint(driver_path) != manifest.get("driver_fingerprint"):
+        return None
+
+    browser = manifest.get("binary_location") or _default_browser()
+    if browser != manifest.get("browser_path") or _fingerprint(browser) != manifest.get("browser_fingerprint"):
+        return None
+    return manifest
+
+
+def save_manifest(manifest):
+    """Write the manifest atomically so concurrent workers never read half a file"""
+    tmp_path = f"{MANIFEST_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def invalidate_manifest():
+    try:
+        os.remove(MANIFEST_PATH)
+    except OSError:
+        pass
+
+
+def _start(options, driver_path, binary_location):
+    if binary_location:
+        options.binary_location = binary_location
+    service = Service(driver_path) if driver_path else Service()
+    return webdriver.Chrome(service=service, options=options)
+
+
+def _manifest_for(tier, driver, binary_location):
+    driver_path = getattr(driver.service, "path", None)
+    browser = binary_location or _default_browser()
+    caps = driver.capabilities
+    return {
+        "tier": tier,
+        "driver_path": driver_path,
+        "driver_fingerprint": _fingerprint(driver_path),
+        "driver_version": (caps.get("chrome") or {}).get("chromedriverVersion", "").split(" ")[0],
+        "binary_location": binary_location,
+        "browser_path": browser,
+        "browser_fingerprint": _fingerprint(browser),
+        "browser_version": caps.get("browserVersion"),
+        "resolved_at": time.time(),
+    }
+
+
+def _probe(options):
+    """Walk the fallback tiers once and return the first driver that starts"""
+    errors = []
+    for tier, probe in PROBE_TIERS:
+        try:
+            driver_path, binary_location = probe()
+            driver = _start(options, driver_path, binary_location)
+        except Exception as e:
+            print(f"Failed to initialize ChromeDriver with {tier} tier: {e}")
+            errors.append(f"{tier}: {e}")
+            continue
+        return tier, driver, binary_location
+    raise RuntimeError("All ChromeDriver initialization methods failed: " + "; ".join(errors))
+
+
+def _start_from_manifest(options, manifest, start):
+    """Launch with a cached manifest; None (and the manifest dropped) when there is none or it fails"""
+    if not manifest:
+        return None
+    try:
+        driver = _start(options, manifest["driver_path"], manifest.get("binary_location"))
+    except Exception as e:
+        print(f"Cached driver manifest failed to launch, re-probing: {e}")
+        with _lock:
+            invalidate_manifest()
+        return None
+    _record("manifest", manifest["tier"], start)
+    return driver
+
+
+def launch_driver(options):
+    """
+    Start Chrome using the cached bootstrap manifest, probing tiers only when needed
+
+    Args:
+        options: Chrome Options for the new session
+
+    Returns:
+        A started webdriver.Chrome instance
+    """
+    start = time.perf_counter()
+    with _lock:
+        manifest = load_manifest()
+    driver = _start_from_manifest(options, manifest, start)
+    if driver:
+        return driver
+
+    # Serialize probing so parallel sessions do not all download drivers at once
+    with _lock:
+        # A session that probed while this one waited for the lock has left a fresh manifest
+        driver = _start_from_manifest(options, load_manifest(), start)
+        if driver:
+            return driver
+
+        tier, driver, binary_location = _probe(options)
+        manifest = _manifest_for(tier, driver, binary_location)
+        manifest["resolution_seconds"] = round(time.perf_counter() - start, 3)
+        try:
+            save_manifest(manifest)
+        except OSError as e:
+            print(f"Could not write driver manifest: {e}")
+    _record("probe", tier, start)
+    return driver
+
+
+def _record(source, tier, start):
+    elapsed = time.perf_counter() - start
+    print(f"Driver resolved from {source} ({tier}) in {elapsed:.2f}s")
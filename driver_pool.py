@@ -0,0 +1,242 @@
+import os
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+from webdriver_metrics import browser_rss
+
+
+# Pool sizing can be tuned per deployment without touching the code
+DEFAULT_POOL_SIZE = int(os.environ.get("ADSPY_DRIVER_POOL_SIZE", "2"))
+DEFAULT_MAX_USES = int(os.environ.get("ADSPY_DRIVER_MAX_USES", "25"))
+DEFAULT_CHECKOUT_TIMEOUT = float(os.environ.get("ADSPY_DRIVER_CHECKOUT_TIMEOUT", "180"))
+# Chrome's memory only grows over a long session; past this it is replaced on checkin (0 disables)
+DEFAULT_RECYCLE_MB = float(os.environ.get("ADSPY_DRIVER_RECYCLE_MB", "1536"))
+
+# Storage wiped for the last visited origin when a driver is returned
+CLEARED_STORAGE_TYPES = "local_storage,session_storage,indexeddb,websql,service_workers,cache_storage"
+
+
+class PooledDriver:
+    """A warm Chrome driver plus the bookkeeping the pool needs to recycle it"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = time.time()
+        self.last_used_at = self.created_at
+
+
+class DriverPool:
+    """
+    Fixed-size pool of warm Chrome drivers with checkout/checkin semantics
+
+    Drivers are created lazily by `factory` up to `size`, health checked on
+    checkout, reset (cookies, storage, extra tabs) on checkin and recycled
+    after `max_uses` jobs or once the browser uses more than `recycle_mb` of
+    memory, so long-lived browsers do not accumulate state.
+    """
+
+    def __init__(self, factory, size=DEFAULT_POOL_SIZE, max_uses=DEFAULT_MAX_USES,
+                 checkout_timeout=DEFAULT_CHECKOUT_TIMEOUT, recycle_mb=DEFAULT_RECYCLE_MB):
+        if size < 1:
+            raise ValueError(f"Driver pool size must be at least 1, got {size}")
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self.checkout_timeout = checkout_timeout
+        self.recycle_mb = recycle_mb
+        self._idle = []
+        self._total = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {"created": 0, "reused": 0, "recycled": 0, "unhealthy": 0}
+
+    def checkout(self, timeout=None):
+        """Borrow a healthy driver, creating one if the pool is not yet full"""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            pooled = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("Driver pool is closed")
+
+                    # Prefer the most recently returned driver, it is the warmest
+                    if self._idle:
+                        pooled = self._idle.pop()
+                        break
+
+                    if self._total < self.size:
+                        # Reserve the slot now, launch Chrome outside the lock
+                        self._total += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"No driver became available within {timeout:g}s")
+                    self._cond.wait(remaining)
+
+            if pooled is None:
+                break
+            # Probe outside the lock (it is a WebDriver round trip); the driver keeps its slot meanwhile
+            if self._is_healthy(pooled):
+                with self._cond:
+                    self._stats["reused"] += 1
+                return pooled
+            print("Discarding unhealthy pooled driver")
+            with self._cond:
+                self._stats["unhealthy"] += 1
+            self._discard(pooled)
+
+        try:
+            driver = self.factory()
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._stats["created"] += 1
+        return PooledDriver(driver)
+
+    def checkin(self, pooled, discard=False):
+        """Return a borrowed driver, resetting or recycling it as needed"""
+        pooled.uses += 1
+        pooled.last_used_at = time.time()
+
+        if not discard and pooled.uses >= self.max_uses:
+            print(f"Recycling driver after {pooled.uses} uses")
+            with self._cond:
+                self._stats["recycled"] += 1
+            discard = True
+
+        if not discard and self.recycle_mb:
+            rss_mb = browser_rss(pooled.driver) / 1024 ** 2
+            if rss_mb > self.recycle_mb:
+                print(f"Recycling driver using {rss_mb:.0f} MB")
+                with self._cond:
+                    self._stats["recycled"] += 1
+                discard = True
+
+        try:
+            if not discard and not self._reset(pooled):
+                discard = True
+        except BaseException:
+            # A job timeout landed mid-reset: the browser may be hung, so never hand it out again
+            self._discard(pooled)
+            raise
+
+        with self._cond:
+            if not discard and not self._closed:
+                self._idle.append(pooled)
+                self._cond.notify()
+                return
+        self._discard(pooled)
+
+    @contextmanager
+    def driver(self, timeout=None):
+        """Context manager yielding a pooled driver; drivers that raise are discarded"""
+        pooled = self.checkout(timeout)
+        try:
+            yield pooled.driver
+        except BaseException:
+            self.checkin(pooled, discard=True)
+            raise
+        else:
+            self.checkin(pooled)
+
+    def stats(self):
+        """Snapshot of pool occupancy and lifetime counters"""
+        with self._cond:
+            return dict(self._stats, size=self.size, open=self._total, idle=len(self._idle))
+
+    def close(self):
+        """Quit every idle driver and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
+
+    def _discard(self, pooled):
+        # Called without the lock: quitting Chrome can take seconds, and is best effort.
+        # The slot is only freed once the browser is gone, so the pool never runs more than `size`
+        try:
+            pooled.driver.quit()
+        except Exception:
+            pass
+        with self._cond:
+            self._total -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _is_healthy(pooled):
+        """Cheap liveness probe: the session answers and a window is still open"""
+        try:
+            if not pooled.driver.window_handles:
+                return False
+            return pooled.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    @staticmethod
+    def _reset(pooled):
+        """Clear cookies, storage and extra tabs so the next job starts clean"""
+        driver = pooled.driver
+        try:
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+
+            # Storage is per origin, so wipe the one we are leaving before navigating away
+            origin = driver.execute_script("return window.location.origin")
+            if origin and origin.startswith("http"):
+                try:
+                    driver.execute_cdp_cmd("Storage.clearDataForOrigin", {
+                        "origin": origin,
+                        "storageTypes": CLEARED_STORAGE_TYPES,
+                    })
+                except Exception:
+                    driver.execute_script("try { localStorage.clear(); sessionStorage.clear(); } catch (e) {}")
+
+            driver.delete_all_cookies()
+            try:
+                driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            except Exception:
+                pass
+            driver.get("about:blank")
+            return True
+        except Exception as e:
+            print(f"Failed to reset pooled driver, discarding it: {e}")
+            return False
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_driver_pool(factory, size=DEFAULT_POOL_SIZE, max_uses=DEFAULT_MAX_USES):
+    """Process-wide pool for `factory`, shared by every Streamlit session"""
+    with _pools_lock:
+        pool = _pools.get(factory)
+        if pool is None:
+            pool = DriverPool(factory, size=size, max_uses=max_uses)
+            _pools[factory] = pool
+        return pool
+
+
+@atexit.register
+def close_all_pools():
+    """Quit pooled browsers on interpreter exit so no Chrome processes leak"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
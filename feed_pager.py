@@ -0,0 +1,120 @@
+"""
+Paging through an infinite-scroll ad feed with bounded memory
+
+Every ad container the collector has dealt with is tagged in the page with
+a data attribute, so each page is a snapshot of only the untagged ones: the
+cost per page stays the same however long the feed grows, and Python never
+holds on to element handles or fingerprints of earlier pages. Scrolling
+brings the last rendered container into view, waits for lazy content to
+settle and counts new containers; the feed has ended after a few scrolls
+in a row bring nothing new. Optionally the content of captured containers
+is dropped (their height is kept so the scroll position does not jump), so
+Chrome's memory stays flat over thousands of ads.
+"""
+import os
+from dom_snapshot import snapshot_ads
+from readiness import wait_for_scroll_settle
+
+
+SEEN_ATTR = "data-adspy-seen"
+# Empty captured containers to keep the renderer's memory flat; some feeds re-render them, so opt in
+PRUNE_CAPTURED = os.environ.get("ADSPY_PRUNE_CAPTURED", "0") == "1"
+# Scrolls in a row without new containers before the feed counts as ended
+MAX_IDLE_SCROLLS = 3
+
+RELEASE_JS = """
+var attr = arguments[1], prune = arguments[2];
+arguments[0].forEach(function (el) {
+  try {
+    el.setAttribute(attr, '1');
+    if (prune) {
+      el.style.height = el.getBoundingClientRect().height + 'px';
+      el.style.overflow = 'hidden';
+      while (el.firstChild) el.removeChild(el.firstChild);
+    }
+  } catch (e) {}
+});
+"""
+
+# Bring the last container into view, then nudge past it so scroll sentinels fire
+SCROLL_JS = """
+var nodes = document.querySelectorAll(arguments[0]);
+var last = nodes[nodes.length - 1];
+if (last) last.scrollIntoView({block: 'end'});
+window.scrollBy(0, Math.round(window.innerHeight / 2));
+return nodes.length;
+"""
+
+# Untagged containers only count if next_page would hand them out, i.e. they are visible (as in SNAPSHOT_JS)
+COUNT_JS = """
+var unseen = 0;
+document.querySelectorAll(arguments[0] + ':not([' + arguments[1] + '])').forEach(function (el) {
+  var r = el.getBoundingClientRect(), style = window.getComputedStyle(el);
+  if (r.width > 0 && r.height > 0 && style.visibility !== 'hidden' && style.display !== 'none') unseen++;
+});
+return [document.querySelectorAll(arguments[0]).length, unseen];
+"""
+
+
+class FeedPager:
+    """Walks an ad feed one page of not-yet-seen containers at a time"""
+
+    def __init__(self, driver, selector, prune=PRUNE_CAPTURED, max_idle_scrolls=MAX_IDLE_SCROLLS):
+        self.driver = driver
+        self.selector = selector
+        self.prune = prune
+        self.max_idle_scrolls = max_idle_scrolls
+        self.pages = 0
+        self.scrolls = 0
+        self.seen = 0
+        self.end_of_feed = False
+        self._idle = 0
+        self._count = 0
+
+    def next_page(self):
+        """Snapshots of the visible containers not handed out before (may be empty)"""
+        snapshots = snapshot_ads(self.driver, f"{self.selector}:not([{SEEN_ATTR}])")
+        visible = [snapshot for snapshot in snapshots if snapshot.visible]
+        if visible:
+            self.pages += 1
+        return visible
+
+    def release(self, snapshots, prune=None):
+        """Tag containers as done so later pages skip them, emptying them if pruning"""
+        if not snapshots:
+            return
+        prune = self.prune if prune is None else prune
+        self.driver.execute_script(RELEASE_JS, [snapshot.element for snapshot in snapshots], SEEN_ATTR, prune)
+        self.seen += len(snapshots)
+
+    def scroll(self):
+        """
+        Scroll past the last rendered container and wait for the feed to grow
+
+        Returns:
+            False once the feed has ended (several scrolls without new containers)
+        """
+        if self.end_of_feed:
+            return False
+        self.begin_scroll()
+        wait_for_scroll_settle(self.driver)
+        return self.finish_scroll()
+
+    def begin_scroll(self):
+        """First half of scroll(), for callers that wait for lazy content their own way"""
+        self.driver.execute_script(SCROLL_JS, self.selector)
+        self.scrolls += 1
+
+    def finish_scroll(self):
+        """Second half of scroll(): count new containers once the page has settled"""
+        total, unseen = self.driver.execute_script(COUNT_JS, self.selector, SEEN_ATTR) or (0, 0)
+        # Count growth catches appended items, untagged nodes catch virtualized lists that recycle them
+        if unseen or total > self._count:
+            self._idle = 0
+        else:
+            self._idle += 1
+            if self._idle >= self.max_idle_scrolls:
+                print(f"End of feed after {self.scrolls} scrolls, {self.seen} ads seen")
+                self.end_of_feed = True
+        self._count = total
+        return not self.end_of_feed
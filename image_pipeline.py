@@ -0,0 +1,115 @@
+"""
+Encoding captures off the driver thread
+
+Screenshots come back from the driver as PNG bytes and are decoded once in
+memory; ads are cropped out of that image and never touch a temp file.
+Encoding into the stored format (WebP by default, a fraction of the size of
+Chrome's lossless PNG) and writing to the content store run on a thread
+pool, so the thread driving the browser can go on to the next capture or
+scroll while earlier ads are still being encoded. An EncodePipeline hands
+finished paths back without blocking via `completed()`, and `drain()` waits
+for the rest at the end of a run. A run that stops early calls `discard()`,
+so captures nobody will collect give their store reference back.
+"""
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PIL import Image, features
+from storage import get_store
+from tracing import count
+
+
+# PNG, WEBP or JPEG; quality applies to the lossy ones
+CAPTURE_FORMAT = (os.environ.get("ADSPY_CAPTURE_FORMAT") or ("WEBP" if features.check("webp") else "PNG")).upper()
+CAPTURE_QUALITY = int(os.environ.get("ADSPY_CAPTURE_QUALITY", "85"))
+ENCODE_WORKERS = 4
+
+EXTENSIONS = {"PNG": ".png", "WEBP": ".webp", "JPEG": ".jpg"}
+
+_encode_pool = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="adspy-encode")
+
+
+def encode_image(image, fmt=CAPTURE_FORMAT, quality=CAPTURE_QUALITY):
+    """Encode a PIL image; returns (bytes, file extension)"""
+    fmt = "JPEG" if fmt.upper() == "JPG" else fmt.upper()
+    if fmt not in EXTENSIONS:
+        raise ValueError(f"Unsupported capture format: {fmt}")
+    buffer = io.BytesIO()
+    if fmt == "PNG":
+        image.save(buffer, format="PNG")
+    elif fmt == "JPEG":
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    else:
+        image.save(buffer, format="WEBP", quality=quality)
+    return buffer.getvalue(), EXTENSIONS[fmt]
+
+
+def decode_image(data):
+    """PIL image from screenshot bytes, fully loaded"""
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def store_image(image, store=None, fmt=CAPTURE_FORMAT, quality=CAPTURE_QUALITY):
+    """Encode `image` and save it to the content store; returns its path"""
+    start = time.perf_counter()
+    data, ext = encode_image(image, fmt, quality)
+    path = (store or get_store()).put_bytes(data, ext)
+    count("encodes")
+    count("encode_seconds", time.perf_counter() - start)
+    return path
+
+
+class EncodePipeline:
+    """Encodes and stores captured images in the background, each under a caller-chosen tag"""
+
+    def __init__(self, store=None, fmt=CAPTURE_FORMAT, quality=CAPTURE_QUALITY):
+        self.store = store or get_store()
+        self.fmt = fmt
+        self.quality = quality
+        self._futures = {}
+
+    @property
+    def pending(self):
+        """Images submitted whose path has not been handed back yet"""
+        return len(self._futures)
+
+    def submit(self, tag, image):
+        future = _encode_pool.submit(store_image, image, self.store, self.fmt, self.quality)
+        self._futures[future] = tag
+
+    def completed(self):
+        """(tag, path) for every encode that has already finished, without waiting"""
+        return self._collect([future for future in self._futures if future.done()])
+
+    def drain(self):
+        """(tag, path) for all remaining encodes, as they finish"""
+        for future in as_completed(list(self._futures)):
+            yield from self._collect([future])
+
+    def discard(self):
+        """Drop the encodes not handed back yet, releasing whatever they store"""
+        futures, self._futures = list(self._futures), {}
+        for future in futures:
+            if not future.cancel():
+                future.add_done_callback(self._release_result)
+
+    def _release_result(self, future):
+        try:
+            self.store.release(future.result())
+        except Exception:
+            pass
+
+    def _collect(self, futures):
+        for future in futures:
+            tag = self._futures.pop(future)
+            try:
+                path = future.result()
+            except Exception as e:
+                print(f"Failed to encode capture: {e}")
+                continue
+            yield tag, path
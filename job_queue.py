@@ -0,0 +1,199 @@
+"""
+Embedded SQLite job queue for background collection
+
+The Streamlit app submits collection jobs here and polls their status;
+worker processes (see worker.py) claim them, run the collectors and write
+the results back. Jobs are claimed highest priority first under a lease:
+a worker extends its lease while it runs, and a job whose lease expires
+(the worker crashed or was killed) becomes claimable again until it runs
+out of attempts. The queue lives in one file under the cache dir, so jobs
+survive app restarts and closed browser tabs.
+"""
+import os
+import json
+import time
+from settings import cache_path, ProcessWide, ThreadConnections
+
+
+DEFAULT_LEASE_SECONDS = float(os.environ.get("ADSPY_JOB_LEASE_SECONDS", "120"))
+DEFAULT_MAX_ATTEMPTS = int(os.environ.get("ADSPY_JOB_MAX_ATTEMPTS", "3"))
+
+# Terminal states; everything else is "queued" or "running"
+FINISHED_STATES = ("ok", "empty", "failed", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    platform TEXT NOT NULL,
+    query TEXT NOT NULL,
+    region TEXT NOT NULL,
+    screenshot_count INTEGER NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    captured INTEGER NOT NULL DEFAULT 0,
+    image_paths TEXT NOT NULL DEFAULT '[]',
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority DESC, id);
+"""
+
+
+class QueuedJob:
+    """A row of the jobs table"""
+
+    def __init__(self, row):
+        (self.id, self.platform, self.query, self.region, self.screenshot_count, options, self.priority,
+         self.status, self.attempts, self.max_attempts, self.lease_owner, self.lease_expires, self.captured,
+         image_paths, self.error, self.created_at, self.started_at, self.finished_at) = row
+        self.options = json.loads(options)
+        self.image_paths = json.loads(image_paths)
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def as_row(self):
+        """Flat dict for tables"""
+        return {
+            "id": self.id,
+            "platform": self.platform,
+            "query": self.query,
+            "region": self.region,
+            "status": self.status,
+            "ads": self.captured if not self.finished else len(self.image_paths),
+            "target": self.screenshot_count,
+            "priority": self.priority,
+            "attempts": self.attempts,
+            "error": self.error or "",
+        }
+
+    def __repr__(self):
+        return f"QueuedJob({self.id}, {self.platform!r}, {self.query!r}, {self.region!r}, {self.status!r})"
+
+
+class JobQueue:
+    """Priority job queue with leases, in a single SQLite file"""
+
+    def __init__(self, path=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.path = path or cache_path("jobs.sqlite3")
+        self.lease_seconds = lease_seconds
+        # Autocommit mode so claim() can take the write lock up front with BEGIN IMMEDIATE
+        self._db = ThreadConnections(self.path, isolation_level=None)
+        with self._db() as db:
+            db.executescript(SCHEMA)
+
+    def submit(self, platform, query, region, screenshot_count=5, priority=0, options=None,
+               max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Queue a collection job; higher priorities are claimed first. Returns the job id"""
+        cursor = self._db().execute(
+            "INSERT INTO jobs (platform, query, region, screenshot_count, options, priority, max_attempts, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (platform, query.strip(), region, screenshot_count, json.dumps(options or {}), priority, max_attempts,
+             time.time()),
+        )
+        return cursor.lastrowid
+
+    def claim(self, worker_id, lease_seconds=None):
+        """
+        Lease the next job for `worker_id`: the highest priority queued job, or
+        a running job whose lease expired
+
+        Returns:
+            QueuedJob, or None when there is nothing to do
+        """
+        lease_seconds = lease_seconds or self.lease_seconds
+        db = self._db()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs abandoned by dead workers that have no attempts left are failed for good
+            db.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, lease_owner = NULL, "
+                "error = COALESCE(error, 'Worker lease expired too many times') "
+                "WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts",
+                (now, now),
+            )
+            row = db.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?) "
+                "ORDER BY priority DESC, id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            db.execute(
+                "UPDATE jobs SET status = 'running', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (worker_id, now + lease_seconds, now, row[0]),
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return self.get(row[0])
+
+    def heartbeat(self, job_id, worker_id, captured=None, lease_seconds=None):
+        """
+        Extend a job's lease and record progress
+
+        Returns:
+            False if the worker no longer owns the job (lease lost or the job
+            was cancelled), in which case it should stop working on it
+        """
+        lease_seconds = lease_seconds or self.lease_seconds
+        cursor = self._db().execute(
+            "UPDATE jobs SET lease_expires = ?, captured = COALESCE(?, captured) "
+            "WHERE id = ? AND lease_owner = ? AND status = 'running'",
+            (time.time() + lease_seconds, captured, job_id, worker_id),
+        )
+        return cursor.rowcount > 0
+
+    def complete(self, job_id, worker_id, status, image_paths=(), error=None):
+        """Store a job's outcome; ignored if the worker lost the lease meanwhile"""
+        cursor = self._db().execute(
+            "UPDATE jobs SET status = ?, image_paths = ?, captured = ?, error = ?, finished_at = ?, "
+            "lease_owner = NULL, lease_expires = NULL WHERE id = ? AND lease_owner = ? AND status = 'running'",
+            (status, json.dumps(list(image_paths)), len(image_paths), error, time.time(), job_id, worker_id),
+        )
+        return cursor.rowcount > 0
+
+    def release(self, job_id, worker_id):
+        """Hand an unfinished job back to the queue (graceful shutdown), keeping its attempt count"""
+        self._db().execute(
+            "UPDATE jobs SET status = 'queued', lease_owner = NULL, lease_expires = NULL, "
+            "attempts = MAX(0, attempts - 1) WHERE id = ? AND lease_owner = ? AND status = 'running'",
+            (job_id, worker_id),
+        )
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; a running worker notices on its next heartbeat"""
+        cursor = self._db().execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ?, lease_owner = NULL "
+            "WHERE id = ? AND status IN ('queued', 'running')",
+            (time.time(), job_id),
+        )
+        return cursor.rowcount > 0
+
+    def get(self, job_id):
+        row = self._db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return QueuedJob(row) if row else None
+
+    def recent(self, limit=20):
+        """Most recently submitted jobs, newest first"""
+        rows = self._db().execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [QueuedJob(row) for row in rows]
+
+    def counts(self):
+        """Number of jobs per status"""
+        return dict(self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+get_job_queue = ProcessWide(JobQueue)
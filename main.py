@@ -1,10 +1,34 @@
 import os
 import streamlit as st
-from streamlit_scraper import collect_ads
-from utils import display_images, zip_images
+from streamlit_scraper import build_search_url, stream_ads
+from batch_jobs import (
+    BatchJob, run_batch, DEFAULT_WORKERS, DEFAULT_JOB_TIMEOUT, DEFAULT_RETRIES, DEFAULT_TABS_PER_BROWSER,
+)
+from utils import display_images, show_media, zip_download_button
+from storage import get_store
+from result_cache import get_result_cache
+from job_queue import get_job_queue
+from ad_locator import get_selector_cache
 
 st.set_page_config(page_title="Adspy Collector", layout="wide")
 
+# The feed pager keeps memory flat however many ads a run collects;
+# only the first few are rendered live, the gallery pages through the rest
+MAX_ADS_PER_RUN = 5000
+LIVE_PREVIEW_LIMIT = 50
+
+
+def replace_session_images(images):
+    """Swap the previewed ads, releasing store references held by the previous run"""
+    store = get_store()
+    for path in st.session_state.get("ad_images", []):
+        try:
+            store.release(path)
+        except Exception:
+            pass
+    st.session_state["ad_images"] = images
+
+
 # Add more space before the title
 st.markdown("<div style='height: 20px;'></div>", unsafe_allow_html=True)
 
@@ -42,24 +66,99 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# Regions offered in the selectboxes (Meta uses GB, mapped to UK by the scraper)
+GOOGLE_REGIONS = ["AR", "US", "UK", "CA", "AU", "DE", "FR", "ES", "IT", "JP"]
+META_COUNTRIES = ["AR", "US", "GB", "CA", "AU", "DE", "FR", "ES", "IT", "JP"]
+
 # Step 1: Select platform
 platform = st.radio("Select Platform", ["Google Ads Transparency", "Meta Ads Library"], horizontal=True)
+platform_param = "Meta Ads" if platform == "Meta Ads Library" else "Google Ads"
+mode = st.radio("Mode", ["Single search", "Batch sweep"], horizontal=True)
+option_col1, option_col2 = st.columns(2)
+with option_col1:
+    force_refresh = st.checkbox("Force refresh", help="Ignore cached results and collect the ads again")
+with option_col2:
+    new_only = st.checkbox("Only new since last run",
+                           help="Skip ads already captured in earlier runs (tracked in the local ad index)")
+
+if mode == "Batch sweep":
+    # Competitive sweeps: many domains/keywords across many regions at once
+    st.write(f"### Batch sweep on {platform}")
+    query_label = "Domains (one per line)" if platform_param == "Google Ads" else "Keywords (one per line)"
+    queries_text = st.text_area(query_label, "")
+    region_options = GOOGLE_REGIONS if platform_param == "Google Ads" else META_COUNTRIES
+    regions = st.multiselect("Regions", region_options, default=region_options)
+    
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        screenshot_count = st.slider("Ads per job", min_value=1, max_value=20, value=5)
+    with col2:
+        max_workers = st.slider("Parallel browsers", min_value=1, max_value=max(DEFAULT_WORKERS, 8), value=DEFAULT_WORKERS)
+    with col3:
+        tabs_per_browser = st.slider("Tabs per browser", min_value=1, max_value=8, value=DEFAULT_TABS_PER_BROWSER,
+                                     help="Load several jobs at once as tabs of each browser; "
+                                          "cheaper than more browsers for multi-region sweeps")
+    with col4:
+        job_timeout = st.number_input("Timeout per job (s)", min_value=30, max_value=1800, value=DEFAULT_JOB_TIMEOUT, step=30)
+    with col5:
+        retries = st.number_input("Retries", min_value=0, max_value=5, value=DEFAULT_RETRIES)
+    
+    queries = [q.strip() for q in queries_text.splitlines() if q.strip()]
+    jobs = [BatchJob(platform_param, q, r, screenshot_count) for q in queries for r in regions]
+    if jobs:
+        st.write(f"{len(jobs)} jobs ({len(queries)} queries × {len(regions)} regions)")
+    
+    if st.button("🚀 Run Batch"):
+        if not jobs:
+            st.warning("Please enter at least one query and select at least one region.")
+        else:
+            progress = st.progress(0.0, text="Starting workers...")
+            status_table = st.empty()
+            rows = []
+            
+            def on_result(result, done, total):
+                rows.append(result.as_row())
+                progress.progress(done / total, text=f"{done}/{total} jobs finished")
+                status_table.dataframe(rows, use_container_width=True)
+            
+            try:
+                results = run_batch(jobs, max_workers=max_workers, job_timeout=job_timeout,
+                                    retries=retries, on_result=on_result, force_refresh=force_refresh,
+                                    new_only=new_only, tabs_per_browser=tabs_per_browser)
+                images = [path for result in results for path in result.image_paths]
+                ok = sum(1 for result in results if result.status == "ok")
+                cached = sum(1 for result in results if result.cached)
+                st.session_state["batch_results"] = [result.as_row() for result in results]
+                if images:
+                    replace_session_images(images)
+                st.success(f"{ok}/{len(results)} jobs succeeded ({cached} from cache), captured {len(images)} ads")
+            except Exception as e:
+                st.error(f"An error occurred: {e}")
+    
+    if "batch_results" in st.session_state:
+        with st.expander("Batch results", expanded=False):
+            st.dataframe(st.session_state["batch_results"], use_container_width=True)
+    
+    url = ""
 
 # Step 2: Input search terms
-if platform == "Google Ads Transparency":
+elif platform == "Google Ads Transparency":
     st.write("### Google Ads Transparency Center")
     domain = st.text_input("Enter the domain (e.g., nike.com)", "")
     
     # Set Region and Screenshot Count
     col1, col2 = st.columns(2)
     with col1:
-        region = st.selectbox("Region", ["AR", "US", "UK", "CA", "AU", "DE", "FR", "ES", "IT", "JP"], index=0)
+        region = st.selectbox("Region", GOOGLE_REGIONS, index=0)
     with col2:
-        screenshot_count = st.slider("Number of ads to collect", min_value=1, max_value=20, value=5)
+        screenshot_count = st.number_input("Number of ads to collect", min_value=1, max_value=MAX_ADS_PER_RUN,
+                                           value=5, step=5)
+    
+    query, query_region = domain, region
     
     # Construct the Google Transparency Center URL
     if domain:
-        url = f"https://adstransparency.google.com/?region={region}&domain={domain}"
+        url = build_search_url(platform_param, domain, region)
         st.write(f"Scraping ads from: {url}")
     else:
         url = ""
@@ -71,50 +170,190 @@ else:  # Meta Ads Library
     # Set Country and Screenshot Count
     col1, col2 = st.columns(2)
     with col1:
-        country = st.selectbox("Country", ["AR", "US", "GB", "CA", "AU", "DE", "FR", "ES", "IT", "JP"], index=0)
-        # Map for country codes used by Facebook
-        country_map = {
-            "GB": "UK",  # Facebook uses UK instead of GB
-        }
-        fb_country = country_map.get(country, country)
+        country = st.selectbox("Country", META_COUNTRIES, index=0)
     with col2:
-        screenshot_count = st.slider("Number of ads to collect", min_value=1, max_value=20, value=5)
+        screenshot_count = st.number_input("Number of ads to collect", min_value=1, max_value=MAX_ADS_PER_RUN,
+                                           value=5, step=5)
+    
+    query, query_region = keyword, country
     
     # Construct the Meta Ads Library URL
     if keyword:
-        url = f"https://www.facebook.com/ads/library/?active_status=active&ad_type=all&country={fb_country}&is_targeted_country=false&media_type=all&q={keyword}&search_type=keyword_unordered"
+        url = build_search_url(platform_param, keyword, country)
         st.write(f"Scraping ads from: {url}")
     else:
         url = ""
 
 # Step 3: Collect Ads
-if st.button("🚀 Collect Ads"):
-    if not url:
-        if platform == "Google Ads Transparency":
-            st.warning("Please enter a valid domain.")
+if mode == "Single search":
+    collect_col, stop_col = st.columns([1, 4])
+    with collect_col:
+        collect_clicked = st.button("🚀 Collect Ads")
+    with stop_col:
+        # Any click reruns the script, which interrupts a running collection;
+        # ads streamed so far are already kept in session state
+        stop_clicked = st.button("⏹ Stop", help="Stop collecting and keep the ads captured so far")
+    
+    output = st.radio("Output", ["Screenshots", "Original assets"], horizontal=True,
+                      help="Original assets saves the image/video files the page loaded, "
+                           "falling back to screenshots for ads without one")
+    capture_mode = "assets" if output == "Original assets" else "batch"
+    budget = st.number_input("Time budget (seconds)", min_value=0, max_value=3600, value=0, step=30,
+                             help="Stop when the time is up and keep the ads captured so far; "
+                                  "0 uses ADSPY_RUN_BUDGET (no limit unless set)") or None
+    cache_variant = "assets" if capture_mode == "assets" else ""
+    background = st.checkbox("Run in background worker",
+                             help="Queue the job for `python worker.py` instead of scraping in this session; "
+                                  "it keeps running if you close the tab")
+    
+    if stop_clicked and st.session_state.get("ad_images"):
+        st.info(f"Collection stopped, kept {len(st.session_state['ad_images'])} ads.")
+    
+    if collect_clicked:
+        st.session_state.pop("run_summary", None)
+        cached = None
+        # New-only runs depend on the ad index, so cached results don't apply
+        if url and not force_refresh and not new_only:
+            cached = get_result_cache().get(platform_param, query, query_region, screenshot_count, cache_variant)
+        if not url:
+            if platform == "Google Ads Transparency":
+                st.warning("Please enter a valid domain.")
+            else:
+                st.warning("Please enter a valid keyword.")
+        elif cached:
+            replace_session_images(cached)
+            st.success(f"Loaded {len(cached)} ads from cache (tick Force refresh to collect again)")
+        elif background:
+            job_id = get_job_queue().submit(
+                platform_param, query, query_region, screenshot_count,
+                options={"capture_mode": capture_mode, "new_only": new_only, "force_refresh": force_refresh,
+                         "budget": budget},
+            )
+            st.session_state.setdefault("queued_jobs", []).append(job_id)
+            st.success(f"Queued job #{job_id}. Results appear under Background jobs once a worker picks it up.")
         else:
-            st.warning("Please enter a valid keyword.")
-    else:
-        with st.spinner(f"Collecting ads from {platform}..."):
+            progress = st.progress(0.0, text=f"Collecting ads from {platform}...")
+            live_preview = st.empty()
+            images = []
+            captured = 0
+            replace_session_images(images)
             try:
-                platform_param = "Meta Ads" if platform == "Meta Ads Library" else "Google Ads"
-                images = collect_ads(url, platform=platform_param, screenshot_count=screenshot_count)
-                if not images:
+                with live_preview.container():
+                    thumb_columns = st.columns(5)
+                    # Render each ad as soon as the scraper saves it
+                    for event in stream_ads(url, platform=platform_param, screenshot_count=screenshot_count,
+                                            capture_mode=capture_mode, new_only=new_only, budget=budget):
+                        if event.path:
+                            images.append(event.path)
+                        if event.kind in ("ad", "fallback") and len(images) <= LIVE_PREVIEW_LIMIT:
+                            with thumb_columns[(len(images) - 1) % len(thumb_columns)]:
+                                show_media(event.path)
+                        if event.kind == "ad":
+                            captured += 1
+                        if event.kind == "done":
+                            st.session_state["run_summary"] = event.summary
+                        message = event.message if event.kind == "status" else f"Captured {captured}/{screenshot_count} ads"
+                        progress.progress(min(1.0, captured / screenshot_count), text=message)
+                live_preview.empty()
+                progress.empty()
+                if not images and new_only:
+                    st.info("No new ads since the last run.")
+                elif not images:
                     st.error("No ads found or something went wrong.")
                 else:
-                    st.session_state["ad_images"] = images
+                    # Only complete, clean runs are worth serving to the next identical request
+                    partial = (st.session_state.get("run_summary") or {}).get("status") == "partial"
+                    if captured == len(images) and not new_only and not partial:
+                        get_result_cache().put(platform_param, query, query_region, screenshot_count, images,
+                                               cache_variant)
                     st.success(f"Captured {len(images)} ads!")
+                    if partial:
+                        st.info("The time budget ran out before the requested number of ads was reached.")
             except Exception as e:
                 st.error(f"An error occurred: {e}")
 
+def run_summary_panel(summary):
+    """Phase timings and counts traced for the last live collection"""
+    with st.expander("Run summary", expanded=False):
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Duration", f"{summary['seconds']:.1f} s")
+        col2.metric("Ads", summary["ads"])
+        col3.metric("WebDriver calls", summary["round_trips"])
+        col4.metric("Written", f"{summary['bytes_written'] / 1024 ** 2:.1f} MB")
+        phases = [{"phase": name, "seconds": round(phase["seconds"], 2), "calls": phase["calls"]}
+                  for name, phase in summary["phases"].items()]
+        st.dataframe(phases, use_container_width=True, hide_index=True)
+        st.caption(f"{summary['screenshots']} screenshots, {summary['crops']} crops, "
+                   f"{summary['fallbacks']} fallbacks, status {summary['status']} (run {summary['run_id']})")
+
+
+def load_job_results(job):
+    """Show a finished background job's ads, with this session's own store references"""
+    store = get_store()
+    images = [path for path in job.image_paths if store.retain(path)]
+    replace_session_images(images)
+    mark_job_seen(job)
+
+
+def mark_job_seen(job):
+    st.session_state["loaded_jobs"] = st.session_state.get("loaded_jobs", []) + [job.id]
+
+
+def pending_session_jobs():
+    seen = st.session_state.get("loaded_jobs", [])
+    return [job_id for job_id in st.session_state.get("queued_jobs", []) if job_id not in seen]
+
+
+def background_jobs_panel():
+    """Status of queued jobs; this session's jobs load into the gallery as they finish"""
+    queue = get_job_queue()
+    jobs = queue.recent(10)
+    if not jobs:
+        return
+    with st.expander("Background jobs", expanded=bool(st.session_state.get("queued_jobs"))):
+        st.dataframe([job.as_row() for job in jobs], use_container_width=True, hide_index=True)
+        finished = {f"#{job.id} {job.query} ({job.region})": job for job in jobs if job.finished and job.image_paths}
+        if finished:
+            choice = st.selectbox("Finished jobs", list(finished))
+            if st.button("Load results"):
+                load_job_results(finished[choice])
+                st.rerun()
+    for job in filter(None, map(queue.get, pending_session_jobs())):
+        if job.finished and job.image_paths:
+            load_job_results(job)
+            st.rerun()
+        elif job.finished:
+            mark_job_seen(job)
+            st.warning(f"Background job #{job.id} finished without ads ({job.status}). {job.error or ''}")
+
+
+if mode == "Single search" and st.session_state.get("run_summary"):
+    run_summary_panel(st.session_state["run_summary"])
+
+# Poll while this session has jobs in flight (fragments only rerun the panel itself)
+if pending_session_jobs() and hasattr(st, "fragment"):
+    background_jobs_panel = st.fragment(run_every=3)(background_jobs_panel)
+background_jobs_panel()
+
+with st.sidebar.expander("Result cache", expanded=False):
+    cache_stats = get_result_cache().stats()
+    st.metric("Hit rate", f"{cache_stats['hit_rate']:.0%}")
+    st.caption(f"{cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} cached searches")
+
+with st.sidebar.expander("Ad selectors", expanded=False):
+    selector_stats = get_selector_cache().stats()
+    st.metric("First-try hit rate", f"{selector_stats['hit_rate']:.0%}")
+    st.caption(f"{selector_stats['hits']} hits, {selector_stats['misses']} misses, "
+               f"{selector_stats['failures']} pages without ads")
+    for winner in selector_stats["winners"][:5]:
+        st.caption(f"{winner['platform']}: `{winner['selector']}` ({winner['wins']} wins)")
+
 # Step 4: Preview + Select
 if "ad_images" in st.session_state:
     selected_images = display_images(st.session_state["ad_images"])
 
     # Step 5: Download ZIP
     if selected_images:
-        zip_path = zip_images(selected_images)
-        with open(zip_path, "rb") as f:
-            st.download_button("📦 Download Selected Ads as ZIP", f, file_name="ads_selected.zip")
+        zip_download_button(selected_images, file_name="ads_selected.zip")
     else:
         st.warning("No images selected to download.")
\ No newline at end of file
@@ -0,0 +1,216 @@
+"""
+Request blocking and per-page network budgets through DevTools
+
+Ad library pages pull in analytics beacons, web fonts and autoplay video
+that the screenshots never need. `NetworkMonitor.start` blocks them with
+`Network.setBlockedURLs` using a per-platform preset, and the Chrome
+performance log (`goog:loggingPrefs`) is read back to count requests,
+transferred bytes and blocked requests. When a page goes over its byte or
+request budget, loading is stopped and collectors stop scrolling for more.
+The budget grows with the number of ads a run asks for, so a large run is
+not cut off after its first few pages.
+"""
+import os
+import json
+from fnmatch import fnmatch
+
+
+# Patterns use setBlockedURLs wildcards ("*" matches anything)
+ANALYTICS_PATTERNS = [
+    "*google-analytics.com/*",
+    "*googletagmanager.com/*",
+    "*/gen_204*",
+    "*play.google.com/log*",
+    "*facebook.com/tr/*",
+    "*facebook.com/tr?*",
+    "*connect.facebook.net/*",
+    "*/ajax/bz*",
+    "*facebook.com/security/hsts-pixel*",
+]
+FONT_PATTERNS = [
+    "*fonts.gstatic.com/*",
+    "*fonts.googleapis.com/*",
+    "*.woff2*",
+    "*.woff",
+    "*.ttf",
+]
+# Video bodies; poster frames still render, which is all a screenshot shows
+MEDIA_PATTERNS = [
+    "*.mp4*",
+    "*.webm*",
+    "*.m3u8*",
+]
+
+PRESETS = {
+    "google": ANALYTICS_PATTERNS + FONT_PATTERNS,
+    "meta": ANALYTICS_PATTERNS + FONT_PATTERNS + MEDIA_PATTERNS,
+    "off": [],
+}
+
+BLOCK_PRESET = os.environ.get("ADSPY_BLOCK_PRESET", "")  # "off" disables blocking
+EXTRA_BLOCKED_URLS = [p for p in os.environ.get("ADSPY_BLOCK_URLS", "").split(",") if p.strip()]
+# Globs matched against the blocklist; matching patterns are not blocked
+ALLOWED_URLS = [p for p in os.environ.get("ADSPY_ALLOW_URLS", "").split(",") if p.strip()]
+
+# Budget for a page asked for up to PAGE_BUDGET_ADS ads; pages asked for more get proportionally more
+PAGE_MAX_BYTES = int(float(os.environ.get("ADSPY_PAGE_MAX_MB", "40")) * 1024 * 1024)
+PAGE_MAX_REQUESTS = int(os.environ.get("ADSPY_PAGE_MAX_REQUESTS", "800"))
+PAGE_BUDGET_ADS = int(os.environ.get("ADSPY_PAGE_BUDGET_ADS", "50"))
+
+# Typical transfer sizes used to estimate savings for types we never saw load
+DEFAULT_RESOURCE_BYTES = {
+    "Script": 60_000,
+    "Font": 40_000,
+    "Image": 30_000,
+    "Media": 500_000,
+    "Stylesheet": 20_000,
+}
+OTHER_RESOURCE_BYTES = 2_000
+
+
+def blocklist_for(platform, preset=None, extra=None, allow=None):
+    """Block patterns for a platform ("google" or "meta"), minus anything allowlisted"""
+    preset = preset or BLOCK_PRESET or platform
+    patterns = PRESETS.get(preset, PRESETS.get(platform, [])) + list(EXTRA_BLOCKED_URLS if extra is None else extra)
+    allow = ALLOWED_URLS if allow is None else allow
+    return [p.strip() for p in patterns if not any(fnmatch(p.strip(), a.strip()) for a in allow)]
+
+
+def page_budget(ad_count=None):
+    """(max bytes, max requests) for a page expected to yield `ad_count` ads; 0 means unlimited"""
+    scale = max(1.0, (ad_count or 0) / PAGE_BUDGET_ADS) if PAGE_BUDGET_ADS > 0 else 1.0
+    return int(PAGE_MAX_BYTES * scale), int(PAGE_MAX_REQUESTS * scale)
+
+
+def enable_performance_log(options):
+    """Ask ChromeDriver to keep the DevTools network events NetworkMonitor reads"""
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+
+class NetworkMonitor:
+    """Applies a platform's blocklist to a driver and tracks traffic for one page load"""
+
+    def __init__(self, driver, platform, max_bytes=None, max_requests=None, keep_media=False, buffer_bytes=0,
+                 ad_count=None):
+        self.driver = driver
+        self.platform = platform
+        default_bytes, default_requests = page_budget(ad_count)
+        self.max_bytes = default_bytes if max_bytes is None else max_bytes
+        self.max_requests = default_requests if max_requests is None else max_requests
+        # Harvesting original creatives needs video bodies and a response buffer to read them from
+        self.blocked_patterns = [p for p in blocklist_for(platform) if not (keep_media and p in MEDIA_PATTERNS)]
+        self.buffer_bytes = buffer_bytes
+        self.listeners = []
+        self.requests = 0
+        self.bytes = 0
+        self.blocked = 0
+        self.blocked_by_type = {}
+        self.over_budget = False
+        self.enabled = True
+        self._types = {}
+        self._sizes = {}
+
+    def start(self):
+        """Enable the blocklist and discard log entries left over from the previous run"""
+        try:
+            params = {}
+            if self.buffer_bytes:
+                params = {"maxTotalBufferSize": self.buffer_bytes, "maxResourceBufferSize": self.buffer_bytes // 4}
+            self.driver.execute_cdp_cmd("Network.enable", params)
+            self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self.blocked_patterns})
+        except Exception as e:
+            print(f"Could not apply request blocklist: {e}")
+        try:
+            self.driver.get_log("performance")
+        except Exception as e:
+            # No performance log capability on this driver: blocking still works, accounting doesn't
+            print(f"Network accounting unavailable: {e}")
+            self.enabled = False
+        return self
+
+    def poll(self):
+        """
+        Read new DevTools events from the performance log and update the counters
+
+        Returns:
+            List of (method, params) for the Network events read; the same
+            events are also passed to every callable in `listeners`
+        """
+        if not self.enabled:
+            return []
+        try:
+            entries = self.driver.get_log("performance")
+        except Exception as e:
+            print(f"Could not read performance log: {e}")
+            return []
+
+        events = []
+        for entry in entries:
+            try:
+                message = json.loads(entry["message"])["message"]
+            except (KeyError, TypeError, ValueError):
+                continue
+            method = message.get("method", "")
+            if not method.startswith("Network."):
+                continue
+            params = message.get("params", {})
+            events.append((method, params))
+            self._account(method, params)
+            for listener in self.listeners:
+                listener(method, params)
+
+        if not self.over_budget and (
+            (self.max_bytes and self.bytes > self.max_bytes) or
+            (self.max_requests and self.requests > self.max_requests)
+        ):
+            self.over_budget = True
+            print(f"Page over network budget ({self.requests} requests, {self.bytes / 1024 / 1024:.1f} MB), "
+                  "stopping further loading")
+            try:
+                self.driver.execute_cdp_cmd("Page.stopLoading", {})
+            except Exception:
+                pass
+        return events
+
+    def _account(self, method, params):
+        request_id = params.get("requestId")
+        if method == "Network.requestWillBeSent":
+            self.requests += 1
+            self._types[request_id] = params.get("type", "Other")
+        elif method == "Network.responseReceived":
+            self._types[request_id] = params.get("type", self._types.get(request_id, "Other"))
+        elif method == "Network.loadingFinished":
+            size = int(params.get("encodedDataLength") or 0)
+            self.bytes += size
+            count, total = self._sizes.get(self._types.get(request_id, "Other"), (0, 0))
+            self._sizes[self._types.get(request_id, "Other")] = (count + 1, total + size)
+        elif method == "Network.loadingFailed" and params.get("blockedReason"):
+            self.blocked += 1
+            kind = params.get("type") or self._types.get(request_id, "Other")
+            self.blocked_by_type[kind] = self.blocked_by_type.get(kind, 0) + 1
+
+    def estimated_bytes_saved(self):
+        """Blocked requests times the average size of loaded requests of the same type"""
+        saved = 0
+        for kind, count in self.blocked_by_type.items():
+            loaded, total = self._sizes.get(kind, (0, 0))
+            average = total / loaded if loaded else DEFAULT_RESOURCE_BYTES.get(kind, OTHER_RESOURCE_BYTES)
+            saved += count * average
+        return int(saved)
+
+    def summary(self):
+        return {
+            "requests": self.requests,
+            "bytes": self.bytes,
+            "blocked": self.blocked,
+            "blocked_by_type": dict(self.blocked_by_type),
+            "bytes_saved_estimate": self.estimated_bytes_saved(),
+            "over_budget": self.over_budget,
+        }
+
+    def report(self):
+        """One-line summary for logs and status events"""
+        self.poll()
+        return (f"Network: {self.requests} requests, {self.bytes / 1024 / 1024:.1f} MB loaded, "
+                f"{self.blocked} blocked (~{self.estimated_bytes_saved() / 1024 / 1024:.1f} MB saved)"
+                + (", over budget" if self.over_budget else ""))
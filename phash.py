@@ -0,0 +1,242 @@
+"""
+Perceptual hashing and near-duplicate detection for ad screenshots
+
+Hashes are computed for whole batches of images at once with NumPy (dHash
+by default, pHash optional) over a 16x16 grid and packed into rows of four
+64-bit words. A Hamming distance index compares a new hash against every
+stored one in a single vectorized XOR + popcount, so the same creative
+captured at a different scroll offset, size or compression is recognised
+as a duplicate. The grid is fine enough to tell apart text ads that share
+a layout; ads whose library/creative IDs are known and differ are never
+merged, however close their hashes.
+"""
+import os
+import threading
+import numpy as np
+from PIL import Image
+
+
+# Max differing bits (out of HASH_SIZE ** 2 = 256) for two images to count as the same creative;
+# rescaled or recompressed copies stay within about 7, same-layout text ads with different copy are 11+ apart
+DEFAULT_THRESHOLD = int(os.environ.get("ADSPY_DEDUPE_THRESHOLD", "8"))
+HASH_SIZE = 16
+HASH_WORDS = HASH_SIZE * HASH_SIZE // 64
+
+# Popcount lookup for NumPy versions without np.bitwise_count
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_BIT_WEIGHTS = (1 << np.arange(63, -1, -1, dtype=np.uint64)).astype(np.uint64)
+
+
+def _grayscale_batch(images, width, height):
+    """Stack images into an (N, height, width) float array of downscaled grayscale pixels"""
+    pixels = np.empty((len(images), height, width), dtype=np.float32)
+    for n, image in enumerate(images):
+        if isinstance(image, str):
+            with Image.open(image) as opened:
+                small = opened.convert("L").resize((width, height), Image.BILINEAR)
+        else:
+            small = image.convert("L").resize((width, height), Image.BILINEAR)
+        pixels[n] = np.asarray(small, dtype=np.float32)
+    return pixels
+
+
+def _pack(bits):
+    """(N, 64 * W) boolean array -> (N, W) uint64 hashes"""
+    words = bits.reshape(len(bits), -1, 64).astype(np.uint64)
+    return (words * _BIT_WEIGHTS).sum(axis=2, dtype=np.uint64)
+
+
+def hash_to_hex(value):
+    """One hash row as a hex string (how the ad index stores it)"""
+    return "".join(format(int(word), "016x") for word in value)
+
+
+def hash_from_hex(text):
+    """Inverse of hash_to_hex; None for hashes of another size"""
+    if not text or len(text) != HASH_WORDS * 16:
+        return None
+    return np.array([int(text[i:i + 16], 16) for i in range(0, len(text), 16)], dtype=np.uint64)
+
+
+def dhash_batch(images, hash_size=HASH_SIZE):
+    """Difference hashes of PIL images (or paths) as an (N, words) uint64 array"""
+    if not len(images):
+        return np.empty((0, hash_size * hash_size // 64), dtype=np.uint64)
+    pixels = _grayscale_batch(images, hash_size + 1, hash_size)
+    bits = pixels[:, :, 1:] > pixels[:, :, :-1]
+    return _pack(bits.reshape(len(images), -1))
+
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def phash_batch(images, hash_size=HASH_SIZE):
+    """DCT-based perceptual hashes of PIL images (or paths) as an (N, words) uint64 array"""
+    if not len(images):
+        return np.empty((0, hash_size * hash_size // 64), dtype=np.uint64)
+    pixels = _grayscale_batch(images, 32, 32)
+    # 2D DCT of every image at once: D @ X @ D.T
+    dct = np.einsum("ij,njk,lk->nil", _DCT32, pixels, _DCT32)[:, :hash_size, :hash_size]
+    flat = dct.reshape(len(images), -1)
+    # Median of the low frequencies, excluding the DC term
+    medians = np.median(flat[:, 1:], axis=1, keepdims=True)
+    return _pack(flat > medians)
+
+
+HASHERS = {"dhash": dhash_batch, "phash": phash_batch}
+
+
+def hamming_distances(hashes, value):
+    """Bit distance between the hash `value` and every row of the (N, words) uint64 array `hashes`"""
+    diff = np.ascontiguousarray(np.bitwise_xor(hashes, np.asarray(value, dtype=np.uint64)))
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(diff).sum(axis=1, dtype=np.int64)
+    return _POPCOUNT8[diff.view(np.uint8)].reshape(len(diff), -1).sum(axis=1, dtype=np.int64)
+
+
+class HammingIndex:
+    """Growable array of hashes with vectorized distance lookup"""
+
+    def __init__(self, capacity=256, words=HASH_WORDS):
+        self._hashes = np.empty((capacity, words), dtype=np.uint64)
+        self._size = 0
+        self.keys = []
+
+    def __len__(self):
+        return self._size
+
+    def add(self, value, key=None):
+        if self._size == len(self._hashes):
+            self._hashes = np.concatenate([self._hashes, np.empty_like(self._hashes)])
+        self._hashes[self._size] = value
+        self._size += 1
+        self.keys.append(key)
+
+    def nearest(self, value):
+        """(distance, key) of the closest stored hash, or (None, None) when empty"""
+        if not self._size:
+            return None, None
+        distances = hamming_distances(self._hashes[:self._size], value)
+        best = int(np.argmin(distances))
+        return int(distances[best]), self.keys[best]
+
+    def within(self, value, threshold):
+        """Keys of every stored hash at most `threshold` bits from `value`"""
+        if not self._size:
+            return []
+        distances = hamming_distances(self._hashes[:self._size], value)
+        return [self.keys[i] for i in np.flatnonzero(distances <= threshold)]
+
+
+class NearDuplicateFilter:
+    """
+    Remembers the creatives seen so far and flags near-duplicates
+
+    Thread-safe, so one filter can be shared by a collector and its crop pool.
+    A negative threshold disables filtering. Images can come with the ad's
+    library/creative ID: two captures whose IDs are both known and differ are
+    different ads, and never count as duplicates of each other.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, method="dhash"):
+        self.threshold = threshold
+        self.hasher = HASHERS[method]
+        self.index = HammingIndex()
+        self.duplicates = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.threshold >= 0
+
+    def check(self, images, ad_ids=None):
+        """
+        Hash a batch of images and check them against everything seen so far (and each other)
+
+        Args:
+            images: PIL images (or paths)
+            ad_ids: Optional ad ID per image (None where unknown)
+
+        Returns:
+            List of (is_new, hash) per image; new images are added to the
+            index. Images are hashed even with filtering disabled, so the
+            caller can keep the hash (e.g. for the ad index)
+        """
+        if not images:
+            return []
+        hashes = self.hasher(images)
+        if not self.enabled:
+            return [(True, value) for value in hashes]
+        ad_ids = ad_ids or [None] * len(images)
+        results = []
+        with self._lock:
+            for value, ad_id in zip(hashes, ad_ids):
+                matches = self.index.within(value, self.threshold)
+                if any(not (ad_id and other and other != ad_id) for other in matches):
+                    self.duplicates += 1
+                    results.append((False, value))
+                else:
+                    self.index.add(value, ad_id)
+                    results.append((True, value))
+        return results
+
+    def filter(self, images, ad_ids=None):
+        """
+        Check a batch of images, see check()
+
+        Returns:
+            List of booleans, True for images that are new
+        """
+        if not self.enabled or not images:
+            return [True] * len(images)
+        return [is_new for is_new, _ in self.check(images, ad_ids)]
+
+    def seed(self, hashes, ad_ids=None):
+        """Treat previously captured hashes (e.g. from the ad index) as already seen"""
+        ad_ids = ad_ids or [None] * len(hashes)
+        with self._lock:
+            for value, ad_id in zip(hashes, ad_ids):
+                self.index.add(value, ad_id)
+
+    def is_new(self, image, ad_id=None):
+        return self.filter([image], [ad_id])[0]
+
+
+def dedupe_paths(paths, threshold=DEFAULT_THRESHOLD, method="dhash", batch_size=64, dedupe=None):
+    """
+    Drop near-duplicate image files, keeping the first occurrence
+
+    Args:
+        dedupe: NearDuplicateFilter to check against (and add to), so several
+            calls can share what they have seen; a fresh one by default
+
+    Returns:
+        (kept_paths, duplicate_paths)
+    """
+    dedupe = dedupe or NearDuplicateFilter(threshold, method)
+    kept, duplicates = [], []
+    for start in range(0, len(paths), batch_size):
+        entries = []
+        for path in paths[start:start + batch_size]:
+            # Error reports and unreadable files pass through untouched
+            try:
+                with Image.open(path) as image:
+                    image.load()
+                    entries.append((path, image.copy()))
+            except Exception:
+                entries.append((path, None))
+        readable = [(path, image) for path, image in entries if image is not None]
+        flags = iter(dedupe.filter([image for _, image in readable]))
+        for path, image in entries:
+            if image is None or next(flags):
+                kept.append(path)
+            else:
+                duplicates.append(path)
+    return kept, duplicates
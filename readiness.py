@@ -0,0 +1,198 @@
+"""
+Event-driven readiness checks used instead of fixed time.sleep calls
+
+Each wait runs as a single async script inside the page, polling a condition
+until it holds or its timeout expires, so a wait costs one WebDriver round
+trip and returns as soon as the content is actually ready. Every wait returns
+True when the condition was met and False on timeout; callers carry on either
+way, exactly as they did after a fixed sleep.
+"""
+from selenium.common.exceptions import WebDriverException
+
+
+# Installs mutation and network trackers once per document. It is registered
+# to run before page scripts on every navigation, and is also prepended to
+# each wait so documents loaded before registration are still covered.
+TRACKER_JS = """
+(function () {
+  if (window.__adspyReadiness) return;
+  var now = function () { return performance.now(); };
+  var state = window.__adspyReadiness = {lastMutation: now(), lastNetwork: now(), inflight: 0};
+  try {
+    new MutationObserver(function () { state.lastMutation = now(); })
+      .observe(document, {childList: true, subtree: true, characterData: true});
+  } catch (e) {}
+  try {
+    new PerformanceObserver(function () { state.lastNetwork = now(); }).observe({type: 'resource'});
+  } catch (e) {}
+  var begin = function () { state.inflight++; state.lastNetwork = now(); };
+  var end = function () { state.inflight = Math.max(0, state.inflight - 1); state.lastNetwork = now(); };
+  if (window.fetch) {
+    var origFetch = window.fetch;
+    window.fetch = function () {
+      begin();
+      return origFetch.apply(this, arguments).finally(end);
+    };
+  }
+  if (window.XMLHttpRequest) {
+    var origSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+      begin();
+      this.addEventListener('loadend', end);
+      return origSend.apply(this, arguments);
+    };
+  }
+})();
+"""
+
+_POLL_JS = TRACKER_JS + """
+var done = arguments[arguments.length - 1];
+var timeoutMs = arguments[0];
+var params = Array.prototype.slice.call(arguments, 1, -1);
+var state = window.__adspyReadiness;
+var deadline = performance.now() + timeoutMs;
+%(prelude)s
+var check = function (%(params)s) { %(body)s };
+(function poll() {
+  var ok = false;
+  try { ok = check.apply(null, params); } catch (e) {}
+  if (ok) return done(ok);
+  if (performance.now() >= deadline) return done(false);
+  setTimeout(poll, %(interval)d);
+})();
+"""
+
+_DOM_QUIET = "return performance.now() - state.lastMutation >= quietMs;"
+
+_NETWORK_IDLE = "return state.inflight <= 0 && performance.now() - state.lastNetwork >= idleMs;"
+
+_SETTLED = (
+    "return state.inflight <= 0 && performance.now() - state.lastNetwork >= idleMs"
+    " && performance.now() - state.lastMutation >= quietMs;"
+)
+
+_PAGE_READY = (
+    "return document.readyState === 'complete' && state.inflight <= 0"
+    " && performance.now() - state.lastNetwork >= idleMs"
+    " && performance.now() - state.lastMutation >= quietMs;"
+)
+
+# Position must stay put for a few consecutive polls (smooth scrolling moves every frame)
+_SCROLL_PRELUDE = "var lastX = null, lastY = null, stable = 0;"
+_SCROLL_END = """
+var x = window.scrollX, y = window.scrollY;
+if (x === lastX && y === lastY) { stable++; } else { stable = 0; lastX = x; lastY = y; }
+return stable >= 3;
+"""
+
+# Only media intersecting the viewport counts; lazy media further away never loads
+_MEDIA_DECODED = """
+var scope = root || document;
+var vh = window.innerHeight, vw = window.innerWidth;
+var media = scope.querySelectorAll('img, video');
+for (var i = 0; i < media.length; i++) {
+  var el = media[i];
+  var r = el.getBoundingClientRect();
+  if (r.width === 0 || r.height === 0 || r.bottom < 0 || r.top > vh || r.right < 0 || r.left > vw) continue;
+  if (el.tagName === 'VIDEO') {
+    if (el.poster || el.preload === 'none') continue;
+    if (el.readyState < 2) return false;
+  } else if (!el.complete) {
+    return false;
+  }
+}
+return true;
+"""
+
+
+def install_trackers(driver):
+    """Register the readiness trackers to run before page scripts on every navigation"""
+    if getattr(driver, "_adspy_trackers_installed", False):
+        return
+    try:
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": TRACKER_JS})
+        driver._adspy_trackers_installed = True
+    except Exception as e:
+        # Waits still inject the trackers themselves, just later in the page's life
+        print(f"Could not register readiness trackers: {e}")
+
+
+def _poll(driver, body, timeout, params=(), args=(), prelude="", interval=50):
+    """Run a polling wait and return the condition's last value (False on timeout)"""
+    script = _POLL_JS % {
+        "prelude": prelude,
+        "params": ", ".join(params),
+        "body": body,
+        "interval": interval,
+    }
+    try:
+        return driver.execute_async_script(script, int(timeout * 1000), *args)
+    except WebDriverException as e:
+        # Navigation mid-wait or a script timeout: treat as not ready and move on
+        print(f"Readiness wait aborted: {e.msg}")
+        return False
+
+
+def _wait(driver, body, timeout, params=(), args=(), prelude="", interval=50):
+    return bool(_poll(driver, body, timeout, params, args, prelude, interval))
+
+
+# First selector (in the given order) that matches anything; index + 1 so a match is truthy
+_ANY_SELECTOR = """
+for (var i = 0; i < selectors.length; i++) {
+  try { if (document.querySelector(selectors[i])) return i + 1; } catch (e) {}
+}
+return false;
+"""
+
+
+def wait_for_any_selector(driver, selectors, timeout=10):
+    """
+    Wait for any of `selectors` to match, all polled together in one round trip
+
+    Returns:
+        The first selector in `selectors` that matched on the earliest poll
+        with a match, or None on timeout
+    """
+    selectors = list(selectors)
+    found = _poll(driver, _ANY_SELECTOR, timeout, params=["selectors"], args=[selectors])
+    if isinstance(found, bool) or not found:
+        return None
+    return selectors[int(found) - 1]
+
+
+def wait_for_dom_quiet(driver, quiet_ms=500, timeout=10):
+    """Wait until no DOM mutations have happened for `quiet_ms`"""
+    return _wait(driver, _DOM_QUIET, timeout, params=["quietMs"], args=[quiet_ms])
+
+
+def wait_for_network_idle(driver, idle_ms=500, timeout=15):
+    """Wait until no fetch/XHR is in flight and no resource finished for `idle_ms`"""
+    return _wait(driver, _NETWORK_IDLE, timeout, params=["idleMs"], args=[idle_ms])
+
+
+def wait_for_page_ready(driver, idle_ms=500, quiet_ms=500, timeout=20):
+    """Wait for document load, network idle and DOM quiescence together"""
+    return _wait(driver, _PAGE_READY, timeout, params=["idleMs", "quietMs"], args=[idle_ms, quiet_ms])
+
+
+def wait_for_scroll_end(driver, timeout=3):
+    """Wait until the window scroll position stops moving"""
+    return _wait(driver, _SCROLL_END, timeout, prelude=_SCROLL_PRELUDE)
+
+
+def wait_for_media(driver, element=None, timeout=5):
+    """Wait until visible images (and videos) inside `element` have loaded"""
+    return _wait(driver, _MEDIA_DECODED, timeout, params=["root"], args=[element])
+
+
+def wait_for_element_ready(driver, element, timeout=5):
+    """Wait for a scrollIntoView to finish and the element's media to be decoded"""
+    body = "if (!(function () {" + _SCROLL_END + "})()) return false;" + _MEDIA_DECODED
+    return _wait(driver, body, timeout, params=["root"], args=[element], prelude=_SCROLL_PRELUDE)
+
+
+def wait_for_scroll_settle(driver, idle_ms=400, quiet_ms=400, timeout=8):
+    """After scrolling a feed: wait for the scroll to end and lazy content to land"""
+    wait_for_scroll_end(driver, timeout=min(timeout, 3))
+    return _wait(driver, _SETTLED, timeout, params=["idleMs", "quietMs"], args=[idle_ms, quiet_ms])
@@ -0,0 +1,160 @@
+"""
+Result cache for identical collection requests
+
+Collections are keyed on the normalized (platform, query, region); an entry
+remembers how many ads were requested, so a cached run of 20 ads also
+serves a later request for 5. Entries expire after a TTL and the least
+recently used ones are evicted beyond a size cap. The index lives in one
+SQLite file so it is shared by sessions and batch workers and survives
+restarts; the screenshots themselves stay in the content store, where the
+cache holds a reference to each so they are not evicted underneath it.
+"""
+import os
+import re
+import json
+import time
+from settings import cache_path, ProcessWide, ThreadConnections
+from storage import get_store
+
+
+RESULT_CACHE_TTL = float(os.environ.get("ADSPY_RESULT_CACHE_TTL", str(6 * 3600)))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("ADSPY_RESULT_CACHE_MAX_ENTRIES", "500"))
+
+# Meta's country code for the UK is GB, the scraper sends UK
+REGION_ALIASES = {"meta": {"UK": "GB"}}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    requested INTEGER NOT NULL,
+    paths TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def normalize_key(platform, query, region, variant=""):
+    """Canonical cache key: "nike.com", "https://www.Nike.com/" and " NIKE.COM " are the same search;
+    `variant` separates different kinds of output for the same search (e.g. harvested assets)"""
+    platform = "google" if platform.lower().startswith("google") else "meta"
+    query = " ".join(query.lower().split())
+    if platform == "google":
+        query = re.sub(r"^[a-z]+://", "", query)
+        query = re.sub(r"^www\.", "", query).rstrip("/")
+    region = region.strip().upper()
+    region = REGION_ALIASES.get(platform, {}).get(region, region)
+    key = f"{platform}|{region}|{query}"
+    return f"{key}|{variant}" if variant else key
+
+
+class ResultCache:
+    """TTL + LRU cache of collected screenshot paths in a single SQLite file"""
+
+    def __init__(self, path=None, ttl=RESULT_CACHE_TTL, max_entries=RESULT_CACHE_MAX_ENTRIES, store=None):
+        self.path = path or cache_path("results.sqlite3")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.store = store or get_store()
+        self._db = ThreadConnections(self.path)
+        with self._db() as db:
+            db.executescript(SCHEMA)
+
+    def get(self, platform, query, region, screenshot_count, variant=""):
+        """
+        Cached screenshots for a request, or None on a miss
+
+        A hit takes a fresh store reference on every returned path, exactly
+        like a new capture would, so callers release them the same way.
+        """
+        key = normalize_key(platform, query, region, variant)
+        db = self._db()
+        row = db.execute("SELECT requested, paths, created_at FROM results WHERE key = ?", (key,)).fetchone()
+        paths = None
+        # Usable only if fresh and collected for at least as many ads as asked for
+        if row and row[0] >= screenshot_count and (not self.ttl or time.time() - row[2] < self.ttl):
+            paths = json.loads(row[1])[:screenshot_count]
+            if not all(os.path.exists(path) for path in paths):
+                paths = None
+
+        if paths is None:
+            self._count("misses")
+            return None
+        for path in paths:
+            self.store.retain(path)
+        with db:
+            db.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._count("hits")
+        return paths
+
+    def put(self, platform, query, region, screenshot_count, paths, variant=""):
+        """Remember the screenshots a collection returned, replacing any older entry"""
+        if not paths:
+            return
+        key = normalize_key(platform, query, region, variant)
+        paths = [path for path in paths if self.store.retain(path)]
+        now = time.time()
+        db = self._db()
+        with db:
+            old = db.execute("SELECT paths FROM results WHERE key = ?", (key,)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO results (key, requested, paths, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, screenshot_count, json.dumps(paths), now, now),
+            )
+        if old:
+            self._release(json.loads(old[0]))
+        self.evict()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used beyond `max_entries`"""
+        db = self._db()
+        doomed = []
+        if self.ttl:
+            doomed += db.execute(
+                "SELECT key, paths FROM results WHERE created_at < ?", (time.time() - self.ttl,)
+            ).fetchall()
+        if self.max_entries:
+            doomed += db.execute(
+                "SELECT key, paths FROM results WHERE created_at >= ? ORDER BY last_access DESC LIMIT -1 OFFSET ?",
+                (time.time() - self.ttl if self.ttl else 0, self.max_entries),
+            ).fetchall()
+        if not doomed:
+            return 0
+        with db:
+            db.executemany("DELETE FROM results WHERE key = ?", [(key,) for key, _ in doomed])
+        for _, paths in doomed:
+            self._release(json.loads(paths))
+        return len(doomed)
+
+    def stats(self):
+        db = self._db()
+        counters = dict(db.execute("SELECT name, value FROM counters").fetchall())
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "entries": db.execute("SELECT COUNT(*) FROM results").fetchone()[0],
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+        }
+
+    def _count(self, name):
+        with self._db() as db:
+            db.execute(
+                "INSERT INTO counters (name, value) VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                (name,),
+            )
+
+    def _release(self, paths):
+        for path in paths:
+            try:
+                self.store.release(path)
+            except Exception:
+                pass
+
+
+get_result_cache = ProcessWide(ResultCache)
@@ -0,0 +1,60 @@
+import os
+import sqlite3
+import threading
+
+
+# Root for state that should survive restarts (manifests, caches, indexes)
+CACHE_DIR = os.environ.get("ADSPY_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "adspy"))
+
+
+def cache_path(*parts):
+    """Path inside the adspy cache directory, creating parent folders on demand"""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+class ThreadConnections:
+    """
+    Per-thread SQLite connections to one database file
+
+    Calling it returns the current thread's connection, opened on first use:
+    sqlite3 connections must not be shared across threads. WAL mode lets
+    parallel workers read while one writes. Extra keyword arguments go to
+    sqlite3.connect.
+    """
+
+    def __init__(self, path, **kwargs):
+        self.path = path
+        self.kwargs = kwargs
+        self._local = threading.local()
+
+    def __call__(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, **self.kwargs)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+
+class ProcessWide:
+    """
+    One lazily created instance of `factory` for the whole process
+
+    Calling it returns the instance, creating it on first use; the
+    module-level get_x() accessors (get_store, get_job_queue, ...) are
+    ProcessWide objects. Tests swap in their own by setting `instance`.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.instance = None
+        self._lock = threading.Lock()
+        self.__doc__ = f"Process-wide {factory.__name__}"
+
+    def __call__(self):
+        with self._lock:
+            if self.instance is None:
+                self.instance = self.factory()
+            return self.instance
@@ -0,0 +1,216 @@
+"""
+Content-addressed screenshot store
+
+Captures are saved under their SHA-256 in a sharded directory
+(`objects/ab/cd/<hash>.png`), written to a temp file and renamed into place
+so readers never see partial files and concurrent sessions never clobber
+each other. Identical creatives are stored once; a small SQLite index keeps
+reference counts and access times for size- and age-based eviction. A write
+takes its reference in the same SQLite transaction as its existence check,
+and eviction only deletes blobs that are still unreferenced when it gets to
+them, so a blob being stored can never be evicted out from under its writer.
+"""
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from settings import CACHE_DIR, ProcessWide, ThreadConnections
+from tracing import count
+
+
+STORE_DIR = os.environ.get("ADSPY_STORE_DIR", os.path.join(CACHE_DIR, "store"))
+MAX_STORE_BYTES = int(os.environ.get("ADSPY_STORE_MAX_BYTES", str(2 * 1024 ** 3)))
+MAX_STORE_AGE = float(os.environ.get("ADSPY_STORE_MAX_AGE_DAYS", "7")) * 86400
+
+# Run eviction after this many new blobs rather than on every write
+EVICT_EVERY = 200
+CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    refs INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+)
+"""
+
+
+class ContentStore:
+    """Deduplicating, atomically written file store keyed by content hash"""
+
+    def __init__(self, root=STORE_DIR, max_bytes=MAX_STORE_BYTES, max_age=MAX_STORE_AGE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._objects = os.path.join(root, "objects")
+        self._tmp = os.path.join(root, "tmp")
+        os.makedirs(self._objects, exist_ok=True)
+        os.makedirs(self._tmp, exist_ok=True)
+        self._db = ThreadConnections(os.path.join(root, "index.sqlite3"))
+        self._writes_since_evict = 0
+        self._writes_lock = threading.Lock()
+        with self._db() as db:
+            db.execute(SCHEMA)
+
+    def path_for(self, digest, ext):
+        """Sharded location of a blob: objects/ab/cd/<digest><ext>"""
+        return os.path.join(self._objects, digest[:2], digest[2:4], digest + ext)
+
+    @staticmethod
+    def hash_of(path):
+        """Content hash of a stored path (the file name), or of any file's bytes"""
+        name = os.path.basename(path).split(".")[0]
+        if len(name) == 64 and all(c in "0123456789abcdef" for c in name):
+            return name
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def put_bytes(self, data, ext=".png"):
+        """Store `data` and return its path; identical content is written only once"""
+        def write(path):
+            fd, tmp_path = tempfile.mkstemp(dir=self._tmp)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                self._publish(tmp_path, path)
+            except BaseException:
+                _remove(tmp_path)
+                raise
+            count("bytes_written", len(data))
+
+        return self._put(hashlib.sha256(data).hexdigest(), ext, len(data), write)
+
+    def retain(self, path):
+        """Add a reference to an already stored file; False if it is no longer there"""
+        digest = self.hash_of(path)
+        db = self._db()
+        with db:
+            # Under the write lock, so eviction cannot remove the file between the check and the update
+            db.execute("BEGIN IMMEDIATE")
+            if not os.path.exists(path):
+                return False
+            updated = db.execute(
+                "UPDATE blobs SET refs = refs + 1, last_access = ? WHERE hash = ?", (time.time(), digest)
+            ).rowcount
+        return updated > 0
+
+    def release(self, path):
+        """Drop one reference to a stored file; unreferenced files become evictable"""
+        digest = self.hash_of(path)
+        with self._db() as db:
+            db.execute("UPDATE blobs SET refs = MAX(0, refs - 1) WHERE hash = ?", (digest,))
+
+    def release_all(self, paths):
+        """Drop one reference per path (repeats count), skipping files that are already gone"""
+        digests = []
+        for path in paths:
+            try:
+                digests.append((self.hash_of(path),))
+            except OSError:
+                pass
+        if digests:
+            with self._db() as db:
+                db.executemany("UPDATE blobs SET refs = MAX(0, refs - 1) WHERE hash = ?", digests)
+
+    def stats(self):
+        row = self._db().execute("SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(refs), 0) FROM blobs").fetchone()
+        return {"blobs": row[0], "bytes": row[1], "references": row[2]}
+
+    def evict(self, max_bytes=None, max_age=None):
+        """
+        Delete unreferenced blobs untouched for longer than `max_age` seconds,
+        then more unreferenced blobs, oldest access first, until the store
+        fits `max_bytes`; referenced blobs are never removed
+
+        Returns:
+            Number of files removed
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age = self.max_age if max_age is None else max_age
+        db = self._db()
+        doomed = []
+        if max_age:
+            doomed += db.execute(
+                "SELECT hash, ext, size FROM blobs WHERE refs <= 0 AND last_access < ?", (time.time() - max_age,)
+            ).fetchall()
+
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        total -= sum(size for _, _, size in doomed)
+        if max_bytes and total > max_bytes:
+            doomed_hashes = {digest for digest, _, _ in doomed}
+            for digest, ext, size in db.execute(
+                "SELECT hash, ext, size FROM blobs WHERE refs <= 0 ORDER BY last_access"
+            ):
+                if total <= max_bytes:
+                    break
+                if digest not in doomed_hashes:
+                    doomed.append((digest, ext, size))
+                    total -= size
+
+        removed = 0
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            for digest, ext, _ in doomed:
+                # A writer may have referenced the blob since it was picked; only the row going means the file can
+                if db.execute("DELETE FROM blobs WHERE hash = ? AND refs <= 0", (digest,)).rowcount:
+                    _remove(self.path_for(digest, ext))
+                    removed += 1
+        if removed:
+            print(f"Evicted {removed} files from screenshot store")
+        return removed
+
+    def _put(self, digest, ext, size, write):
+        """
+        Reference a blob, calling `write(path)` first if its file is missing
+
+        The reference, the existence check and the write share one immediate
+        (write-locked) transaction, so an eviction in this or another process
+        either finishes before it (and the file is written again) or sees the
+        reference and leaves the file alone.
+        """
+        path = self.path_for(digest, ext)
+        now = time.time()
+        db = self._db()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "INSERT INTO blobs (hash, ext, size, refs, created_at, last_access) VALUES (?, ?, ?, 1, ?, ?) "
+                "ON CONFLICT(hash) DO UPDATE SET refs = refs + 1, last_access = excluded.last_access",
+                (digest, ext, size, now, now),
+            )
+            if not os.path.exists(path):
+                write(path)
+        with self._writes_lock:
+            due = self._writes_since_evict >= EVICT_EVERY
+            if due:
+                self._writes_since_evict = 0
+        if due:
+            try:
+                self.evict()
+            except Exception as e:
+                print(f"Screenshot store eviction failed: {e}")
+        return path
+
+    def _publish(self, tmp_path, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Atomic on POSIX and Windows; a racing writer of the same content is harmless
+        os.replace(tmp_path, path)
+        with self._writes_lock:
+            self._writes_since_evict += 1
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+get_store = ProcessWide(ContentStore)
@@ -1,39 +1,178 @@
 import os
 import time
-import tempfile
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
+from contextlib import closing
+from urllib.parse import parse_qs, quote, urlparse
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from PIL import Image
-from webdriver_manager.chrome import ChromeDriverManager
-from webdriver_manager.core.os_manager import ChromeType
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from driver_bootstrap import launch_driver
+from driver_pool import get_driver_pool
+from batch_capture import iter_crops
+from image_pipeline import EncodePipeline, decode_image, store_image
+from storage import get_store
+from phash import DEFAULT_THRESHOLD, NearDuplicateFilter
+from network_policy import NetworkMonitor, enable_performance_log
+from asset_harvest import HARVEST_BUFFER_BYTES, AssetHarvester
+from ad_index import IndexedRun
+from ad_records import AdRecord, RecordWriter
+from ad_locator import locate_ads
+from feed_pager import FeedPager
+from webdriver_metrics import install_round_trip_counter, round_trips
+from tracing import RunTrace, count, current_trace, traced
+from deadline import Deadline
+from browser_watchdog import get_watchdog, is_renderer_crash
+from readiness import (
+    install_trackers, wait_for_dom_quiet, wait_for_element_ready, wait_for_page_ready,
+    wait_for_scroll_settle,
+)
 
 
-def collect_ads(url, platform="Google Ads", screenshot_count=5):
+
+# Upper bounds for one page load / one injected script; runs with a time budget get less
+PAGE_LOAD_TIMEOUT = float(os.environ.get("ADSPY_PAGE_LOAD_TIMEOUT", "45"))
+SCRIPT_TIMEOUT = float(os.environ.get("ADSPY_SCRIPT_TIMEOUT", "30"))
+
+class CaptureEvent:
+    """
+    Progress update or result yielded by the streaming collectors
+    
+    kind is one of:
+        "status"   - progress message, no file
+        "ad"       - an ad screenshot was saved to `path`
+        "fallback" - a full-page screenshot was saved instead of individual ads
+        "error"    - `path` is a text file describing what went wrong
+        "done"     - collection finished (only emitted by stream_ads); `summary`
+                     holds the run's trace summary (phase timings and counts)
+    """
+    
+    def __init__(self, kind, path=None, message="", captured=0, target=0, summary=None):
+        self.kind = kind
+        self.path = path
+        self.message = message
+        self.captured = captured
+        self.target = target
+        self.summary = summary
+    
+    def __repr__(self):
+        return f"CaptureEvent({self.kind!r}, path={self.path!r}, message={self.message!r})"
+
+
+def stream_ads(url, platform="Google Ads", screenshot_count=5, capture_mode="batch",
+               dedupe_threshold=DEFAULT_THRESHOLD, new_only=False, budget=None):
+    """
+    Collect ads like collect_ads, yielding each one as soon as it is saved
+    
+    Closing the generator early (e.g. once enough ads are in) stops the run
+    and returns the browser to the pool. Every run is traced (see tracing.py);
+    runs that used up their time or network budget end with status "partial".
+    
+    Yields:
+        CaptureEvent objects, ending with a "done" event
+    """
+    deadline = Deadline(budget)
+    if platform == "Google Ads":
+        trace = RunTrace("google", *search_terms(url))
+        events = stream_google_ads(url, screenshot_count, capture_mode, dedupe_threshold, new_only, deadline)
+    elif platform == "Meta Ads":
+        trace = RunTrace("meta", *search_terms(url))
+        events = stream_meta_ads(url, screenshot_count, capture_mode, dedupe_threshold, new_only, deadline)
+    else:
+        raise ValueError(f"Unsupported platform: {platform}")
+    
+    captured = 0
+    fallbacks = 0
+    status = "ok"
+    try:
+        with closing(events):
+            for event in traced(trace, events):
+                if event.kind == "ad":
+                    captured += 1
+                elif event.kind == "fallback":
+                    fallbacks += 1
+                    trace.count("fallbacks")
+                elif event.kind == "error":
+                    status = "error"
+                yield event
+    except GeneratorExit:
+        status = "stopped"
+        raise
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        if status == "ok" and not captured:
+            status = "fallback" if fallbacks else "empty"
+        elif status == "ok" and (deadline.ran_out or deadline.stopped_by) and captured < screenshot_count:
+            status = "partial"
+        summary = trace.finish(status, captured)
+    yield CaptureEvent("done", message=f"Captured {captured} ads", captured=captured, target=screenshot_count,
+                       summary=summary)
+
+
+def collect_ads(url, platform="Google Ads", screenshot_count=5, capture_mode="batch",
+                dedupe_threshold=DEFAULT_THRESHOLD, new_only=False, budget=None):
     """
     Collect ad screenshots from different ad transparency platforms
     
+    Browsers are borrowed from a shared warm pool (see driver_pool.py), so
+    concurrent Streamlit sessions reuse Chrome instead of cold-starting it.
+    
     Args:
         url: URL of the ad transparency platform with search query
         platform: "Google Ads" or "Meta Ads"
         screenshot_count: Maximum number of ads to capture
+        capture_mode: "batch" crops all ads from a few large captures,
+            "element" takes one screenshot per ad, "assets" saves the original
+            image/video files from network responses and screenshots the rest
+        dedupe_threshold: Max perceptual-hash distance (bits) for an ad to be
+            skipped as a near-duplicate of one already captured; -1 disables
+        new_only: Only capture ads the ad index has not seen in earlier runs
+        budget: Seconds the whole run may take (default ADSPY_RUN_BUDGET, 0 for
+            no limit), split over browser startup, navigation, locating and
+            capturing the ads; when it runs out the ads captured so far are
+            returned
         
     Returns:
         List of paths to the captured screenshots
     """
+    events = stream_ads(url, platform, screenshot_count, capture_mode, dedupe_threshold, new_only, budget)
+    return [event.path for event in events if event.path]
+
+
+# Facebook uses UK instead of GB
+META_COUNTRY_MAP = {
+    "GB": "UK",
+}
+
+
+def build_search_url(platform, query, region):
+    """
+    Build the transparency center URL for a domain (Google) or keyword (Meta)
+    
+    Args:
+        platform: "Google Ads" or "Meta Ads"
+        query: Advertiser domain for Google, search keyword for Meta
+        region: Two-letter region / country code
+    """
+    query = query.strip()
     if platform == "Google Ads":
-        return collect_google_ads(url, screenshot_count)
+        return f"https://adstransparency.google.com/?region={region}&domain={quote(query)}"
     elif platform == "Meta Ads":
-        return collect_meta_ads(url, screenshot_count)
+        country = META_COUNTRY_MAP.get(region, region)
+        return f"https://www.facebook.com/ads/library/?active_status=active&ad_type=all&country={country}&is_targeted_country=false&media_type=all&q={quote(query)}&search_type=keyword_unordered"
     else:
         raise ValueError(f"Unsupported platform: {platform}")
 
 
+def search_terms(url):
+    """(query, region) back out of a URL made by build_search_url"""
+    params = parse_qs(urlparse(url).query)
+    query = (params.get("domain") or params.get("q") or [""])[0]
+    region = (params.get("region") or params.get("country") or [""])[0]
+    return query, region
+
+
 def setup_driver():
     """Set up Chrome driver with appropriate options for Streamlit Cloud"""
     # Configure Chrome options
@@ -53,30 +192,30 @@ def setup_driver():
     # Add arguments to help avoid detection
     options.add_argument('--disable-blink-features=AutomationControlled')
     
-    # Use webdriver-manager to handle ChromeDriver installation
+    # Keep background tabs loading and rendering at full speed (see tab_scheduler.py)
+    options.add_argument("--disable-background-timer-throttling")
+    options.add_argument("--disable-backgrounding-occluded-windows")
+    options.add_argument("--disable-renderer-backgrounding")
+    
+    # Keep DevTools network events so runs can report blocked requests and bytes
+    enable_performance_log(options)
+    
+    # Resolve ChromeDriver/Chromium from the cached bootstrap manifest; the
+    # three-tier fallback is only probed when the manifest is missing or stale
     try:
-        # First try with ChromeType.CHROMIUM which works better on some Linux distributions
-        service = Service(ChromeDriverManager(chrome_type=ChromeType.CHROMIUM).install())
-        driver = webdriver.Chrome(service=service, options=options)
+        driver = launch_driver(options)
     except Exception as e:
-        print(f"Failed to initialize ChromeDriver with CHROMIUM type: {e}")
-        try:
-            # Fall back to standard Chrome
-            service = Service(ChromeDriverManager().install())
-            driver = webdriver.Chrome(service=service, options=options)
-        except Exception as e:
-            print(f"Failed to initialize standard ChromeDriver: {e}")
-            # Last resort - try direct path that might work on Streamlit Cloud
-            try:
-                options.binary_location = "/usr/bin/chromium-browser"
-                driver = webdriver.Chrome(options=options)
-            except Exception as e:
-                print(f"All ChromeDriver initialization methods failed: {e}")
-                # Take a screenshot of error message and return it
-                error_img_path = os.path.join(tempfile.gettempdir(), "chrome_error.png")
-                with open(error_img_path, 'w') as f:
-                    f.write(f"ChromeDriver initialization failed: {e}")
-                raise
+        print(f"All ChromeDriver initialization methods failed: {e}")
+        # Keep the error message around for debugging
+        save_error_report(f"ChromeDriver initialization failed: {e}")
+        raise
+    
+    # Never let a page load or an injected script block the session indefinitely
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    driver.set_script_timeout(SCRIPT_TIMEOUT)
+    
+    # Count WebDriver round trips so capture loops can report them
+    install_round_trip_counter(driver)
     
     # Execute JavaScript to further avoid detection
     driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
@@ -84,183 +223,376 @@ def setup_driver():
     return driver
 
 
-def collect_google_ads(url, screenshot_count=5):
+def save_page_screenshot(driver):
+    """Store a screenshot of the current viewport and return its path"""
+    return store_image(decode_image(_screenshot(driver.get_screenshot_as_png)))
+
+
+def _screenshot(take):
+    """Call a screenshot method, counting it for the run trace"""
+    start = time.perf_counter()
+    png = take()
+    count("screenshots")
+    count("screenshot_seconds", time.perf_counter() - start)
+    return png
+
+
+def save_error_report(message):
+    """Store an error message as a .txt file the UI can display"""
+    return get_store().put_bytes(message.encode("utf-8"), ".txt")
+
+
+def grab_element(driver, ad):
+    """Screenshot a single ad element into memory, cropping a viewport screenshot if that fails
+    
+    Returns:
+        PIL image of the ad, or None if both methods failed
+    """
+    try:
+        # Scroll element into view before taking screenshot
+        driver.execute_script("arguments[0].scrollIntoView({behavior: 'smooth', block: 'center'});", ad)
+        wait_for_element_ready(driver, ad)  # Wait for scrolling and images to finish
+        
+        # Take screenshot of only this specific element
+        try:
+            return decode_image(_screenshot(lambda: ad.screenshot_as_png))
+        except Exception as e:
+            print(f"Failed element screenshot, trying alternative method: {e}")
+        
+        # Alternative method using a viewport screenshot and cropping, all in memory
+        rect = driver.execute_script("var r = arguments[0].getBoundingClientRect(); return [r.left, r.top, r.width, r.height];", ad)
+        img = decode_image(_screenshot(driver.get_screenshot_as_png))
+        
+        left = max(0, round(rect[0]))
+        top = max(0, round(rect[1]))
+        right = min(img.width, round(rect[0] + rect[2]))
+        bottom = min(img.height, round(rect[1] + rect[3]))
+        
+        if left < right and top < bottom:
+            print("Captured ad with alternative method")
+            return img.crop((left, top, right, bottom))
+        print(f"Invalid crop dimensions: {left}, {top}, {right}, {bottom}")
+    except Exception as e:
+        print(f"Alternative screenshot method also failed: {e}")
+    return None
+
+
+def dismiss_cookie_dialog(driver):
+    """Click the first cookie consent button on the page, if there is one"""
+    try:
+        cookie_buttons = driver.find_elements(By.XPATH, "//button[contains(text(), 'Accept') or contains(text(), 'Allow') or contains(text(), 'Cookies')]")
+        if cookie_buttons:
+            print("Attempting to click cookie consent button...")
+            for button in cookie_buttons:
+                try:
+                    button.click()
+                    wait_for_dom_quiet(driver, timeout=3)
+                    print("Clicked cookie consent button")
+                    break
+                except:
+                    pass
+    except Exception as e:
+        print(f"No cookie dialog found or error handling it: {e}")
+
+
+def _start_network(driver, platform, capture_mode, ad_count):
+    """Apply the platform's request blocklist, budgeted for `ad_count` ads; asset mode also records creatives"""
+    if capture_mode != "assets":
+        return NetworkMonitor(driver, platform, ad_count=ad_count).start(), None
+    network = NetworkMonitor(driver, platform, keep_media=True, buffer_bytes=HARVEST_BUFFER_BYTES,
+                             ad_count=ad_count)
+    harvester = AssetHarvester(driver)
+    network.listeners.append(harvester.observe)
+    return network.start(), harvester
+
+
+def _navigate(driver, url, deadline):
+    """Open `url` within the navigate share of the run's budget; a page still loading after that is stopped, not waited out"""
+    timeout = deadline.for_phase("navigate", PAGE_LOAD_TIMEOUT)
+    if timeout < PAGE_LOAD_TIMEOUT:
+        driver.set_page_load_timeout(max(1.0, timeout))
+    try:
+        driver.get(url)
+    except TimeoutException:
+        print(f"Page still loading after {timeout:.0f}s, continuing with what has rendered")
+        try:
+            driver.execute_script("window.stop();")
+        except WebDriverException:
+            pass
+    finally:
+        if timeout < PAGE_LOAD_TIMEOUT:
+            driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+
+
+def _on_captured(run, records, snapshot, path):
+    """Index a captured ad and queue its structured record"""
+    run.record(snapshot, path)
+    records.add(AdRecord.from_snapshot(snapshot, path, run.platform, run.query, run.region))
+
+
+def _capture_page(driver, snapshots, capture_mode, dedupe, network, harvester, pipeline):
+    """
+    Capture a page of ads: original assets or batch crops first, then one element at a time for the misses
+
+    Screenshots are handed to `pipeline` for encoding, so this returns before
+    the last ones are stored; whatever is still encoding comes out of a later
+    call or `pipeline.drain()`.
+
+    Yields:
+        (snapshot, path) for each ad stored so far, including earlier pages'
+    """
+    yield from pipeline.completed()
+    elements = [snapshot.element for snapshot in snapshots]
+    ad_ids = [snapshot.ad_id for snapshot in snapshots]
+    missed = set(range(len(elements)))
+    try:
+        if capture_mode == "assets" and elements:
+            network.poll()  # Pick up responses that finished since the last poll
+            for i, path, value in harvester.harvest(elements, dedupe, ad_ids):
+                missed.discard(i)
+                if path:
+                    snapshots[i].phash = value
+                    yield snapshots[i], path
+        elif capture_mode == "batch" and elements:
+            for i, crop, value in iter_crops(driver, elements, dedupe, ad_ids=ad_ids):
+                missed.discard(i)
+                if crop is not None:
+                    snapshots[i].phash = value
+                    pipeline.submit(snapshots[i], crop)
+                yield from pipeline.completed()
+    except Exception as e:
+        print(f"Batch capture failed, falling back to per-ad screenshots: {e}")
+    
+    for i in sorted(missed):
+        image = grab_element(driver, elements[i])
+        if image is None:
+            print("No capture for ad")
+            continue
+        is_new, value = dedupe.check([image], [ad_ids[i]])[0] if dedupe is not None else (True, None)
+        if not is_new:
+            print("Skipping near-duplicate ad")
+        else:
+            snapshots[i].phash = value
+            pipeline.submit(snapshots[i], image)
+        yield from pipeline.completed()
+
+
+def _page_remainder(page, fresh, taken):
+    """The part of a page to release: ads passed over by the index plus the ones just captured"""
+    kept = {id(snapshot) for snapshot in fresh}
+    return [snapshot for snapshot in page if id(snapshot) not in kept] + taken
+
+
+def collect_google_ads(url, screenshot_count=5, capture_mode="batch", dedupe_threshold=DEFAULT_THRESHOLD,
+                      new_only=False):
     """Collect ad screenshots from Google Ads Transparency Center"""
+    events = stream_google_ads(url, screenshot_count, capture_mode, dedupe_threshold, new_only)
+    return [event.path for event in events if event.path]
+
+
+def stream_google_ads(url, screenshot_count=5, capture_mode="batch", dedupe_threshold=DEFAULT_THRESHOLD,
+                     new_only=False, deadline=None):
+    """Yield CaptureEvents while collecting ads from Google Ads Transparency Center"""
+    # Borrow a warm browser from the shared pool instead of launching one per run
+    pool = get_driver_pool(setup_driver)
+    trace = current_trace()
+    deadline = deadline or Deadline()
     try:
-        driver = setup_driver()
+        with trace.span("startup"):
+            pooled = pool.checkout(timeout=deadline.for_phase("boot", pool.checkout_timeout))
     except Exception as e:
         print(f"Failed to set up driver: {e}")
-        error_path = os.path.join(tempfile.gettempdir(), "driver_error.txt")
-        with open(error_path, 'w') as f:
-            f.write(f"Driver setup failed: {e}")
-        return [error_path]
+        error_path = save_error_report(f"Driver setup failed: {e}")
+        yield CaptureEvent("error", path=error_path)
+        return
+    driver = pooled.driver
+    trace.attach(driver)
+    # Hung or oversized browsers are killed from the watchdog thread, failing the blocked call
+    watchdog = get_watchdog()
+    watchdog.watch(driver, deadline)
+    failed = False
+    records = None
+    pipeline = None
     
     try:
-        driver.get(url)
+        yield CaptureEvent("status", message="Opening Google Ads Transparency Center...")
+        with trace.span("navigate"):
+            install_trackers(driver)
+            network, harvester = _start_network(driver, "google", capture_mode, screenshot_count)
+            _navigate(driver, url, deadline)
         
-        # Wait for the ads to load with explicit wait
-        wait = WebDriverWait(driver, 15)
-        try:
-            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'priority-creative-grid creative-preview')))
-        except:
+        # Wait for the ads to load; every candidate selector is raced, last region winner first
+        query, region = search_terms(url)
+        with trace.span("wait"):
+            ad_selector = locate_ads(driver, "google", region, timeout=deadline.for_phase("locate", 15))
+        if ad_selector is None:
             print("Could not find ad elements directly, taking full page screenshot")
-            full_screen_path = os.path.join(tempfile.gettempdir(), "google_full_page.png")
-            driver.save_screenshot(full_screen_path)
-            return [full_screen_path]
+            full_screen_path = save_page_screenshot(driver)
+            yield CaptureEvent("fallback", path=full_screen_path)
+            return
         
-        # Scroll to load more ads
-        last_height = driver.execute_script("return document.body.scrollHeight")
-        for _ in range(3):  # Limit scrolling to prevent infinite loops
-            driver.find_element(By.TAG_NAME, 'body').send_keys(Keys.END)
-            time.sleep(2)
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
+        run = IndexedRun("google", query, region, new_only=new_only)
+        records = RecordWriter("google")
+        dedupe = NearDuplicateFilter(dedupe_threshold)
+        run.seed(dedupe)
+        yield CaptureEvent("status", message=f"Capturing up to {screenshot_count} ads...", target=screenshot_count)
+        
+        # Page through the grid: capture the ads rendered so far, then scroll for more until the
+        # count is reached or the grid ends. Near-duplicates don't use up a slot, and ads the
+        # ad index already has are passed over when only new ads are wanted. Screenshots are
+        # encoded in the background while the next page is captured and scrolled in
+        pager = FeedPager(driver, ad_selector)
+        pipeline = EncodePipeline()
+        image_paths = []
+        while len(image_paths) + pipeline.pending < screenshot_count:
+            if deadline.expired():
                 break
-            last_height = new_height
+            with trace.span("snapshot"):
+                page = pager.next_page()
+            if not page:
+                network.poll()
+                if network.over_budget:
+                    deadline.stop("network budget")
+                    break
+                with trace.span("scroll"):
+                    if not pager.scroll():
+                        break
+                continue
+            
+            fresh = run.select(page)
+            taken = fresh[:screenshot_count - len(image_paths) - pipeline.pending]
+            for snapshot, path in _capture_page(driver, taken, capture_mode, dedupe, network, harvester, pipeline):
+                _on_captured(run, records, snapshot, path)
+                image_paths.append(path)
+                print(f"Successfully captured Google ad {len(image_paths)}")
+                yield CaptureEvent("ad", path=path, captured=len(image_paths), target=screenshot_count)
+            # Ads past the count stay untagged, for the next page if near-duplicates freed up slots
+            pager.release(_page_remainder(page, fresh, taken))
         
-        # Find all creative-preview elements inside priority-creative-grid
-        ad_elements = driver.find_elements(By.CSS_SELECTOR, 'priority-creative-grid creative-preview')
-        print(f"Found {len(ad_elements)} Google ad elements")
-
-        # Limit the number of screenshots to `screenshot_count`
-        ad_elements = ad_elements[:screenshot_count]
+        for snapshot, path in pipeline.drain():
+            _on_captured(run, records, snapshot, path)
+            image_paths.append(path)
+            print(f"Successfully captured Google ad {len(image_paths)}")
+            yield CaptureEvent("ad", path=path, captured=len(image_paths), target=screenshot_count)
         
-        image_paths = []
-        for i, ad in enumerate(ad_elements):
-            try:
-                # Scroll element into view before taking screenshot
-                driver.execute_script("arguments[0].scrollIntoView({behavior: 'smooth', block: 'center'});", ad)
-                time.sleep(1)  # Wait for scrolling to complete
-                
-                # Define the screenshot file path
-                screenshot_path = os.path.join(tempfile.gettempdir(), f"google_ad_{i}.png")
-                
-                # Take screenshot of only this specific element
-                try:
-                    ad.screenshot(screenshot_path)
-                    image_paths.append(screenshot_path)
-                    print(f"Successfully captured Google ad {i}")
-                except Exception as e:
-                    print(f"Failed element screenshot, trying alternative method: {e}")
-                    # Alternative method using full page screenshot and cropping
-                    location = ad.location
-                    size = ad.size
-                    
-                    driver.save_screenshot(screenshot_path + ".temp.png")
-                    img = Image.open(screenshot_path + ".temp.png")
-                    
-                    left = max(0, location['x'])
-                    top = max(0, location['y'])
-                    right = min(img.width, left + size['width'])
-                    bottom = min(img.height, top + size['height'])
-                    
-                    if left < right and top < bottom:
-                        cropped = img.crop((left, top, right, bottom))
-                        cropped.save(screenshot_path)
-                        image_paths.append(screenshot_path)
-                        print(f"Successfully captured Google ad {i} with alternative method")
-                    else:
-                        print(f"Invalid crop dimensions: {left}, {top}, {right}, {bottom}")
-                
-            except Exception as e:
-                print(f"Failed to capture Google ad {i}: {e}")
+        print(f"Went through {pager.seen} Google ad elements in {pager.scrolls} scrolls")
+        if deadline.ran_out:
+            yield CaptureEvent("status", message=f"Time budget used up, keeping {len(image_paths)} ads",
+                               captured=len(image_paths), target=screenshot_count)
+        if run.skipped:
+            print(f"Skipped {run.skipped} Google ads already in the ad index")
+        if dedupe.duplicates:
+            print(f"Skipped {dedupe.duplicates} near-duplicate Google ads")
+        records_path = records.close()
+        if records_path:
+            print(f"Wrote {records.count} ad records to {records_path}")
+        network_report = network.report()
+        print(network_report)
+        yield CaptureEvent("status", message=network_report, captured=len(image_paths), target=screenshot_count)
         
+        if not image_paths and run.skipped:
+            yield CaptureEvent("status", message=f"No new ads since the last run ({run.skipped} already indexed)")
+            return
         if not image_paths:
             print("No ads captured, taking full page screenshot as fallback")
-            full_screen_path = os.path.join(tempfile.gettempdir(), "google_full_page.png")
-            driver.save_screenshot(full_screen_path)
-            return [full_screen_path]
-            
-        return image_paths
+            full_screen_path = save_page_screenshot(driver)
+            yield CaptureEvent("fallback", path=full_screen_path)
+            return
     except Exception as e:
         print(f"Error during Google scraping: {e}")
+        failed = True
+        crashed = is_renderer_crash(e)
+        if crashed:
+            count("renderer_crashes")
+            print("The browser tab crashed, the driver will be replaced")
         try:
-            # Take a full page screenshot as fallback
-            full_screen_path = os.path.join(tempfile.gettempdir(), "google_error_page.png")
-            driver.save_screenshot(full_screen_path)
-            return [full_screen_path]
+            # Take a full page screenshot as fallback, unless the tab is gone
+            full_screen_path = None if crashed else save_page_screenshot(driver)
         except:
-            error_path = os.path.join(tempfile.gettempdir(), "scraping_error.txt")
-            with open(error_path, 'w') as f:
-                f.write(f"Scraping error: {e}")
-            return [error_path]
+            full_screen_path = None
+        if full_screen_path:
+            yield CaptureEvent("fallback", path=full_screen_path)
+        else:
+            yield CaptureEvent("error", path=save_error_report(f"Scraping error: {e}"))
+    except GeneratorExit:
+        raise
+    except BaseException:
+        # A job timeout (SIGALRM) or interrupt can land mid-command, with the browser possibly hung
+        failed = True
+        raise
     finally:
-        # Always quit the driver, even in case of error
-        try:
-            driver.quit()
-        except:
-            pass
+        # Always hand the driver back; sessions that errored out are replaced. Stop watching it first,
+        # so the watchdog cannot kill it once it belongs to the pool (or the next run)
+        watchdog.unwatch(driver)
+        pool.checkin(pooled, discard=failed)
+        if pipeline is not None:
+            # Runs closed early leave encodes behind; their captures are nobody's
+            pipeline.discard()
+        if records is not None:
+            records.close()
 
 
-def collect_meta_ads(url, screenshot_count=5):
+def collect_meta_ads(url, screenshot_count=5, capture_mode="batch", dedupe_threshold=DEFAULT_THRESHOLD,
+                      new_only=False):
     """Collect ad screenshots from Meta Ads Library"""
+    events = stream_meta_ads(url, screenshot_count, capture_mode, dedupe_threshold, new_only)
+    return [event.path for event in events if event.path]
+
+
+def stream_meta_ads(url, screenshot_count=5, capture_mode="batch", dedupe_threshold=DEFAULT_THRESHOLD,
+                     new_only=False, deadline=None):
+    """Yield CaptureEvents while collecting ads from Meta Ads Library"""
+    # Borrow a warm browser from the shared pool instead of launching one per run
+    pool = get_driver_pool(setup_driver)
+    trace = current_trace()
+    deadline = deadline or Deadline()
     try:
-        driver = setup_driver()
+        with trace.span("startup"):
+            pooled = pool.checkout(timeout=deadline.for_phase("boot", pool.checkout_timeout))
     except Exception as e:
         print(f"Failed to set up driver: {e}")
-        error_path = os.path.join(tempfile.gettempdir(), "driver_error.txt")
-        with open(error_path, 'w') as f:
-            f.write(f"Driver setup failed: {e}")
-        return [error_path]
+        error_path = save_error_report(f"Driver setup failed: {e}")
+        yield CaptureEvent("error", path=error_path)
+        return
+    driver = pooled.driver
+    trace.attach(driver)
+    # Hung or oversized browsers are killed from the watchdog thread, failing the blocked call
+    watchdog = get_watchdog()
+    watchdog.watch(driver, deadline)
+    failed = False
+    records = None
+    pipeline = None
     
     try:
         # Navigate to the URL
         print(f"Opening Meta Ads URL: {url}")
-        driver.get(url)
-        
-        # Give Facebook time to load initial content
-        time.sleep(7)
-        
-        # Check if we need to handle a cookie consent dialog
-        try:
-            cookie_buttons = driver.find_elements(By.XPATH, "//button[contains(text(), 'Accept') or contains(text(), 'Allow') or contains(text(), 'Cookies')]")
-            if cookie_buttons:
-                print("Attempting to click cookie consent button...")
-                for button in cookie_buttons:
-                    try:
-                        button.click()
-                        time.sleep(1)
-                        print("Clicked cookie consent button")
-                        break
-                    except:
-                        pass
-        except Exception as e:
-            print(f"No cookie dialog found or error handling it: {e}")
-        
-        # Wait for the page to load and stabilize
-        print("Waiting for page to load...")
-        time.sleep(5)
-        
-        # First try with the most specific selector
-        ad_selector = 'div[role="article"]'
-        backup_selector = 'div._7jyg'  # Backup selector based on your example HTML
-        third_selector = 'div._8nsi'   # Another potential selector from your HTML
+        yield CaptureEvent("status", message="Opening Meta Ads Library...")
+        with trace.span("navigate"):
+            install_trackers(driver)
+            network, harvester = _start_network(driver, "meta", capture_mode, screenshot_count)
+            _navigate(driver, url, deadline)
         
-        # Try to find ads with the primary selector
-        ads_found = False
-        try:
-            wait = WebDriverWait(driver, 10)
-            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, ad_selector)))
-            ads_found = True
-            print(f"Found ads with primary selector: {ad_selector}")
-        except:
-            print(f"Could not find ads with primary selector, trying backup selector: {backup_selector}")
-            try:
-                wait = WebDriverWait(driver, 10)
-                wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, backup_selector)))
-                ad_selector = backup_selector
-                ads_found = True
-                print(f"Found ads with backup selector: {backup_selector}")
-            except:
-                print(f"Could not find ads with backup selector, trying third selector: {third_selector}")
-                try:
-                    wait = WebDriverWait(driver, 10)
-                    wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, third_selector)))
-                    ad_selector = third_selector
-                    ads_found = True
-                    print(f"Found ads with third selector: {third_selector}")
-                except:
-                    print("Could not find ads with any selector")
+        # Wait until Facebook has loaded its initial content
+        with trace.span("wait") as waiting:
+            wait_for_page_ready(driver, timeout=deadline.for_phase("locate", 15))
+            
+            # Check if we need to handle a cookie consent dialog
+            dismiss_cookie_dialog(driver)
+            
+            # Wait for the page to load and stabilize
+            print("Waiting for page to load...")
+            wait_for_page_ready(driver, quiet_ms=800, timeout=deadline.for_phase("locate", 10))
+            
+            # Race all known ad container selectors at once; the one that worked last
+            # time for this country is tried first
+            query, region = search_terms(url)
+            ad_selector = locate_ads(driver, "meta", region, timeout=deadline.for_phase("locate", 10))
+            ads_found = ad_selector is not None
+            if ads_found:
+                print(f"Found ads with selector: {ad_selector}")
+            else:
+                print("Could not find ads with any selector")
+            waiting.end("ok" if ads_found else "not_found")
         
         # If we can't find ads, look for specific elements in the HTML source
         if not ads_found:
@@ -271,176 +603,139 @@ def collect_meta_ads(url, screenshot_count=5):
                 print("Found ad patterns in HTML source but couldn't locate elements. Taking sequential screenshots...")
                 
                 # Take sequence of screenshots as we scroll down
-                image_paths = []
                 for i in range(min(screenshot_count, 5)):  # Limit to 5 full-page screenshots
                     # Scroll down progressively
                     driver.execute_script(f"window.scrollBy(0, {800 * (i+1)});")
-                    time.sleep(3)  # Wait for content to load
+                    wait_for_scroll_settle(driver)  # Wait for content to load
                     
                     # Take screenshot
-                    screenshot_path = os.path.join(tempfile.gettempdir(), f"meta_page_{i}.png")
-                    driver.save_screenshot(screenshot_path)
-                    image_paths.append(screenshot_path)
+                    screenshot_path = save_page_screenshot(driver)
                     print(f"Captured full-page screenshot {i}")
+                    yield CaptureEvent("fallback", path=screenshot_path)
                 
-                return image_paths
+                return
             
             # As last resort, take a single full page screenshot
             print("Taking full page screenshot as fallback...")
-            full_screen_path = os.path.join(tempfile.gettempdir(), "meta_full_page.png")
-            driver.save_screenshot(full_screen_path)
-            return [full_screen_path]
+            full_screen_path = save_page_screenshot(driver)
+            yield CaptureEvent("fallback", path=full_screen_path)
+            return
         
-        # Now proceed with capturing ads
+        # Now proceed with capturing ads, one page of not-yet-seen containers at a time
         image_paths = []
         ads_captured = 0
-        scroll_attempts = 0
-        max_scroll_attempts = 20
-        
-        # Track which ads we've already processed to avoid duplicates
-        processed_ads = set()
+        run = IndexedRun("meta", query, region, new_only=new_only)
+        records = RecordWriter("meta")
+        dedupe = NearDuplicateFilter(dedupe_threshold)
+        run.seed(dedupe)
+        pager = FeedPager(driver, ad_selector)
+        pipeline = EncodePipeline()
+        scroll_round_trips = []
         
-        # Keep scrolling and capturing until we reach the limit or run out of ads
-        while ads_captured < screenshot_count and scroll_attempts < max_scroll_attempts:
-            print(f"Scroll attempt {scroll_attempts + 1}/{max_scroll_attempts}")
+        # Keep capturing and scrolling until we reach the limit or the feed ends;
+        # screenshots still encoding in the background count towards the limit
+        while ads_captured + pipeline.pending < screenshot_count:
+            if deadline.expired():
+                break
+            round_trips_before = round_trips(driver)
             
-            # Find all ad elements
-            ad_elements = driver.find_elements(By.CSS_SELECTOR, ad_selector)
-            print(f"Found {len(ad_elements)} Meta ad elements")
+            # Snapshot the containers not seen yet with their metadata in a single round trip
+            with trace.span("snapshot"):
+                page = pager.next_page()
             
-            if not ad_elements and scroll_attempts > 5:
-                print("No ad elements found after multiple scrolls, taking full page screenshot")
-                full_screen_path = os.path.join(tempfile.gettempdir(), "meta_full_page.png")
-                driver.save_screenshot(full_screen_path)
-                return [full_screen_path]
+            if page:
+                print(f"Found {len(page)} new Meta ad elements")
+                # In new-only mode ads already in the ad index are passed over without capture
+                skipped_before = run.skipped
+                fresh = run.select(page)
+                if run.skipped > skipped_before:
+                    print(f"Skipping {run.skipped - skipped_before} Meta ads already in the ad index")
+                taken = fresh[:screenshot_count - ads_captured - pipeline.pending]
+                for snapshot, path in _capture_page(driver, taken, capture_mode, dedupe, network, harvester,
+                                                    pipeline):
+                    _on_captured(run, records, snapshot, path)
+                    image_paths.append(path)
+                    print(f"Successfully captured Meta ad {ads_captured}")
+                    ads_captured += 1
+                    yield CaptureEvent("ad", path=path, captured=ads_captured, target=screenshot_count)
+                pager.release(_page_remainder(page, fresh, taken))
+                continue
             
-            # Process elements we haven't captured yet
-            new_ads_in_this_scroll = 0
-            for i, ad in enumerate(ad_elements):
-                try:
-                    # Skip already processed ads
-                    # Generate a unique identifier for this ad
-                    # Using a combination of text content, class names, and position
-                    ad_text = ad.text[:100] if ad.text else ""
-                    ad_class = ad.get_attribute("class") or ""
-                    ad_position = f"{ad.location['x']}-{ad.location['y']}"
-                    ad_size = f"{ad.size['width']}-{ad.size['height']}"
-                    ad_id = f"{ad_text}_{ad_class}_{ad_position}_{ad_size}"
-                    ad_hash = hash(ad_id)
-                    
-                    if ad_hash in processed_ads:
-                        continue
-                    
-                    # Mark this ad as processed
-                    processed_ads.add(ad_hash)
-                    
-                    # Scroll to the element
-                    print(f"Scrolling to new ad {ads_captured}")
-                    driver.execute_script("arguments[0].scrollIntoView({behavior: 'smooth', block: 'center'});", ad)
-                    time.sleep(2)  # Give more time for scrolling and rendering
-                    
-                    # Define the screenshot file path
-                    screenshot_path = os.path.join(tempfile.gettempdir(), f"meta_ad_{ads_captured}.png")
-                    
-                    # Take screenshot of this specific ad element
-                    try:
-                        ad.screenshot(screenshot_path)
-                        image_paths.append(screenshot_path)
-                        print(f"Successfully captured Meta ad {ads_captured}")
-                        ads_captured += 1
-                        new_ads_in_this_scroll += 1
-                        
-                        if ads_captured >= screenshot_count:
-                            break
-                            
-                    except Exception as e:
-                        print(f"Failed to screenshot ad: {e}")
-                        # Try an alternative approach
-                        try:
-                            print("Trying alternative screenshot method...")
-                            # Get location and size
-                            location = ad.location
-                            size = ad.size
-                            
-                            # Take full screenshot
-                            temp_path = os.path.join(tempfile.gettempdir(), f"meta_temp.png")
-                            driver.save_screenshot(temp_path)
-                            
-                            # Crop to ad dimensions
-                            from PIL import Image
-                            img = Image.open(temp_path)
-                            left = location['x']
-                            top = location['y']
-                            right = left + size['width']
-                            bottom = top + size['height']
-                            
-                            # Ensure dimensions are within the image
-                            img_width, img_height = img.size
-                            left = max(0, left)
-                            top = max(0, top)
-                            right = min(img_width, right)
-                            bottom = min(img_height, bottom)
-                            
-                            # Crop and save
-                            if left < right and top < bottom:
-                                cropped = img.crop((left, top, right, bottom))
-                                cropped.save(screenshot_path)
-                                image_paths.append(screenshot_path)
-                                print(f"Successfully captured Meta ad {ads_captured} with alternative method")
-                                ads_captured += 1
-                                new_ads_in_this_scroll += 1
-                                
-                                if ads_captured >= screenshot_count:
-                                    break
-                            else:
-                                print(f"Invalid crop dimensions: {left}, {top}, {right}, {bottom}")
-                        except Exception as e2:
-                            print(f"Alternative screenshot method also failed: {e2}")
-                            
-                except Exception as e:
-                    print(f"Error processing Meta ad: {e}")
-            
-            # If we found new ads in this scroll, continue; otherwise, scroll more
-            if new_ads_in_this_scroll == 0:
-                print("No new ads found in this scroll, scrolling down more...")
-                # Scroll a bit further each time
-                scroll_distance = 800 + (scroll_attempts * 200)
-                driver.execute_script(f"window.scrollBy(0, {scroll_distance});")
-                time.sleep(3)  # Wait longer for content to load
-            else:
-                print(f"Found {new_ads_in_this_scroll} new ads in this scroll")
-                
-            scroll_attempts += 1
+            # Past the page's network budget: keep what we have, don't load more
+            network.poll()
+            if network.over_budget:
+                deadline.stop("network budget")
+                break
             
-            # Every 5 attempts, take a full page screenshot as backup
-            if scroll_attempts % 5 == 0 and ads_captured < screenshot_count:
-                backup_path = os.path.join(tempfile.gettempdir(), f"meta_backup_{scroll_attempts}.png")
-                driver.save_screenshot(backup_path)
-                image_paths.append(backup_path)
-                print(f"Added backup screenshot at scroll attempt {scroll_attempts}")
+            yield CaptureEvent("status", message=f"Scrolling for more ads ({pager.seen} seen so far)...",
+                               captured=ads_captured, target=screenshot_count)
+            with trace.span("scroll"):
+                more = pager.scroll()
+            scroll_round_trips.append(round_trips(driver) - round_trips_before)
+            print(f"Scroll {pager.scrolls} used {scroll_round_trips[-1]} WebDriver round trips")
+            if not more:
+                break
+        
+        for snapshot, path in pipeline.drain():
+            _on_captured(run, records, snapshot, path)
+            image_paths.append(path)
+            print(f"Successfully captured Meta ad {ads_captured}")
+            ads_captured += 1
+            yield CaptureEvent("ad", path=path, captured=ads_captured, target=screenshot_count)
+        if deadline.ran_out:
+            yield CaptureEvent("status", message=f"Time budget used up, keeping {ads_captured} ads",
+                               captured=ads_captured, target=screenshot_count)
+        
+        if dedupe.duplicates:
+            print(f"Skipped {dedupe.duplicates} near-duplicate Meta ads")
+        records_path = records.close()
+        if records_path:
+            print(f"Wrote {records.count} ad records to {records_path}")
+        network_report = network.report()
+        print(network_report)
+        yield CaptureEvent("status", message=network_report, captured=ads_captured, target=screenshot_count)
+        
+        if not image_paths and run.skipped:
+            yield CaptureEvent("status", message=f"No new ads since the last run ({run.skipped} already indexed)")
+            return
+        if scroll_round_trips:
+            print(f"WebDriver round trips per scroll: avg {sum(scroll_round_trips) / len(scroll_round_trips):.1f}, "
+                  f"max {max(scroll_round_trips)}")
         
         if not image_paths:
             print("No ads captured, taking full page screenshot as fallback")
-            full_screen_path = os.path.join(tempfile.gettempdir(), "meta_full_page.png")
-            driver.save_screenshot(full_screen_path)
-            return [full_screen_path]
-            
-        return image_paths
+            full_screen_path = save_page_screenshot(driver)
+            yield CaptureEvent("fallback", path=full_screen_path)
+            return
     except Exception as e:
         print(f"Error during Meta scraping: {e}")
+        failed = True
+        crashed = is_renderer_crash(e)
+        if crashed:
+            count("renderer_crashes")
+            print("The browser tab crashed, the driver will be replaced")
         try:
-            # Take a full page screenshot as fallback
-            full_screen_path = os.path.join(tempfile.gettempdir(), "meta_error_page.png")
-            driver.save_screenshot(full_screen_path)
-            return [full_screen_path]
+            # Take a full page screenshot as fallback, unless the tab is gone
+            full_screen_path = None if crashed else save_page_screenshot(driver)
         except:
-            error_path = os.path.join(tempfile.gettempdir(), "scraping_error.txt")
-            with open(error_path, 'w') as f:
-                f.write(f"Scraping error: {e}")
-            return [error_path]
+            full_screen_path = None
+        if full_screen_path:
+            yield CaptureEvent("fallback", path=full_screen_path)
+        else:
+            yield CaptureEvent("error", path=save_error_report(f"Scraping error: {e}"))
+    except GeneratorExit:
+        raise
+    except BaseException:
+        # A job timeout (SIGALRM) or interrupt can land mid-command, with the browser possibly hung
+        failed = True
+        raise
     finally:
-        # Always quit the driver, even in case of error
-        try:
-            driver.quit()
-        except:
-            pass
\ No newline at end of file
+        # Always hand the driver back; sessions that errored out are replaced. Stop watching it first,
+        # so the watchdog cannot kill it once it belongs to the pool (or the next run)
+        watchdog.unwatch(driver)
+        pool.checkin(pooled, discard=failed)
+        if pipeline is not None:
+            # Runs closed early leave encodes behind; their captures are nobody's
+            pipeline.discard()
+        if records is not None:
+            records.close()
\ No newline at end of file
@@ -0,0 +1,313 @@
+"""
+Several collections in one browser, one tab per query/region
+
+A single collector spends most of its time waiting: for the page to load,
+for lazy content after each scroll. The TabScheduler opens several jobs as
+tabs of one Chrome instance, so their pages load in parallel, and runs
+capture steps on whichever tab is ready while the others keep loading.
+
+ChromeDriver only talks to one tab at a time, and a command sent to a tab
+that is still navigating waits for the navigation to finish. So the
+scheduler never polls a loading tab early: tabs are served in the order
+they became due, a tab that just scrolled is only probed again after a
+short settle delay (that probe is a single non-blocking script), and by the
+time a loading tab comes up it has usually finished while the others were
+being captured. Each tab pages through its feed with a FeedPager, like the
+single-tab collectors: a page of untagged containers per step, a scroll
+once none are left, and the tab is done when the feed stops growing.
+
+Tabs are capped by count and by the browser's resident memory; past the
+memory cap no new tab is opened until one finishes. Request blocking is
+applied per tab, but network budgets are not: the performance log is
+shared by all tabs. Asset mode is not supported here and falls back to
+batch screenshots.
+"""
+import os
+import time
+from collections import deque
+from ad_locator import AD_SELECTORS, get_selector_cache
+from ad_index import IndexedRun
+from ad_records import RecordWriter
+from deadline import Deadline
+from feed_pager import FeedPager
+from image_pipeline import EncodePipeline
+from network_policy import NetworkMonitor
+from phash import DEFAULT_THRESHOLD, NearDuplicateFilter
+from readiness import TRACKER_JS
+from tracing import RunTrace
+from webdriver_metrics import browser_rss
+from streamlit_scraper import (
+    CaptureEvent, build_search_url, dismiss_cookie_dialog, save_error_report, save_page_screenshot,
+    _capture_page, _on_captured, _page_remainder,
+)
+
+
+MAX_TABS = int(os.environ.get("ADSPY_MAX_TABS", "4"))
+BROWSER_MAX_MB = float(os.environ.get("ADSPY_BROWSER_MAX_MB", "2048"))
+
+# Seconds after opening a tab / after scrolling before the tab is looked at again
+FIRST_LOOK_DELAY = 0.5
+SETTLE_DELAY = 0.4
+# Give up waiting for lazy content this long after a scroll and capture anyway
+SETTLE_TIMEOUT = 8
+# How long a loaded page may take to show any ad container
+LOCATE_TIMEOUT = 15
+
+# One round trip, no waiting: first matching ad selector and whether lazy loading has settled
+PROBE_JS = TRACKER_JS + """
+var selectors = arguments[0], quietMs = arguments[1];
+var state = window.__adspyReadiness, now = performance.now();
+var match = -1;
+for (var i = 0; i < selectors.length; i++) {
+  try { if (document.querySelector(selectors[i])) { match = i; break; } } catch (e) {}
+}
+return {
+  loaded: document.readyState === 'complete',
+  match: match,
+  settled: state.inflight <= 0 && now - state.lastNetwork >= quietMs && now - state.lastMutation >= quietMs
+};
+"""
+
+
+class TabRun:
+    """One job's collection, driven a step at a time in its own tab"""
+
+    def __init__(self, job, capture_mode="batch", dedupe_threshold=DEFAULT_THRESHOLD, new_only=False, budget=None):
+        self.job = job
+        self.platform = "google" if job.platform == "Google Ads" else "meta"
+        self.url = build_search_url(job.platform, job.query, job.region)
+        self.capture_mode = "batch" if capture_mode == "assets" else capture_mode
+        self.handle = None
+        self.state = "loading"
+        self.due = 0.0
+        self.opened_at = 0.0
+        self.scrolled_at = 0.0
+        self.images = []
+        self.error = None
+        self.ad_selector = None
+        self.selectors = []
+        self.pager = None
+        self.trace = RunTrace(self.platform, job.query, job.region)
+        self.run = IndexedRun(self.platform, job.query, job.region, new_only=new_only)
+        self.records = RecordWriter(self.platform)
+        self.dedupe = NearDuplicateFilter(dedupe_threshold)
+        self.run.seed(self.dedupe)
+        self.pipeline = EncodePipeline()
+        self.deadline = Deadline(budget)
+
+    @property
+    def finished(self):
+        return self.state == "done"
+
+    @property
+    def status(self):
+        """Final status, as the single-tab collectors report it"""
+        if self.error:
+            return "error"
+        if not self.images:
+            return "empty"
+        if self.deadline.ran_out and len(self.images) < self.job.screenshot_count:
+            return "partial"
+        return "ok"
+
+    def open(self, driver):
+        """Open the tab and start loading the search without waiting for it"""
+        driver.switch_to.new_window("tab")
+        self.handle = driver.current_window_handle
+        NetworkMonitor(driver, self.platform, ad_count=self.job.screenshot_count).start()
+        try:
+            self.selectors = get_selector_cache().order(self.platform, self.job.region, AD_SELECTORS[self.platform])
+        except Exception as e:
+            print(f"Could not read the selector cache: {e}")
+            self.selectors = list(AD_SELECTORS[self.platform])
+        driver.execute_script("window.location.href = arguments[0];", self.url)
+        self.opened_at = time.monotonic()
+        self.due = self.opened_at + FIRST_LOOK_DELAY
+
+    def step(self, driver):
+        """Run whatever this tab is ready for; the tab must be the current window. Yields CaptureEvents"""
+        if self.deadline.expired():
+            yield from self._finish(driver)
+            return
+        probe = driver.execute_script(PROBE_JS, self.selectors, int(SETTLE_DELAY * 1000)) or {}
+        now = time.monotonic()
+
+        if self.state == "loading":
+            if probe.get("match", -1) < 0:
+                if probe.get("loaded") and now - self.opened_at > LOCATE_TIMEOUT:
+                    self._record_selector(None)
+                    yield from self._finish(driver)
+                else:
+                    self.due = now + SETTLE_DELAY
+                return
+            self.ad_selector = self.selectors[probe["match"]]
+            self.pager = FeedPager(driver, self.ad_selector)
+            self._record_selector(self.ad_selector)
+            self.trace.add_phase("wait", now - self.opened_at)
+            if self.platform == "meta":
+                dismiss_cookie_dialog(driver)
+            self.state = "ready"
+        elif self.state == "settling":
+            if not probe.get("settled") and now - self.scrolled_at < SETTLE_TIMEOUT:
+                self.due = now + SETTLE_DELAY
+                return
+            more = self.pager.finish_scroll()
+            self.trace.add_phase("scroll", now - self.scrolled_at)
+            if not more:
+                yield from self._finish(driver)
+                return
+            self.state = "ready"
+
+        captured_page = yield from self._capture(driver)
+        if self.job.screenshot_count - len(self.images) - self.pipeline.pending <= 0:
+            yield from self._finish(driver)
+            return
+        if captured_page:
+            # Come back for the next page; other tabs that are due go first
+            self.due = time.monotonic()
+            return
+        self.pager.begin_scroll()
+        self.scrolled_at = time.monotonic()
+        self.due = self.scrolled_at + SETTLE_DELAY
+        self.state = "settling"
+
+    def _record_selector(self, selector):
+        try:
+            get_selector_cache().record(self.platform, self.job.region, selector, self.selectors[0])
+        except Exception as e:
+            print(f"Could not update the selector cache: {e}")
+
+    def _capture(self, driver):
+        """Capture the next page of untagged containers; returns False when there was none"""
+        with self.trace.span("snapshot"):
+            page = self.pager.next_page()
+        if not page:
+            return False
+        # Screenshots come from the foreground tab
+        try:
+            driver.execute_cdp_cmd("Page.bringToFront", {})
+        except Exception:
+            pass
+        fresh = self.run.select(page)
+        taken = fresh[:self.job.screenshot_count - len(self.images) - self.pipeline.pending]
+        # Encodes finish in the background while this tab scrolls and the others are served
+        for snapshot, path in _capture_page(driver, taken, self.capture_mode, self.dedupe, None, None, self.pipeline):
+            yield self._captured(snapshot, path)
+        self.pager.release(_page_remainder(page, fresh, taken))
+        return True
+
+    def _captured(self, snapshot, path):
+        _on_captured(self.run, self.records, snapshot, path)
+        self.images.append(path)
+        return CaptureEvent("ad", path=path, captured=len(self.images), target=self.job.screenshot_count)
+
+    def _finish(self, driver):
+        self.state = "done"
+        for snapshot, path in self.pipeline.drain():
+            yield self._captured(snapshot, path)
+        if self.images:
+            return
+        if self.run.skipped:
+            yield CaptureEvent("status", message=f"No new ads since the last run ({self.run.skipped} already indexed)")
+            return
+        print(f"No ads captured for {self.job!r}, taking full page screenshot as fallback")
+        yield CaptureEvent("fallback", path=save_page_screenshot(driver))
+
+    def fail(self, driver, error):
+        """End the run after an exception, with a page screenshot if the tab still answers"""
+        self.state = "done"
+        self.error = str(error)
+        try:
+            return CaptureEvent("fallback", path=save_page_screenshot(driver))
+        except Exception:
+            return CaptureEvent("error", path=save_error_report(f"Scraping error: {error}"))
+
+    def close(self, status):
+        """Flush records and close the trace; returns the run summary"""
+        self.pipeline.discard()
+        try:
+            self.records.close()
+        except Exception as e:
+            print(f"Could not write ad records: {e}")
+        return self.trace.finish(status, len(self.images))
+
+
+class TabScheduler:
+    """Runs several jobs at once as tabs of one browser"""
+
+    def __init__(self, driver, max_tabs=MAX_TABS, max_memory_mb=BROWSER_MAX_MB):
+        self.driver = driver
+        self.max_tabs = max(1, max_tabs)
+        self.max_memory_mb = max_memory_mb
+        self.peak_tabs = 0
+
+    def over_memory(self):
+        return bool(self.max_memory_mb) and browser_rss(self.driver) / 1024 ** 2 > self.max_memory_mb
+
+    def run(self, jobs, capture_mode="batch", dedupe_threshold=DEFAULT_THRESHOLD, new_only=False, budget=None):
+        """
+        Collect every job, overlapping their page loads
+
+        `budget` is each job's time budget in seconds, from when its tab opens;
+        a job that runs out keeps its ads and ends with status "partial".
+
+        Yields:
+            (job, CaptureEvent) pairs; each job ends with a "done" event whose
+            summary is the job's trace summary
+        """
+        driver = self.driver
+        home = driver.current_window_handle
+        pending = deque(jobs)
+        tabs = []
+        try:
+            while pending or tabs:
+                # Open tabs up to the caps; with nothing open, always open one so work continues
+                while pending and len(tabs) < self.max_tabs and not (tabs and self.over_memory()):
+                    tab = TabRun(pending.popleft(), capture_mode, dedupe_threshold, new_only, budget)
+                    try:
+                        tab.open(driver)
+                    except Exception as e:
+                        print(f"Could not open a tab for {tab.job!r}: {e}")
+                        yield tab.job, CaptureEvent("error", path=save_error_report(f"Could not open tab: {e}"))
+                        yield tab.job, self._done(tab, "error")
+                        continue
+                    tabs.append(tab)
+                    self.peak_tabs = max(self.peak_tabs, len(tabs))
+
+                if not tabs:
+                    continue
+                tab = min(tabs, key=lambda t: t.due)
+                wait = tab.due - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+
+                try:
+                    driver.switch_to.window(tab.handle)
+                    for event in tab.step(driver):
+                        yield tab.job, event
+                except Exception as e:
+                    print(f"Tab for {tab.job!r} failed: {e}")
+                    yield tab.job, tab.fail(driver, e)
+
+                if tab.finished:
+                    tabs.remove(tab)
+                    self._close_tab(tab, home)
+                    yield tab.job, self._done(tab, tab.status)
+        finally:
+            for tab in tabs:
+                tab.close("stopped")
+                self._close_tab(tab, home)
+
+    def _close_tab(self, tab, home):
+        try:
+            self.driver.switch_to.window(tab.handle)
+            self.driver.close()
+            self.driver.switch_to.window(home)
+        except Exception as e:
+            print(f"Could not close tab: {e}")
+
+    @staticmethod
+    def _done(tab, status):
+        summary = tab.close(status)
+        return CaptureEvent("done", message=f"Captured {len(tab.images)} ads", captured=len(tab.images),
+                            target=tab.job.screenshot_count, summary=summary)
@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deadline import Deadline
+
+
+def test_without_a_budget_phases_keep_their_usual_timeouts():
+    deadline = Deadline(0)
+    assert deadline.for_phase("navigate", 45) == 45
+    assert not deadline.expired()
+
+
+def test_each_phase_gets_its_share_of_the_time_left():
+    deadline = Deadline(100, shares={"boot": 0.25, "capture": 0.75})
+    assert 24 < deadline.for_phase("boot", 60) <= 25
+    # The last phase gets everything left, up to its cap
+    assert 99 < deadline.for_phase("capture", 1000) <= 100
+    assert deadline.for_phase("capture", 10) == 10
+
+
+def test_expiry_keeps_a_reserve_and_is_remembered():
+    deadline = Deadline(1)
+    assert not deadline.expired(reserve=0.5)
+    assert deadline.expired(reserve=1)
+    assert deadline.ran_out
+    assert deadline.expired(reserve=0)
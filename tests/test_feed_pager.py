@@ -0,0 +1,76 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dom_snapshot import SNAPSHOT_JS
+from feed_pager import COUNT_JS, RELEASE_JS, SCROLL_JS, FeedPager
+
+
+class Node:
+    def __init__(self, n, visible=True):
+        self.n = n
+        self.visible = visible
+        self.seen = False
+
+
+class FeedDriver:
+    """Answers FeedPager's scripts for a feed that appends `page` ads per scroll, up to `total`"""
+
+    def __init__(self, total, page, hidden=()):
+        self.total = total
+        self.page = page
+        self.hidden = set(hidden)
+        self.nodes = []
+        self.grow()
+
+    def grow(self):
+        end = min(self.total, len(self.nodes) + self.page)
+        self.nodes += [Node(n, n not in self.hidden) for n in range(len(self.nodes), end)]
+
+    def execute_script(self, js, *args):
+        if js is SNAPSHOT_JS:
+            unseen = [node for node in self.nodes if not node.seen]
+            items = [{"text": f"ad {node.n}", "className": "ad", "rect": [0, node.n * 300, 400, 250],
+                      "adId": f"meta:{node.n}", "visible": node.visible} for node in unseen]
+            return {"elements": unseen, "items": items}
+        if js is RELEASE_JS:
+            for node in args[0]:
+                node.seen = True
+            return None
+        if js is SCROLL_JS:
+            self.grow()
+            return len(self.nodes)
+        if js is COUNT_JS:
+            return [len(self.nodes), sum(1 for node in self.nodes if node.visible and not node.seen)]
+        raise AssertionError("unexpected script")
+
+
+def walk(pager, driver):
+    ads = []
+    while True:
+        page = pager.next_page()
+        if page:
+            ads += [snapshot.ad_id for snapshot in page]
+            pager.release(page)
+            continue
+        pager.begin_scroll()
+        if not pager.finish_scroll():
+            return ads
+
+
+def test_pages_hand_out_each_visible_ad_once_until_the_feed_ends():
+    driver = FeedDriver(total=25, page=10, hidden={3, 17})
+    pager = FeedPager(driver, "div.ad", max_idle_scrolls=2)
+    ads = walk(pager, driver)
+    assert ads == [f"meta:{n}" for n in range(25) if n not in (3, 17)]
+    assert pager.end_of_feed
+    assert pager.seen == 23
+
+
+def test_released_remainder_stays_untagged_for_the_next_page():
+    driver = FeedDriver(total=10, page=10)
+    pager = FeedPager(driver, "div.ad")
+    first = pager.next_page()
+    pager.release(first[:4])
+    assert [snapshot.ad_id for snapshot in pager.next_page()] == [f"meta:{n}" for n in range(4, 10)]
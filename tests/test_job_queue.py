@@ -0,0 +1,102 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_queue import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=60)
+
+
+def expire_leases(queue):
+    queue._db().execute("UPDATE jobs SET lease_expires = ? WHERE status = 'running'", (time.time() - 1,))
+
+
+def test_claims_follow_priority_then_submission_order(queue):
+    low = queue.submit("Meta Ads", "a", "US")
+    high = queue.submit("Meta Ads", "b", "US", priority=5)
+    later_low = queue.submit("Meta Ads", "c", "US")
+    assert [queue.claim("w").id for _ in range(3)] == [high, low, later_low]
+    assert queue.claim("w") is None
+
+
+def test_a_leased_job_is_not_claimed_again_until_its_lease_expires(queue):
+    job_id = queue.submit("Meta Ads", "shoes", "US")
+    assert queue.claim("w1").id == job_id
+    assert queue.claim("w2") is None
+
+    expire_leases(queue)
+    job = queue.claim("w2")
+    assert job.id == job_id
+    assert job.lease_owner == "w2"
+    assert job.attempts == 2
+    # The first worker lost the job: its heartbeats and results are refused
+    assert not queue.heartbeat(job_id, "w1")
+    assert not queue.complete(job_id, "w1", "ok", ["a.png"])
+    assert queue.complete(job_id, "w2", "ok", ["b.png"])
+    assert queue.get(job_id).image_paths == ["b.png"]
+
+
+def test_expired_jobs_without_attempts_left_fail(queue):
+    job_id = queue.submit("Meta Ads", "shoes", "US", max_attempts=1)
+    queue.claim("w1")
+    expire_leases(queue)
+    assert queue.claim("w2") is None
+    job = queue.get(job_id)
+    assert job.status == "failed"
+    assert job.error == "Worker lease expired too many times"
+
+
+def test_heartbeat_extends_the_lease_and_records_progress(queue):
+    job_id = queue.submit("Meta Ads", "shoes", "US")
+    before = queue.claim("w1").lease_expires
+    time.sleep(0.01)
+    assert queue.heartbeat(job_id, "w1", captured=3)
+    job = queue.get(job_id)
+    assert job.lease_expires > before
+    assert job.captured == 3
+
+
+def test_cancelled_jobs_stop_their_worker(queue):
+    job_id = queue.submit("Meta Ads", "shoes", "US")
+    queue.claim("w1")
+    assert queue.cancel(job_id)
+    assert not queue.heartbeat(job_id, "w1")
+    assert not queue.complete(job_id, "w1", "ok", ["a.png"])
+    assert queue.get(job_id).status == "cancelled"
+    assert not queue.cancel(job_id)
+
+
+def test_released_jobs_go_back_to_the_queue_keeping_their_attempts(queue):
+    job_id = queue.submit("Meta Ads", "shoes", "US")
+    queue.claim("w1")
+    queue.release(job_id, "w1")
+    job = queue.get(job_id)
+    assert (job.status, job.attempts, job.lease_owner) == ("queued", 0, None)
+    assert queue.claim("w2").id == job_id
+
+
+def test_concurrent_claims_never_hand_out_a_job_twice(queue):
+    job_ids = {queue.submit("Meta Ads", f"q{n}", "US") for n in range(40)}
+    claimed = []
+
+    def claim_all(worker_id):
+        while True:
+            job = queue.claim(worker_id)
+            if job is None:
+                return
+            claimed.append(job.id)
+
+    threads = [threading.Thread(target=claim_all, args=(f"w{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(job_ids)
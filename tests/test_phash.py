@@ -0,0 +1,73 @@
+import io
+import os
+import sys
+
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from phash import NearDuplicateFilter, dhash_batch, hash_from_hex, hash_to_hex
+
+
+HEADLINES = [
+    "Summer Sale: 50% off all shoes",
+    "Free shipping on orders over $25",
+    "Learn Python in 30 days",
+    "Book your dream vacation today",
+    "Home insurance from $9/month",
+    "New phones, zero down payment",
+]
+
+
+def text_ad(headline, body="Sponsored · example.com"):
+    """A text ad in one fixed layout: white card, headline, body line, button"""
+    image = Image.new("RGB", (400, 200), "white")
+    draw = ImageDraw.Draw(image)
+    draw.text((20, 30), headline, fill="black", font=ImageFont.load_default(size=22))
+    draw.text((20, 80), body, fill="gray", font=ImageFont.load_default(size=14))
+    draw.rectangle((20, 140, 140, 175), fill="#1a73e8")
+    draw.text((40, 148), "Learn more", fill="white", font=ImageFont.load_default(size=14))
+    return image
+
+
+def recompressed(image, quality=70):
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return Image.open(io.BytesIO(buffer.getvalue()))
+
+
+def test_same_layout_text_ads_all_survive():
+    dedupe = NearDuplicateFilter()
+    assert dedupe.filter([text_ad(headline) for headline in HEADLINES]) == [True] * len(HEADLINES)
+    assert dedupe.duplicates == 0
+
+
+def test_rescaled_and_recompressed_copies_are_duplicates():
+    dedupe = NearDuplicateFilter()
+    ad = text_ad(HEADLINES[0])
+    assert dedupe.is_new(ad)
+    assert not dedupe.is_new(recompressed(ad))
+    assert not dedupe.is_new(ad.resize((440, 220)))
+
+
+def test_known_different_ad_ids_are_never_merged():
+    dedupe = NearDuplicateFilter()
+    ad = text_ad(HEADLINES[0])
+    assert dedupe.filter([ad, recompressed(ad)], ["101", "202"]) == [True, True]
+    # The same ad ID, or an unknown one, still counts as a duplicate
+    assert not dedupe.is_new(recompressed(ad), "101")
+    assert not dedupe.is_new(recompressed(ad))
+
+
+def test_seeded_hashes_keep_their_ad_ids():
+    ad = text_ad(HEADLINES[0])
+    dedupe = NearDuplicateFilter()
+    dedupe.seed(dhash_batch([ad]), ["101"])
+    assert dedupe.is_new(recompressed(ad), "202")
+    assert not dedupe.is_new(recompressed(ad))
+
+
+def test_hex_round_trip():
+    value = dhash_batch([text_ad(HEADLINES[0])])[0]
+    assert (hash_from_hex(hash_to_hex(value)) == value).all()
+    assert hash_from_hex("00ff00ff00ff00ff") is None
@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_cache import ResultCache, normalize_key
+from storage import ContentStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ContentStore(str(tmp_path / "store"))
+
+
+def make_cache(tmp_path, store, **kwargs):
+    return ResultCache(str(tmp_path / "results.sqlite3"), store=store, **kwargs)
+
+
+def captures(store, n, prefix="ad"):
+    return [store.put_bytes(f"{prefix} {i}".encode(), ".png") for i in range(n)]
+
+
+def test_equivalent_searches_share_a_key():
+    assert normalize_key("Google Ads", "https://www.Nike.com/", "us") == normalize_key("Google Ads", " nike.com", "US")
+    assert normalize_key("Meta Ads", "shoes", "UK") == normalize_key("Meta Ads", "Shoes", "GB")
+    assert normalize_key("Meta Ads", "shoes", "US", "assets") != normalize_key("Meta Ads", "shoes", "US")
+
+
+def test_hits_need_at_least_the_requested_count(tmp_path, store):
+    cache = make_cache(tmp_path, store)
+    paths = captures(store, 3)
+    cache.put("Meta Ads", "shoes", "US", 3, paths)
+    assert cache.get("Meta Ads", "shoes", "US", 2) == paths[:2]
+    assert cache.get("Meta Ads", "shoes", "US", 5) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_entries_expire_after_their_ttl(tmp_path, store):
+    cache = make_cache(tmp_path, store, ttl=60)
+    cache.put("Meta Ads", "shoes", "US", 1, captures(store, 1))
+    with cache._db() as db:
+        db.execute("UPDATE results SET created_at = ?", (time.time() - 120,))
+    assert cache.get("Meta Ads", "shoes", "US", 1) is None
+    assert cache.evict() == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted_and_release_their_blobs(tmp_path, store):
+    cache = make_cache(tmp_path, store, max_entries=2)
+    first, second, third = (captures(store, 1, query) for query in ("a", "b", "c"))
+    store.release_all(first + second + third)
+    cache.put("Meta Ads", "a", "US", 1, first)
+    cache.put("Meta Ads", "b", "US", 1, second)
+    # Reading "a" makes "b" the least recently used entry
+    time.sleep(0.01)
+    store.release_all(cache.get("Meta Ads", "a", "US", 1))
+    cache.put("Meta Ads", "c", "US", 1, third)
+
+    assert cache.get("Meta Ads", "b", "US", 1) is None
+    assert store.evict(max_bytes=1, max_age=0) == 1
+    assert not os.path.exists(second[0])
+    assert os.path.exists(first[0]) and os.path.exists(third[0])
+
+
+def test_replacing_an_entry_releases_the_old_paths(tmp_path, store):
+    cache = make_cache(tmp_path, store)
+    old, new = captures(store, 1, "old"), captures(store, 1, "new")
+    store.release_all(old + new)
+    cache.put("Meta Ads", "shoes", "US", 1, old)
+    cache.put("Meta Ads", "shoes", "US", 1, new)
+    assert store.evict(max_bytes=1, max_age=0) == 1
+    assert not os.path.exists(old[0])
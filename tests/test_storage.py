@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import ContentStore
+
+
+def refs(store, path):
+    row = store._db().execute("SELECT refs FROM blobs WHERE hash = ?", (store.hash_of(path),)).fetchone()
+    return row[0] if row else None
+
+
+def test_identical_content_is_stored_once_with_one_reference_per_put(tmp_path):
+    store = ContentStore(str(tmp_path))
+    first = store.put_bytes(b"creative", ".png")
+    second = store.put_bytes(b"creative", ".png")
+    assert first == second
+    assert refs(store, first) == 2
+    store.release_all([first, second])
+    assert refs(store, first) == 0
+
+
+def test_referenced_blobs_survive_size_eviction(tmp_path):
+    store = ContentStore(str(tmp_path))
+    kept = store.put_bytes(b"kept", ".png")
+    released = store.put_bytes(b"released", ".png")
+    store.release(released)
+    assert store.evict(max_bytes=1, max_age=0) == 1
+    assert os.path.exists(kept)
+    assert not os.path.exists(released)
+
+
+def test_age_eviction_skips_referenced_blobs(tmp_path):
+    store = ContentStore(str(tmp_path))
+    kept = store.put_bytes(b"kept", ".png")
+    released = store.put_bytes(b"released", ".png")
+    store.release(released)
+    with store._db() as db:
+        db.execute("UPDATE blobs SET last_access = ?", (time.time() - 3600,))
+    assert store.evict(max_bytes=0, max_age=60) == 1
+    assert os.path.exists(kept)
+    assert not os.path.exists(released)
+
+
+def test_put_after_eviction_writes_the_file_again(tmp_path):
+    store = ContentStore(str(tmp_path))
+    path = store.put_bytes(b"creative", ".png")
+    store.release(path)
+    store.evict(max_bytes=1, max_age=0)
+    assert store.put_bytes(b"creative", ".png") == path
+    assert os.path.exists(path)
+    assert refs(store, path) == 1
+
+
+def test_retain_fails_for_evicted_files(tmp_path):
+    store = ContentStore(str(tmp_path))
+    path = store.put_bytes(b"creative", ".png")
+    store.release(path)
+    store.evict(max_bytes=1, max_age=0)
+    assert not store.retain(path)
@@ -0,0 +1,107 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import result_cache
+import storage
+import streamlit_scraper
+from job_queue import JobQueue
+from result_cache import ResultCache
+from storage import ContentStore
+from streamlit_scraper import CaptureEvent
+from worker import Worker
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ContentStore(str(tmp_path / "store"))
+    monkeypatch.setattr(storage.get_store, "instance", store)
+    cache = ResultCache(str(tmp_path / "results.sqlite3"), store=store)
+    monkeypatch.setattr(result_cache.get_result_cache, "instance", cache)
+    return store
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+def fake_run(store, ads, on_ad=None):
+    """Stand-in for stream_ads that stores `ads` distinct captures"""
+    def stream_ads(url, platform, screenshot_count, **kwargs):
+        for n in range(ads):
+            yield CaptureEvent("ad", path=store.put_bytes(f"ad {n}".encode(), ".png"), captured=n + 1)
+            if on_ad:
+                on_ad(n)
+        yield CaptureEvent("done", summary={"status": "ok"})
+    return stream_ads
+
+
+def total_refs(store):
+    return store.stats()["references"]
+
+
+def test_worker_run_leaves_only_the_result_cache_pinning_blobs(store, queue, monkeypatch):
+    monkeypatch.setattr(streamlit_scraper, "stream_ads", fake_run(store, 3))
+    queue.submit("Meta Ads", "shoes", "US", 3)
+    Worker(queue, worker_id="w1").process(queue.claim("w1"))
+
+    # The result cache holds the only references; once its entry expires the blobs are evictable
+    assert total_refs(store) == 3
+    cache = result_cache.get_result_cache()
+    cache.ttl = 1e-9
+    assert cache.evict() == 1
+    assert total_refs(store) == 0
+    assert store.evict(max_bytes=1, max_age=0) == 3
+
+
+def test_uncached_worker_run_leaves_blobs_evictable(store, queue, monkeypatch):
+    monkeypatch.setattr(streamlit_scraper, "stream_ads", fake_run(store, 3))
+    queue.submit("Meta Ads", "shoes", "US", 3, options={"new_only": True})
+    Worker(queue, worker_id="w1").process(queue.claim("w1"))
+
+    assert queue.get(1).status == "ok"
+    assert total_refs(store) == 0
+    assert store.evict(max_bytes=1, max_age=0) == 3
+
+
+def test_cached_worker_run_returns_the_cache_hit_references(store, queue, monkeypatch):
+    monkeypatch.setattr(streamlit_scraper, "stream_ads", fake_run(store, 3))
+    for _ in range(2):
+        queue.submit("Meta Ads", "shoes", "US", 3)
+        Worker(queue, worker_id="w1").process(queue.claim("w1"))
+    assert queue.get(2).image_paths == queue.get(1).image_paths
+    assert total_refs(store) == 3
+
+
+def test_cancelled_worker_run_releases_its_captures(store, queue, monkeypatch):
+    job_id = queue.submit("Meta Ads", "shoes", "US", 5)
+    monkeypatch.setattr(streamlit_scraper, "stream_ads",
+                        fake_run(store, 5, on_ad=lambda n: n == 1 and queue.cancel(job_id)))
+    Worker(queue, worker_id="w1").process(queue.claim("w1"))
+
+    assert queue.get(job_id).status == "cancelled"
+    assert total_refs(store) == 0
+
+
+def test_lease_is_kept_while_a_run_yields_nothing(store, tmp_path, monkeypatch):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=0.3)
+    taken = []
+
+    def slow_run(url, platform, screenshot_count, **kwargs):
+        # A page load well past the lease, with no events in between
+        time.sleep(1.0)
+        taken.append(queue.claim("w2"))
+        yield CaptureEvent("ad", path=store.put_bytes(b"ad", ".png"), captured=1)
+        yield CaptureEvent("done", summary={"status": "ok"})
+
+    monkeypatch.setattr(streamlit_scraper, "stream_ads", slow_run)
+    job_id = queue.submit("Meta Ads", "shoes", "US", 1)
+    Worker(queue, worker_id="w1").process(queue.claim("w1"))
+
+    assert taken == [None]
+    assert queue.get(job_id).status == "ok"
@@ -0,0 +1,131 @@
+"""
+Gallery thumbnails and memoized image validation
+
+Full-size captures are several hundred KB each and Streamlit re-sends every
+`st.image` on every rerun. Thumbnails are rendered once per screenshot on a
+thread pool, keyed by the content hash, and kept on disk as small WebP
+(JPEG when Pillow lacks WebP support), so the gallery only ever ships a few
+KB per ad. Validation results are memoized the same way: store files never
+change under a given hash. Harvested creatives Pillow cannot open (SVG,
+and AVIF on builds without libavif) are checked by their file signature
+and shown as they are, like videos.
+"""
+import os
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, features
+from settings import cache_path
+from storage import ContentStore
+
+
+THUMB_WIDTH = int(os.environ.get("ADSPY_THUMB_WIDTH", "240"))  # 2x the 120px grid for sharp HiDPI
+THUMB_QUALITY = int(os.environ.get("ADSPY_THUMB_QUALITY", "70"))
+THUMB_FORMAT = os.environ.get("ADSPY_THUMB_FORMAT") or ("WEBP" if features.check("webp") else "JPEG")
+THUMB_WORKERS = 4
+VIDEO_EXTENSIONS = (".mp4", ".webm")
+# Image formats the browser renders but Pillow cannot decode here, mapped to a check of their first bytes
+PASSTHROUGH_SIGNATURES = {".svg": lambda head: b"<svg" in head.lower()}
+if not ("avif" in features.modules and features.check_module("avif")):
+    PASSTHROUGH_SIGNATURES[".avif"] = lambda head: head[4:12] in (b"ftypavif", b"ftypavis")
+
+_thumb_pool = ThreadPoolExecutor(max_workers=THUMB_WORKERS, thread_name_prefix="adspy-thumb")
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def thumbnail_path(path, width=THUMB_WIDTH):
+    """Where the thumbnail of `path` lives (whether or not it exists yet)"""
+    digest = ContentStore.hash_of(path)
+    ext = ".webp" if THUMB_FORMAT.upper() == "WEBP" else ".jpg"
+    return cache_path("thumbs", digest[:2], f"{digest}_{width}{ext}")
+
+
+def _render(path, target, width):
+    with Image.open(path) as image:
+        image.thumbnail((width, width * 4))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        tmp_path = f"{target}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, format=THUMB_FORMAT, quality=THUMB_QUALITY)
+    os.replace(tmp_path, target)
+    return target
+
+
+def _submit(path, width):
+    target = thumbnail_path(path, width)
+    if os.path.exists(target):
+        return None, target
+    with _in_flight_lock:
+        future = _in_flight.get(target)
+        if future is None:
+            future = _thumb_pool.submit(_render, path, target, width)
+            _in_flight[target] = future
+            future.add_done_callback(lambda _, key=target: _in_flight.pop(key, None))
+    return future, target
+
+
+def is_video(path):
+    return path.lower().endswith(VIDEO_EXTENSIONS)
+
+
+def _shown_as_is(path):
+    """Videos and images Pillow cannot decode: no thumbnail, the gallery shows the file itself"""
+    return is_video(path) or os.path.splitext(path)[1].lower() in PASSTHROUGH_SIGNATURES
+
+
+def make_thumbnails(paths, width=THUMB_WIDTH):
+    """
+    Thumbnails for `paths`, rendering the missing ones in parallel
+
+    Returns:
+        Dict of original path -> thumbnail path; videos and images that
+        cannot be thumbnailed map to the original path
+    """
+    pending = {path: (None, path) if _shown_as_is(path) else _submit(path, width) for path in paths}
+    thumbs = {}
+    for path, (future, target) in pending.items():
+        try:
+            thumbs[path] = future.result() if future else target
+        except Exception as e:
+            print(f"Could not create thumbnail for {os.path.basename(path)}: {e}")
+            thumbs[path] = path
+    return thumbs
+
+
+def prefetch_thumbnails(paths, width=THUMB_WIDTH):
+    """Start rendering thumbnails in the background without waiting for them"""
+    for path in paths:
+        if _shown_as_is(path):
+            continue
+        try:
+            _submit(path, width)
+        except OSError:
+            pass
+
+
+@functools.lru_cache(maxsize=4096)
+def _probe(path, mtime_ns, size):
+    if is_video(path):
+        return "video"
+    signature = PASSTHROUGH_SIGNATURES.get(os.path.splitext(path)[1].lower())
+    if signature:
+        try:
+            with open(path, "rb") as f:
+                return "image" if signature(f.read(1024)) else "invalid"
+        except OSError:
+            return "invalid"
+    try:
+        with Image.open(path):
+            return "image"
+    except Exception:
+        return "text" if path.endswith(".txt") else "invalid"
+
+
+def classify_file(path):
+    """"image", "video", "text" (error report), "invalid" or "missing", memoized per file version"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "missing"
+    return _probe(path, stat.st_mtime_ns, stat.st_size)
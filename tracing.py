@@ -0,0 +1,393 @@
+"""
+Per-run tracing and metrics
+
+Every collection run gets a RunTrace. The collectors wrap their phases
+(driver startup, navigation, waiting for ads, scrolling, DOM snapshots) in
+spans; screenshots, crops, encodes and bytes written are counted where
+they happen with count(), on whatever thread does the work, and each span
+and run reports the difference over its lifetime (approximate when several
+runs share a process). WebDriver round trips come from the driver's own
+counter.
+
+Finished spans and runs are appended as JSON lines to the trace log. Run
+totals are also added to a SQLite metrics file shared by every process, and
+rewritten as a Prometheus text file after each run (for node_exporter's
+textfile collector); `python tracing.py --serve 9464` serves the same text
+over HTTP.
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import argparse
+import threading
+from collections import Counter
+from settings import cache_path, ProcessWide, ThreadConnections
+from webdriver_metrics import round_trips
+
+
+# Empty string disables the JSON log
+TRACE_LOG = os.environ.get("ADSPY_TRACE_LOG")
+TRACE_LOG_MAX_BYTES = int(float(os.environ.get("ADSPY_TRACE_LOG_MAX_MB", "50")) * 1024 * 1024)
+METRICS_FILE = os.environ.get("ADSPY_METRICS_FILE")
+
+# Histogram buckets (seconds) for run and phase durations
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Counters bumped by count() that runs report; the *_seconds ones become derived phases
+RUN_COUNTERS = ("screenshots", "screenshot_seconds", "crops", "crop_seconds", "encodes", "encode_seconds",
+                "bytes_written", "fallbacks", "renderer_crashes", "browser_kills")
+DERIVED_PHASES = {
+    "screenshot": ("screenshot_seconds", "screenshots"),
+    "crop": ("crop_seconds", "crops"),
+    "encode": ("encode_seconds", "encodes"),
+}
+
+FAMILIES = {
+    "adspy_runs_total": ("counter", "Collection runs by outcome"),
+    "adspy_ads_total": ("counter", "Ads captured"),
+    "adspy_webdriver_round_trips_total": ("counter", "WebDriver commands sent"),
+    "adspy_screenshots_total": ("counter", "Browser screenshots taken"),
+    "adspy_crops_total": ("counter", "Ads cropped from batch captures"),
+    "adspy_fallbacks_total": ("counter", "Full-page fallback screenshots"),
+    "adspy_bytes_written_total": ("counter", "Bytes written to the content store"),
+    "adspy_renderer_crashes_total": ("counter", "Runs ended by a crashed browser tab"),
+    "adspy_browser_kills_total": ("counter", "Hung or oversized browsers killed by the watchdog"),
+    "adspy_run_seconds": ("histogram", "Wall-clock duration of collection runs"),
+    "adspy_phase_seconds": ("histogram", "Time spent per run in each phase"),
+}
+
+METRICS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    family TEXT NOT NULL,
+    value REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, labels)
+);
+"""
+
+_counters = Counter()
+_counters_lock = threading.Lock()
+_active = threading.local()
+_log_lock = threading.Lock()
+
+
+def count(name, n=1):
+    """Add `n` to a process-wide counter (thread-safe, cheap enough for hot paths)"""
+    with _counters_lock:
+        _counters[name] += n
+
+
+def counters():
+    with _counters_lock:
+        return dict(_counters)
+
+
+def _delta(before, after):
+    return {name: after[name] - before.get(name, 0) for name in after if after[name] != before.get(name, 0)}
+
+
+def trace_log_path():
+    return cache_path("metrics", "trace.jsonl") if TRACE_LOG is None else TRACE_LOG
+
+
+def write_event(event):
+    """Append one JSON event to the trace log, rotating it past its size cap"""
+    path = trace_log_path()
+    if not path:
+        return
+    line = json.dumps(event, default=str) + "\n"
+    try:
+        with _log_lock:
+            if os.path.exists(path) and os.path.getsize(path) > TRACE_LOG_MAX_BYTES:
+                os.replace(path, path + ".1")
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line)
+    except OSError as e:
+        print(f"Could not write trace event: {e}")
+
+
+class Span:
+    """A timed phase of a run; use as a context manager or call end()"""
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+        self.seconds = None
+        self._start = time.perf_counter()
+        self._counters = counters()
+        self._round_trips = round_trips(trace.driver) if trace.driver is not None else 0
+
+    def end(self, status="ok"):
+        if self.seconds is not None:
+            return
+        self.seconds = time.perf_counter() - self._start
+        event = {"event": "span", "run_id": self.trace.run_id, "platform": self.trace.platform,
+                 "span": self.name, "status": status, "seconds": round(self.seconds, 4)}
+        if self.trace.driver is not None:
+            event["round_trips"] = round_trips(self.trace.driver) - self._round_trips
+        event.update(_delta(self._counters, counters()))
+        self.trace.add_phase(self.name, self.seconds)
+        write_event(event)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.end()
+        else:
+            self.end("closed" if exc_type is GeneratorExit else "error")
+        return False
+
+
+class RunTrace:
+    """Timings and counts for one collection run"""
+
+    def __init__(self, platform, query="", region=""):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.platform = platform
+        self.query = query
+        self.region = region
+        self.driver = None
+        self.phases = {}
+        self.summary = None
+        self._started = time.time()
+        self._start = time.perf_counter()
+        self._counters = counters()
+        self._round_trips = 0
+        self._local = Counter()
+
+    def attach(self, driver):
+        """Count round trips made by `driver` from now on"""
+        self.driver = driver
+        self._round_trips = round_trips(driver)
+
+    def span(self, name):
+        return Span(self, name)
+
+    def add_phase(self, name, seconds):
+        phase = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0})
+        phase["seconds"] += seconds
+        phase["calls"] += 1
+
+    def count(self, name, n=1):
+        """Count something for this run only (e.g. events seen by stream_ads)"""
+        self._local[name] += n
+
+    def finish(self, status, ads=0):
+        """Close the run, log it and update the shared metrics; returns the summary dict"""
+        if self.summary is not None:
+            return self.summary
+        delta = _delta(self._counters, counters())
+        delta.update(self._local)
+        phases = {name: dict(phase, seconds=round(phase["seconds"], 4)) for name, phase in self.phases.items()}
+        for phase, (seconds, calls) in DERIVED_PHASES.items():
+            if delta.get(calls):
+                phases[phase] = {"seconds": round(delta.get(seconds, 0.0), 4), "calls": delta[calls]}
+        self.summary = {
+            "run_id": self.run_id,
+            "platform": self.platform,
+            "query": self.query,
+            "region": self.region,
+            "status": status,
+            "ads": ads,
+            "started_at": self._started,
+            "seconds": round(time.perf_counter() - self._start, 4),
+            "round_trips": round_trips(self.driver) - self._round_trips if self.driver is not None else 0,
+            "phases": phases,
+        }
+        self.summary.update({name: delta.get(name, 0) for name in RUN_COUNTERS if not name.endswith("_seconds")})
+        write_event(dict(self.summary, event="run"))
+        try:
+            get_metrics().record_run(self.summary)
+        except Exception as e:
+            print(f"Could not update run metrics: {e}")
+        return self.summary
+
+
+class _NullTrace:
+    """Stand-in when a collector runs outside stream_ads"""
+    driver = None
+
+    def attach(self, driver):
+        pass
+
+    def span(self, name):
+        return _NullSpan()
+
+    def count(self, name, n=1):
+        pass
+
+
+class _NullSpan:
+    def end(self, status="ok"):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def current_trace():
+    """The RunTrace of the collector generator currently running on this thread"""
+    return getattr(_active, "trace", None) or _NullTrace()
+
+
+def traced(trace, events):
+    """
+    Iterate a collector generator with `trace` active while it runs
+
+    The trace is only active inside each next() call, so interleaved
+    generators on one thread (several runs streamed side by side) each see
+    their own.
+    """
+    while True:
+        previous = getattr(_active, "trace", None)
+        _active.trace = trace
+        try:
+            event = next(events)
+        except StopIteration:
+            return
+        finally:
+            _active.trace = previous
+        yield event
+
+
+def _format_value(value):
+    """A sample value in full: counters as integers, everything else with no rounding"""
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value.is_integer() and abs(value) < 2 ** 53:
+        return str(int(value))
+    return repr(value)
+
+
+def _labels(**labels):
+    return ",".join(f'{key}="{str(value)}"' for key, value in sorted(labels.items()))
+
+
+def _with_label(labels, key, value):
+    return f'{labels},{key}="{value}"' if labels else f'{key}="{value}"'
+
+
+class MetricsStore:
+    """Cumulative Prometheus-style samples in a SQLite file shared by all processes"""
+
+    def __init__(self, path=None, text_path=None):
+        self.path = path or cache_path("metrics", "metrics.sqlite3")
+        self.text_path = text_path or METRICS_FILE or cache_path("metrics", "adspy.prom")
+        self._db = ThreadConnections(self.path)
+        with self._db() as db:
+            db.executescript(METRICS_SCHEMA)
+
+    def _add(self, db, family, labels, value, name=None):
+        db.execute(
+            "INSERT INTO samples (name, labels, family, value) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value",
+            (name or family, labels, family, value),
+        )
+
+    def _observe(self, db, family, labels, seconds):
+        for bound in BUCKETS + ("+Inf",):
+            if bound == "+Inf" or seconds <= bound:
+                self._add(db, family, _with_label(labels, "le", bound), 1, family + "_bucket")
+            else:
+                # Still create the bucket so every series has the full set
+                self._add(db, family, _with_label(labels, "le", bound), 0, family + "_bucket")
+        self._add(db, family, labels, seconds, family + "_sum")
+        self._add(db, family, labels, 1, family + "_count")
+
+    def record_run(self, summary):
+        """Add a finished run to the totals and rewrite the Prometheus text file"""
+        platform = _labels(platform=summary["platform"])
+        with self._db() as db:
+            self._add(db, "adspy_runs_total", _labels(platform=summary["platform"], status=summary["status"]), 1)
+            self._add(db, "adspy_ads_total", platform, summary["ads"])
+            self._add(db, "adspy_webdriver_round_trips_total", platform, summary["round_trips"])
+            self._add(db, "adspy_screenshots_total", platform, summary["screenshots"])
+            self._add(db, "adspy_crops_total", platform, summary["crops"])
+            self._add(db, "adspy_fallbacks_total", platform, summary["fallbacks"])
+            self._add(db, "adspy_bytes_written_total", platform, summary["bytes_written"])
+            self._add(db, "adspy_renderer_crashes_total", platform, summary["renderer_crashes"])
+            self._add(db, "adspy_browser_kills_total", platform, summary["browser_kills"])
+            self._observe(db, "adspy_run_seconds", platform, summary["seconds"])
+            for phase, stats in summary["phases"].items():
+                self._observe(db, "adspy_phase_seconds", _labels(platform=summary["platform"], phase=phase),
+                              stats["seconds"])
+        self.write_text()
+
+    def render(self):
+        """All samples in the Prometheus text exposition format"""
+        rows = self._db().execute("SELECT family, name, labels, value FROM samples ORDER BY family, rowid")
+        lines, family_seen = [], None
+        for family, name, labels, value in rows:
+            if family != family_seen:
+                kind, help_text = FAMILIES.get(family, ("untyped", ""))
+                lines += [f"# HELP {family} {help_text}", f"# TYPE {family} {kind}"]
+                family_seen = family
+            value = _format_value(value)
+            lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_text(self):
+        """Atomically replace the Prometheus text file"""
+        tmp_path = f"{self.text_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, self.text_path)
+
+
+get_metrics = ProcessWide(MetricsStore)
+
+
+def serve_metrics(port, host=""):
+    """Serve the metrics at /metrics over HTTP until interrupted"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = get_metrics().render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"Serving metrics on http://{host or 'localhost'}:{port}/metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print or serve adspy run metrics")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="Serve /metrics on this port")
+    args = parser.parse_args(argv)
+    if args.serve:
+        serve_metrics(args.serve)
+    else:
+        sys.stdout.write(get_metrics().render())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
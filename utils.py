@@ -1,11 +1,21 @@
 import streamlit as st
 import os
-import zipfile
-import tempfile
-from PIL import Image
-import io
+from thumbnails import classify_file, is_video, make_thumbnails, prefetch_thumbnails
+from zip_export import archive_path, request_archive, selection_key
 
-def display_images(image_paths):
+def show_media(path, width=120):
+    """Show a captured ad: videos (harvested assets) get a player, everything else an image"""
+    if is_video(path):
+        st.video(path)
+    else:
+        st.image(path, width=width)  # Smaller width for tighter grid
+
+
+# Ads rendered per gallery page; only the current page is touched on a rerun
+GALLERY_PAGE_SIZE = 20
+
+
+def display_images(image_paths, page_size=GALLERY_PAGE_SIZE):
     st.markdown("### 🖼️ Preview Collected Ads")
     
     # Check if image_paths is None or empty
@@ -13,36 +23,23 @@ def display_images(image_paths):
         st.warning("No images were collected. Please try again.")
         return []
     
-    # Ensure unique paths (in case the scraper captured duplicates)
-    unique_paths = []
-    seen_paths = set()
-    
-    # Filter valid image files from the results
+    # Filter valid image files from the results, skipping duplicates
+    # (validation is memoized, so reruns don't reopen every file)
     valid_images = []
-    for path in image_paths:
-        # Skip duplicates
-        if path in seen_paths:
-            continue
-        
-        seen_paths.add(path)
-        
-        # Check if this is a valid image file
-        try:
-            # Try to open the file as an image
-            with Image.open(path) as img:
-                # If it opens successfully, it's a valid image
-                valid_images.append(path)
-        except Exception as e:
-            # If it's not an image, check if it's a text file with error info
+    for path in dict.fromkeys(image_paths):
+        kind = classify_file(path)
+        if kind in ("image", "video"):
+            valid_images.append(path)
+        elif kind == "text":
+            # Not an image: a text file with error info
             try:
-                if path.endswith(".txt"):
-                    with open(path, 'r') as f:
-                        error_text = f.read()
-                    st.error(f"Scraping encountered an error: {error_text}")
-                else:
-                    st.warning(f"Found invalid file that's not an image or readable text: {os.path.basename(path)}")
+                with open(path, 'r') as f:
+                    error_text = f.read()
+                st.error(f"Scraping encountered an error: {error_text}")
             except:
                 st.warning(f"Found invalid file: {os.path.basename(path)}")
+        else:
+            st.warning(f"Found invalid file that's not an image or readable text: {os.path.basename(path)}")
     
     # If we found no valid images
     if not valid_images:
@@ -53,73 +50,102 @@ def display_images(image_paths):
     if len(valid_images) < len(image_paths):
         st.info(f"Filtered out {len(image_paths) - len(valid_images)} invalid or duplicate images.")
     
-    # Determine the number of columns in the grid
-    num_columns = 5  # Increased to 5 columns for an even more compact grid
+    # Selection survives paging: checkboxes only exist for the visible page
+    if "selected_images" not in st.session_state:
+        st.session_state.selected_images = {}
+    selection = st.session_state.selected_images
     
-    # Calculate how many rows we need
     num_images = len(valid_images)
+    num_pages = (num_images + page_size - 1) // page_size
+    if st.session_state.get("gallery_page", 1) > num_pages:
+        st.session_state["gallery_page"] = 1
+    if num_pages > 1:
+        page = st.number_input(f"Page (of {num_pages})", min_value=1, max_value=num_pages, key="gallery_page")
+    else:
+        page = 1
+    first = (page - 1) * page_size
+    page_images = valid_images[first:first + page_size]
+    if num_pages > 1:
+        st.caption(f"Showing ads {first + 1}-{first + len(page_images)} of {num_images}")
+    
+    # Small cached thumbnails for this page; warm the next page in the background
+    thumbs = make_thumbnails(page_images)
+    prefetch_thumbnails(valid_images[first + page_size:first + 2 * page_size])
+    
+    # Determine the number of columns in the grid
+    num_columns = 5  # Increased to 5 columns for an even more compact grid
     
     # Process images in groups of size num_columns
-    for i in range(0, num_images, num_columns):
+    for i in range(0, len(page_images), num_columns):
         # Create columns for this row with minimal spacing
         columns = st.columns(num_columns)
         
         # Add images to this row
-        for col_idx in range(num_columns):
-            img_idx = i + col_idx
-            
-            # Check if we still have images to display
-            if img_idx < num_images:
-                img_path = valid_images[img_idx]
-                with columns[col_idx]:
-                    # Make UI more compact by using smaller components
-                    # Generate a unique key for each checkbox based on index and path
-                    checkbox_key = f"checkbox_{img_idx}_{os.path.basename(img_path)}"
-                    
-                    # Add checkbox with better label for accessibility
-                    selected = st.checkbox("Keep", value=True, key=checkbox_key, 
-                                         help="Select to keep this ad", 
-                                         label_visibility="collapsed")
-                    
-                    # Display the image with compact sizing
-                    try:
-                        st.image(img_path, width=120)  # Smaller width for tighter grid
-                    except Exception as e:
-                        st.error(f"Error displaying image: {os.path.basename(img_path)}")
-                    
-                    # Store the selection state
-                    if "selected_images" not in st.session_state:
-                        st.session_state.selected_images = {}
-                    st.session_state.selected_images[img_path] = selected
+        for col_idx, img_path in enumerate(page_images[i:i + num_columns]):
+            img_idx = first + i + col_idx
+            with columns[col_idx]:
+                # Make UI more compact by using smaller components
+                # Generate a unique key for each checkbox based on index and path
+                checkbox_key = f"checkbox_{img_idx}_{os.path.basename(img_path)}"
+                
+                # Add checkbox with better label for accessibility
+                selected = st.checkbox("Keep", value=selection.get(img_path, True), key=checkbox_key, 
+                                     help="Select to keep this ad", 
+                                     label_visibility="collapsed")
+                
+                # Display the thumbnail with compact sizing
+                try:
+                    show_media(thumbs[img_path])
+                except Exception as e:
+                    st.error(f"Error displaying image: {os.path.basename(img_path)}")
+                
+                # Store the selection state
+                selection[img_path] = selected
     
-    # Collect the selected images
-    if "selected_images" in st.session_state:
-        selected_images = [path for path, keep in st.session_state.selected_images.items() if keep]
-        return selected_images
-    return []
+    # Collect the selected images, including those on other pages
+    return [path for path in valid_images if selection.get(path, True)]
 
 
-def zip_images(image_paths):
-    # Make sure we have valid image paths
-    valid_paths = []
-    for path in image_paths:
-        try:
-            # Check if the file exists and is an image
-            if os.path.exists(path):
-                # Try to open as image to verify
-                Image.open(path).verify()
-                valid_paths.append(path)
-        except:
-            # Skip invalid files
-            continue
-    
+def _supports_deferred_downloads():
+    # Newer Streamlit can call a function for download_button data on click
+    try:
+        from streamlit.proto.DownloadButton_pb2 import DownloadButton
+        return "deferred_file_id" in DownloadButton.DESCRIPTOR.fields_by_name
+    except Exception:
+        return False
+
+
+DEFERRED_DOWNLOADS = _supports_deferred_downloads()
+
+
+def _valid_export_paths(image_paths):
+    # Validation is memoized, so unchanged selections cost nothing per rerun
+    return [path for path in image_paths if classify_file(path) in ("image", "video")]
+
+
+def zip_download_button(image_paths, label="📦 Download Selected Ads as ZIP", file_name="ads_selected.zip"):
+    """
+    Download button for a ZIP of `image_paths` that only builds the archive
+    when the user asks for it; identical selections reuse the same archive
+    """
+    valid_paths = _valid_export_paths(image_paths)
     if not valid_paths:
         st.error("No valid images to zip")
-        return None
+        return
+    
+    if DEFERRED_DOWNLOADS:
+        # Built in the background when clicked and handed over as an open file
+        st.download_button(label, lambda: open(request_archive(valid_paths).result(), "rb"),
+                           file_name=file_name, mime="application/zip", on_click="ignore")
+        return
     
-    temp_zip = os.path.join(tempfile.gettempdir(), "ads_selected.zip")
-    with zipfile.ZipFile(temp_zip, 'w') as zipf:
-        for path in valid_paths:
-            arcname = os.path.basename(path)
-            zipf.write(path, arcname=arcname)
-    return temp_zip
\ No newline at end of file
+    # Older Streamlit needs the bytes up front: build on request, then offer the file
+    key = selection_key(valid_paths)
+    if st.session_state.get("zip_requested") == key or os.path.exists(archive_path(key)):
+        with st.spinner("Building ZIP..."):
+            zip_path = request_archive(valid_paths).result()
+        with open(zip_path, "rb") as f:
+            st.download_button(label, f, file_name=file_name, mime="application/zip")
+    elif st.button("📦 Prepare ZIP of Selected Ads"):
+        st.session_state["zip_requested"] = key
+        st.rerun()
@@ -0,0 +1,91 @@
+import os
+import time
+import threading
+
+
+def install_round_trip_counter(driver):
+    """
+    Count every WebDriver command sent by `driver`
+
+    Element methods (`.text`, `.location`, `.screenshot`...) all go through
+    the parent driver's `execute`, so wrapping it on the instance counts
+    each HTTP round trip to ChromeDriver, including CDP commands. The start
+    time of each command still waiting for an answer is kept as well, so a
+    hung call can be spotted from another thread (see command_age).
+    """
+    if getattr(driver, "_adspy_round_trips", None) is not None:
+        return
+    lock = threading.Lock()
+    driver._adspy_round_trips = 0
+    driver._adspy_in_flight = {}
+    execute = driver.execute
+
+    def counted_execute(driver_command, params=None):
+        with lock:
+            driver._adspy_round_trips += 1
+        thread = threading.get_ident()
+        driver._adspy_in_flight[thread] = time.monotonic()
+        try:
+            return execute(driver_command, params)
+        finally:
+            driver._adspy_in_flight.pop(thread, None)
+
+    driver.execute = counted_execute
+
+
+def round_trips(driver):
+    """Total WebDriver round trips made by `driver` so far (0 if not counted)"""
+    return getattr(driver, "_adspy_round_trips", 0) or 0
+
+
+def command_age(driver):
+    """Seconds the oldest unanswered WebDriver command of `driver` has been waiting (0 if none)"""
+    started = list(getattr(driver, "_adspy_in_flight", {}).values())
+    return time.monotonic() - min(started) if started else 0.0
+
+
+def rss_bytes(pid):
+    """Resident memory of one process in bytes (0 if unknown; needs Linux /proc)"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def descendant_pids(root_pid):
+    """Every process below `root_pid` in the process tree (empty without /proc)"""
+    children = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    found, stack = [], list(children.get(root_pid, []))
+    while stack:
+        pid = stack.pop()
+        found.append(pid)
+        stack.extend(children.get(pid, []))
+    return found
+
+
+def driver_pid(driver):
+    """Process id of the driver's chromedriver, or None when it was not launched by this process"""
+    process = getattr(getattr(driver, "service", None), "process", None)
+    return getattr(process, "pid", None)
+
+
+def browser_rss(driver):
+    """Resident memory of the driver's chromedriver and every Chrome process under it, in bytes"""
+    pid = driver_pid(driver)
+    if not pid:
+        return 0
+    return rss_bytes(pid) + sum(rss_bytes(child) for child in descendant_pids(pid))
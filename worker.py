@@ -0,0 +1,233 @@
+"""
+Background collection workers
+
+Run next to the Streamlit app (or on any machine sharing the cache dir):
+
+    python worker.py --workers 2
+
+Each worker process claims jobs from the SQLite job queue, runs the
+collectors with its own warm browser and writes the results back. The
+first SIGINT/SIGTERM lets running jobs finish before exiting; a second one
+stops them straight away and hands them back to the queue.
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import threading
+import multiprocessing
+from job_queue import get_job_queue
+from storage import get_store
+
+
+POLL_INTERVAL = float(os.environ.get("ADSPY_WORKER_POLL_SECONDS", "2"))
+# Longest gap between lease heartbeats while a job runs, whether or not it yields events
+HEARTBEAT_INTERVAL = float(os.environ.get("ADSPY_WORKER_HEARTBEAT_SECONDS", "10"))
+
+
+class _LeaseKeeper:
+    """
+    Heartbeats a running job's lease from a background thread
+
+    A page load or a long capture can go well past the lease without the
+    run yielding an event, so the lease is renewed on a timer as well as
+    per event. Once a heartbeat finds the job cancelled or taken over,
+    `lost` is set and the worker stops at its next event.
+    """
+
+    def __init__(self, queue, job_id, worker_id, interval=HEARTBEAT_INTERVAL):
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        # Several beats per lease, so one slow write never lets it lapse
+        self.interval = max(0.05, min(interval, queue.lease_seconds / 3))
+        self.captured = 0
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="adspy-lease", daemon=True)
+
+    def beat(self):
+        """Extend the lease now; returns False once the worker no longer owns the job"""
+        if not self.lost and not self.queue.heartbeat(self.job_id, self.worker_id, captured=self.captured):
+            self.lost = True
+        return not self.lost
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if not self.beat():
+                    return
+            except Exception as e:
+                print(f"Lease heartbeat for job {self.job_id} failed: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+class Worker:
+    """Claims and runs queued jobs until asked to stop"""
+
+    def __init__(self, queue=None, worker_id=None, poll_interval=POLL_INTERVAL):
+        self.queue = queue or get_job_queue()
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.stopping = False
+
+    def request_stop(self, signum=None, frame=None):
+        if self.stopping:
+            # Second signal: abandon the current job
+            raise KeyboardInterrupt()
+        print(f"Worker {self.worker_id} finishing its current job before exiting")
+        self.stopping = True
+
+    def run(self, max_jobs=None):
+        done = 0
+        while not self.stopping and (max_jobs is None or done < max_jobs):
+            job = self.queue.claim(self.worker_id)
+            if job is None:
+                time.sleep(self.poll_interval)
+                continue
+            self.process(job)
+            done += 1
+        return done
+
+    def process(self, job):
+        """
+        Run one claimed job and record its outcome
+
+        The store references the run takes are given back at the end: the
+        finished paths are pinned by the result cache, and by the session
+        that loads the job, not by the worker.
+        """
+        from streamlit_scraper import build_search_url, stream_ads
+        from result_cache import get_result_cache
+
+        print(f"Worker {self.worker_id} running job {job.id}: {job.platform} {job.query!r} in {job.region}")
+        options = job.options
+        capture_mode = options.get("capture_mode", "batch")
+        new_only = options.get("new_only", False)
+        cache_variant = "assets" if capture_mode == "assets" else ""
+        cache = get_result_cache()
+        store = get_store()
+
+        if not options.get("force_refresh") and not new_only:
+            cached = cache.get(job.platform, job.query, job.region, job.screenshot_count, cache_variant)
+            if cached:
+                self.queue.complete(job.id, self.worker_id, "ok", cached)
+                store.release_all(cached)
+                return
+
+        url = build_search_url(job.platform, job.query, job.region)
+        kwargs = {"capture_mode": capture_mode, "new_only": new_only}
+        if "dedupe_threshold" in options:
+            kwargs["dedupe_threshold"] = options["dedupe_threshold"]
+        if "budget" in options:
+            kwargs["budget"] = options["budget"]
+        events = stream_ads(url, platform=job.platform, screenshot_count=job.screenshot_count, **kwargs)
+
+        owned = []
+        try:
+            outcome = self._collect(job, events, owned)
+            if outcome is None:
+                return
+            images, error, captured, partial = outcome
+            if images:
+                status = "ok"
+            else:
+                status = "failed" if error else "empty"
+            self.queue.complete(job.id, self.worker_id, status, images, error)
+            if images and not error and captured == len(images) and not new_only and not partial:
+                cache.put(job.platform, job.query, job.region, job.screenshot_count, images, cache_variant)
+            print(f"Job {job.id} finished: {status}, {len(images)} ads")
+        finally:
+            store.release_all(owned)
+
+    def _collect(self, job, events, owned):
+        """
+        Consume a run's events, adding every stored path to `owned`
+
+        Returns:
+            (images, error, captured, partial), or None if the job was
+            cancelled or its lease lost while it ran
+        """
+        images, error, captured, partial = [], None, 0, False
+        try:
+            with _LeaseKeeper(self.queue, job.id, self.worker_id) as lease:
+                for event in events:
+                    if event.path:
+                        owned.append(event.path)
+                    if event.kind == "error" and event.path:
+                        with open(event.path) as f:
+                            error = f.read()
+                    elif event.path:
+                        images.append(event.path)
+                    if event.kind == "ad":
+                        captured += 1
+                    elif event.kind == "done":
+                        partial = (event.summary or {}).get("status") == "partial"
+                    # Every event doubles as a heartbeat, so progress and cancels show up right away
+                    lease.captured = captured
+                    if not lease.beat():
+                        print(f"Job {job.id} was cancelled or its lease was lost, stopping")
+                        return None
+        except KeyboardInterrupt:
+            print(f"Job {job.id} interrupted, returning it to the queue")
+            self.queue.release(job.id, self.worker_id)
+            raise
+        except Exception as e:
+            error = str(e)
+        finally:
+            events.close()
+        return images, error, captured, partial
+
+def _worker_main(max_jobs=None):
+    # One browser per worker process, like batch workers
+    os.environ["ADSPY_DRIVER_POOL_SIZE"] = "1"
+    worker = Worker()
+    signal.signal(signal.SIGTERM, worker.request_stop)
+    signal.signal(signal.SIGINT, worker.request_stop)
+    try:
+        worker.run(max_jobs)
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run background ad collection workers")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--max-jobs", type=int, default=None, help="Exit after this many jobs per worker")
+    args = parser.parse_args(argv)
+
+    if args.workers <= 1:
+        _worker_main(args.max_jobs)
+        return 0
+
+    # Spawn, not fork: each worker starts its own browser pool from scratch
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_worker_main, args=(args.max_jobs,)) for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+
+    def forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    # Ctrl+C already reaches the whole process group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for process in processes:
+        process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
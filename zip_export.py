@@ -0,0 +1,93 @@
+"""
+ZIP export of selected ads
+
+Archives are memoized on the content hashes of the selection (in order), so
+reruns with an unchanged selection reuse the same file and nothing is
+rebuilt. Images are stored without recompression since PNG/WebP/JPEG barely
+shrink, and files are copied into the archive in chunks, so memory stays
+flat however large the selection. Builds run on a background thread and
+identical concurrent requests share one build.
+"""
+import os
+import time
+import hashlib
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from settings import cache_path
+from storage import ContentStore
+
+
+EXPORT_MAX_AGE = float(os.environ.get("ADSPY_EXPORT_MAX_AGE_HOURS", "24")) * 3600
+
+# Already compressed formats go in as-is; everything else (error reports) is deflated
+STORED_EXTENSIONS = {".png", ".webp", ".jpg", ".jpeg", ".gif", ".avif", ".mp4", ".webm", ".zip"}
+
+_export_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="adspy-export")
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def selection_key(paths):
+    """Stable key for an ordered selection, from content hashes rather than file names"""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(ContentStore.hash_of(path).encode())
+        digest.update(os.path.splitext(path)[1].encode())
+    return digest.hexdigest()
+
+
+def archive_path(key):
+    return cache_path("exports", key[:2], f"{key}.zip")
+
+
+def build_archive(paths):
+    """Write the archive for `paths` (or reuse an identical one) and return its path"""
+    target = archive_path(selection_key(paths))
+    if os.path.exists(target):
+        os.utime(target)
+        return target
+
+    tmp_path = f"{target}.{threading.get_ident()}.tmp"
+    try:
+        with zipfile.ZipFile(tmp_path, "w", allowZip64=True) as zipf:
+            for i, path in enumerate(paths):
+                ext = os.path.splitext(path)[1].lower()
+                compression = zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                zipf.write(path, arcname=f"ad_{i + 1:03d}{ext}", compress_type=compression)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _prune_exports()
+    return target
+
+
+def request_archive(paths):
+    """Start building the archive for `paths` in the background; returns a Future of its path"""
+    paths = list(paths)
+    key = selection_key(paths)
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        if future is None:
+            future = _export_pool.submit(build_archive, paths)
+            _in_flight[key] = future
+            future.add_done_callback(lambda _, k=key: _in_flight.pop(k, None))
+    return future
+
+
+def _prune_exports():
+    """Delete archives that have not been downloaded for EXPORT_MAX_AGE"""
+    if not EXPORT_MAX_AGE:
+        return
+    root = os.path.dirname(os.path.dirname(archive_path("00")))
+    cutoff = time.time() - EXPORT_MAX_AGE
+    for folder, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(folder, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass